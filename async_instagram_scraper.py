@@ -0,0 +1,402 @@
+import aiohttp
+import asyncio
+import copy
+import json
+import random
+import logging
+import os
+import time
+
+from instagram_scraper import BaseInstagramScraper, ScrapeCancelled
+
+# Setup logging
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Connection pool settings shared by all async scrapers in the process
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", "100"))
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "20"))
+
+class AsyncInstagramScraper(BaseInstagramScraper):
+    """
+    Asynchronous version of InstagramScraper built on aiohttp
+    
+    Requests and parsing are shared with InstagramScraper (see BaseInstagramScraper),
+    only get_posts is provided. All instances share one aiohttp session (one
+    connection pool per event loop), so a single process can scrape many
+    accounts concurrently, e.g.:
+        
+        scraper = AsyncInstagramScraper()
+        results = await asyncio.gather(*(scraper.get_posts(name) for name in usernames))
+    """
+    
+    # Shared session and the event loop it belongs to
+    _session = None
+    _session_loop = None
+    
+    @classmethod
+    async def get_session(cls):
+        """Get shared aiohttp session for the running event loop"""
+        loop = asyncio.get_running_loop()
+        
+        # aiohttp sessions are bound to the loop they were created in
+        if cls._session is None or cls._session.closed or cls._session_loop is not loop:
+            await cls._close_previous_session()
+            
+            connector = aiohttp.TCPConnector(
+                limit=HTTP_POOL_LIMIT,
+                limit_per_host=HTTP_POOL_MAXSIZE,
+                ttl_dns_cache=300
+            )
+            cls._session = aiohttp.ClientSession(connector=connector)
+            cls._session_loop = loop
+        
+        return cls._session
+    
+    @classmethod
+    async def close_session(cls):
+        """Close shared aiohttp session"""
+        if cls._session is not None and not cls._session.closed:
+            await cls._session.close()
+        cls._session = None
+        cls._session_loop = None
+    
+    @classmethod
+    async def _close_previous_session(cls):
+        """Close shared session of another event loop before it is replaced"""
+        session, loop = cls._session, cls._session_loop
+        cls._session = None
+        cls._session_loop = None
+        
+        if session is None or session.closed:
+            return
+        
+        if loop.is_running():
+            # Loop of another thread, close the session there
+            asyncio.run_coroutine_threadsafe(session.close(), loop)
+        else:
+            # Loop has finished (e.g. asyncio.run), release its connector here
+            await session.close()
+    
+    async def get_posts(self, username, num_posts=10, since=None):
+        """
+        Get recent posts from Instagram account
+        
+        Concurrent calls on one instance are safe: each call runs on its own
+        copy of the scraper (sharing session, caches, stats and rate limiter),
+        so the high-water mark state of one account doesn't leak into another.
+        
+        Args:
+            username (str): Instagram username (without @)
+            num_posts (int): Number of posts to retrieve (ignored in incremental mode)
+            since (dict): High-water mark of the newest stored post
+                (see InstagramScraper.get_posts)
+        
+        Returns:
+            list: List of posts with metadata
+        """
+        return await copy.copy(self)._get_posts(username, num_posts, since)
+    
+    async def _get_posts(self, username, num_posts, since):
+        """Get recent posts (see get_posts), keeps scraping state on this instance"""
+        all_posts = []
+        
+        # Incremental mode state
+        self.since = since
+        self.reached_watermark = False
+        self.reached_end = False
+        num_posts = self._post_limit(num_posts)
+        
+        try:
+            logger.info(f"Scraping data for @{username}")
+            
+            # Try methods silently, best first (failing ones are skipped for a while).
+            # Stats and caches are read and saved in a thread, as Redis calls are blocking
+            for method in await asyncio.to_thread(self.method_stats.order, self.METHODS):
+                self.current_method = method
+                started = time.time()
+                all_posts = await getattr(self, f"_get_posts_via_{method}")(username, num_posts)
+                
+                success = bool(all_posts) or self.reached_watermark
+                
+                # Method didn't fail, it was stopped
+                if not success:
+                    self._check_cancelled()
+                
+                await asyncio.to_thread(self.method_stats.record, method, success, time.time() - started)
+                
+                if success:
+                    break
+            
+            # If all methods failed, raise exception
+            if not all_posts and not self.reached_watermark:
+                raise Exception("Failed to get data")
+            
+            logger.info(f"Retrieved {len(all_posts)} posts")
+            return all_posts[:num_posts]
+        
+        except ScrapeCancelled:
+            logger.info(f"Scraping cancelled for @{username}")
+            raise
+        
+        except Exception:
+            # Only log the exception without details
+            logger.error(f"Scraping failed for @{username}")
+            raise Exception("Scraping failed")
+    
+    async def _fetch(self, url, headers=None, timeout=10):
+        """
+        Make GET request through the shared session
+        
+        Returns:
+            tuple: (status code, response text)
+        """
+        # Wait for the request budget without blocking the event loop
+        self._check_cancelled()
+        await self.rate_limiter.acquire_async(url, self.identity)
+        self._check_cancelled()
+        
+        session = await self.get_session()
+        
+        async with session.get(
+            url,
+            # New User-Agent for each request, self.headers is shared by concurrent calls
+            headers=headers or {**self.headers, 'User-Agent': random.choice(self.user_agents)},
+            cookies=self.cookies,
+            timeout=aiohttp.ClientTimeout(total=timeout)
+        ) as response:
+            return response.status, await response.text()
+    
+    async def _get_posts_via_graphql(self, username, num_posts):
+        """Get posts via GraphQL API"""
+        # Request to Instagram to get user ID
+        user_id = await self._get_user_id(username)
+        
+        if not user_id:
+            return []
+        
+        return await self._get_timeline_posts(self.TIMELINE_QUERY_HASH, user_id, username, num_posts)
+    
+    async def _get_timeline_posts(self, query_hash, user_id, username, num_posts, end_cursor=None):
+        """
+        Get posts of user timeline via GraphQL API with pagination
+        
+        The next page is requested as soon as its cursor is known, while the
+        current page is parsed (not in incremental mode, where the first page
+        is usually the last one).
+        
+        Returns:
+            list: Posts (pages fetched before an error are kept)
+        """
+        posts = []
+        prefetch = None
+        
+        try:
+            variables = {
+                "id": user_id,
+                "first": min(num_posts, self._first_page_size() if end_cursor is None else 50),
+                "after": end_cursor
+            }
+            
+            response = await self._fetch_timeline_page(query_hash, variables)
+            
+            while True:
+                status, text = response
+                
+                if status != 200:
+                    break
+                
+                data = json.loads(text)
+                
+                # Extract post data
+                user_data = data.get('data', {}).get('user', {})
+                if not user_data:
+                    # Cached user ID may be outdated
+                    if not posts and end_cursor is None:
+                        await asyncio.to_thread(self.user_id_cache.delete, username)
+                    break
+                
+                edge_owner_to_timeline_media = user_data.get('edge_owner_to_timeline_media', {})
+                edges = edge_owner_to_timeline_media.get('edges', [])
+                
+                # Check if there are more pages
+                page_info = edge_owner_to_timeline_media.get('page_info', {})
+                has_next_page = page_info.get('has_next_page', False)
+                
+                # Request next page while this one is processed
+                next_variables = {
+                    "id": user_id,
+                    "first": min(num_posts - len(posts) - len(edges), 50),
+                    "after": page_info.get('end_cursor')
+                }
+                if has_next_page and not self.since and len(posts) + len(edges) < num_posts:
+                    prefetch = asyncio.ensure_future(self._fetch_timeline_page(query_hash, next_variables))
+                
+                posts.extend(self._extract_posts_from_edges(
+                    edges, username, num_posts - len(posts), last_page=not has_next_page
+                ))
+                
+                # Request additional pages if not enough posts and no stored post reached
+                if not has_next_page or len(posts) >= num_posts or self.reached_watermark:
+                    break
+                
+                if prefetch:
+                    response = await prefetch
+                    prefetch = None
+                else:
+                    next_variables["first"] = min(num_posts - len(posts), 50)
+                    response = await self._fetch_timeline_page(query_hash, next_variables)
+        
+        except Exception:
+            # Silently stop, posts already parsed are kept
+            pass
+        
+        finally:
+            # Drop prefetched page that is not needed anymore
+            if prefetch and not prefetch.done():
+                prefetch.cancel()
+        
+        return posts
+    
+    async def _fetch_timeline_page(self, query_hash, variables):
+        """Request one page of user timeline via GraphQL API"""
+        return await self._fetch(
+            self._build_graphql_url(query_hash, variables),
+            timeout=10 if variables["after"] is None else 15
+        )
+    
+    async def _get_posts_via_html(self, username, num_posts):
+        """Get posts by parsing profile HTML page"""
+        posts = []
+        
+        try:
+            status, text = await self._fetch(f"https://www.instagram.com/{username}/")
+            
+            if status != 200:
+                return []
+            
+            # Get shared_data from HTML
+            shared_data = self._extract_shared_data(text)
+            
+            if not shared_data:
+                return []
+            
+            user_data = self._find_user_in_shared_data(shared_data)
+            
+            if not user_data:
+                return []
+            
+            # Remember user ID for next GraphQL requests
+            await asyncio.to_thread(self.user_id_cache.set, username, user_data.get('id'))
+            
+            # Extract posts (first page only)
+            edge_owner_to_timeline_media = user_data.get('edge_owner_to_timeline_media') or {}
+            posts = self._extract_posts_from_edges(
+                edge_owner_to_timeline_media.get('edges', []), username, num_posts,
+                last_page=not edge_owner_to_timeline_media.get('page_info', {}).get('has_next_page', False)
+            )
+        
+        except Exception:
+            # Silently fail and return empty list
+            return []
+        
+        return posts
+    
+    async def _get_posts_via_alternative_api(self, username, num_posts):
+        """Get posts via alternative API"""
+        posts = []
+        
+        try:
+            # Add special headers for this API
+            headers = self.headers.copy()
+            headers['X-IG-App-ID'] = self.IG_APP_ID
+            headers['X-Requested-With'] = 'XMLHttpRequest'
+            
+            status, text = await self._fetch(
+                f"https://www.instagram.com/api/v1/users/web_profile_info/?username={username}",
+                headers=headers
+            )
+            
+            if status != 200:
+                return []
+            
+            data = json.loads(text)
+            
+            # Extract user and post information
+            user_data = data.get('data', {}).get('user', {})
+            if not user_data:
+                return []
+            
+            # Remember user ID for next GraphQL requests
+            await asyncio.to_thread(self.user_id_cache.set, username, user_data.get('id'))
+            
+            edge_owner_to_timeline_media = user_data.get('edge_owner_to_timeline_media', {})
+            page_info = edge_owner_to_timeline_media.get('page_info', {})
+            posts = self._extract_posts_from_edges(
+                edge_owner_to_timeline_media.get('edges', []), username, num_posts,
+                last_page=not page_info.get('has_next_page', False)
+            )
+            
+            # If we need more posts, use pagination
+            if len(posts) < num_posts and page_info.get('has_next_page') and page_info.get('end_cursor') \
+                    and not self.reached_watermark:
+                posts.extend(await self._get_timeline_posts(
+                    self.MORE_POSTS_QUERY_HASH, user_data.get('id'), username,
+                    num_posts - len(posts), end_cursor=page_info['end_cursor']
+                ))
+        
+        except Exception:
+            # Silently fail and return empty list
+            return []
+        
+        return posts
+    
+    async def _get_user_id(self, username):
+        """Get Instagram user ID (cached, as user IDs don't change)"""
+        user_id = await asyncio.to_thread(self.user_id_cache.get, username)
+        if user_id:
+            return user_id
+        
+        try:
+            status, text = await self._fetch(f"https://www.instagram.com/{username}/?__a=1&__d=dis")
+            
+            if status == 200:
+                user_id = self._find_user_id_in_profile_json(json.loads(text))
+                if user_id:
+                    await asyncio.to_thread(self.user_id_cache.set, username, user_id)
+                    return user_id
+        
+        except Exception:
+            pass
+        
+        # Try alternative method - via HTML page
+        return await self._get_user_id_from_html(username)
+    
+    async def _get_user_id_from_html(self, username):
+        """Get user ID from HTML page"""
+        try:
+            status, text = await self._fetch(f"https://www.instagram.com/{username}/")
+            
+            if status != 200:
+                return None
+            
+            user_id = self._find_user_id_in_html(text)
+            await asyncio.to_thread(self.user_id_cache.set, username, user_id)
+            return user_id
+        
+        except Exception:
+            return None
+
+if __name__ == "__main__":
+    async def main():
+        scraper = AsyncInstagramScraper()
+        try:
+            posts = await scraper.get_posts("nasa", 5)
+            print(json.dumps(posts, indent=2, ensure_ascii=False))
+        except Exception:
+            print("Scraping failed")
+            print("Instagram may have blocked requests or API changed")
+        finally:
+            await AsyncInstagramScraper.close_session()
+    
+    asyncio.run(main())
@@ -0,0 +1,65 @@
+"""
+Hashtag index backfill script
+Fills post_hashtags table from hashtags of posts stored before it existed
+Run this script once on an existing database (safe to run again)
+"""
+
+from sqlalchemy.orm import sessionmaker
+import argparse
+import json
+import logging
+
+from models import engine, init_db, Post
+from crud import save_hashtags
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def backfill_hashtags(batch_size=1000):
+    """Add hashtags of all stored posts to the hashtag index in batches"""
+    
+    logger.info("Starting hashtag backfill")
+    
+    # Create post_hashtags table if it's missing
+    init_db()
+    
+    db = sessionmaker(bind=engine)()
+    last_id = 0
+    processed = 0
+    
+    try:
+        while True:
+            posts = (
+                db.query(Post.id, Post.hashtags)
+                .filter(Post.id > last_id)
+                .order_by(Post.id)
+                .limit(batch_size)
+                .all()
+            )
+            
+            if not posts:
+                break
+            
+            last_id = posts[-1].id
+            
+            save_hashtags(db, [
+                {"id": post.id, "hashtags": json.loads(post.hashtags or "[]")}
+                for post in posts
+            ])
+            db.commit()
+            
+            processed += len(posts)
+            logger.info(f"Processed {processed} posts")
+    
+    finally:
+        db.close()
+    
+    logger.info("Hashtag backfill complete")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fill hashtag index from stored posts")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Posts processed per transaction")
+    args = parser.parse_args()
+    
+    backfill_hashtags(args.batch_size)
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark of profile HTML extraction
+
+Compares the single-pass extractor with the previous regex + BeautifulSoup
+path on recorded profile pages (HTML files given as arguments) or, if none
+are given, on generated pages of the known formats.
+
+Usage:
+    python benchmark_extractor.py [page.html ...] [--runs N]
+"""
+
+import argparse
+import json
+import re
+import timeit
+
+from bs4 import BeautifulSoup
+
+from html_extractor import extract_profile_data, find_user_in_shared_data
+
+def legacy_extract_shared_data(html):
+    """Previous _extract_shared_data implementation"""
+    try:
+        match = re.search(r'window\._sharedData\s*=\s*(.+?);</script>', html)
+        if match:
+            return json.loads(match.group(1))
+        
+        match = re.search(r'window\.__additionalDataLoaded\s*\(\s*[\'"]profile[\'"],\s*(.+?)\s*\);</script>', html)
+        if match:
+            return json.loads(match.group(1))
+        
+        match = re.search(r'<script type="application/json" data-sjs>(.+?)</script>', html)
+        if match:
+            data = json.loads(match.group(1))
+            if 'require' in data:
+                for item in data['require']:
+                    if isinstance(item, list) and len(item) > 2 and isinstance(item[2], dict):
+                        if 'user' in item[2]:
+                            return item[2]
+        
+        return None
+    
+    except Exception:
+        return None
+
+def legacy_find_user_id_in_html(html):
+    """Previous _find_user_id_in_html implementation"""
+    shared_data = legacy_extract_shared_data(html)
+    
+    if shared_data:
+        user_data = find_user_in_shared_data(shared_data)
+        if user_data and user_data.get('id'):
+            return user_data.get('id')
+    
+    match = re.search(r'"user_id":"(\d+)"', html)
+    if match:
+        return match.group(1)
+    
+    match = re.search(r'"profilePage_(\d+)"', html)
+    if match:
+        return match.group(1)
+    
+    soup = BeautifulSoup(html, 'html.parser')
+    for meta in soup.find_all('meta'):
+        if 'property' in meta.attrs and meta.attrs['property'] == 'al:ios:url':
+            content = meta.attrs.get('content', '')
+            match = re.search(r'user\?id=(\d+)', content)
+            if match:
+                return match.group(1)
+    
+    return None
+
+def legacy_path(html):
+    """Work done by the scraper for one page before the extractor"""
+    return legacy_extract_shared_data(html), legacy_find_user_id_in_html(html)
+
+def new_path(html):
+    """Work done by the scraper for one page with the extractor"""
+    data = extract_profile_data(html)
+    return data["shared_data"], data["user_id"]
+
+def generate_pages(size=1_000_000):
+    """Generate profile pages of about size bytes in the known formats"""
+    # Page noise: scripts and markup before the profile data
+    filler = "".join(
+        f'<div class="x{i}"><script>var a{i} = {{"k": "{"v" * 80}"}};</script></div>\n'
+        for i in range(size // 120)
+    )
+    user = {
+        "id": "1234567890",
+        "edge_owner_to_timeline_media": {
+            "edges": [{"node": {"shortcode": f"C{i:04d}", "taken_at_timestamp": 1623456789 + i}} for i in range(12)],
+            "page_info": {"has_next_page": True, "end_cursor": "cursor"}
+        }
+    }
+    meta = '<meta property="al:ios:url" content="instagram://user?id=1234567890" />'
+    
+    shared = json.dumps({"entry_data": {"ProfilePage": [{"graphql": {"user": user}}]}}, indent=1)
+    sjs = json.dumps({"require": [["ProfilePage", "init", {"user": user}]]})
+    other_sjs = json.dumps({"require": [["ScheduledServerJS", "handle", None, [{"__bbox": {}}]]]})
+    
+    return {
+        "sharedData": f'<html><head>{meta}</head><body>{filler}<script>window._sharedData = {shared};</script></body></html>',
+        "data-sjs": f'<html><head>{meta}</head><body>{filler}<script type="application/json" data-sjs>{sjs}</script></body></html>',
+        "data-sjs, several scripts": f'<html><head>{meta}</head><body><script type="application/json" data-sjs>{other_sjs}</script>{filler}<script type="application/json" data-sjs>{sjs}</script></body></html>',
+        "meta only": f'<html><head>{meta}</head><body>{filler}</body></html>'
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark profile HTML extraction")
+    parser.add_argument("pages", nargs="*", help="Recorded profile page HTML files")
+    parser.add_argument("--runs", type=int, default=20, help="Runs per page")
+    args = parser.parse_args()
+    
+    if args.pages:
+        pages = {}
+        for path in args.pages:
+            with open(path, encoding="utf-8") as f:
+                pages[path] = f.read()
+    else:
+        pages = generate_pages()
+    
+    print(f"{'page':<30} {'size':>10} {'legacy ms':>10} {'new ms':>10} {'speedup':>8}  same result")
+    for name, html in pages.items():
+        legacy = timeit.timeit(lambda: legacy_path(html), number=args.runs) / args.runs * 1000
+        new = timeit.timeit(lambda: new_path(html), number=args.runs) / args.runs * 1000
+        same = legacy_path(html)[1] == new_path(html)[1]
+        print(f"{name:<30} {len(html):>10} {legacy:>10.2f} {new:>10.2f} {legacy / new:>7.1f}x  {same}")
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,27 @@
 from celery import Celery
-from celery.schedules import crontab
+from kombu import Exchange, Queue
 import os
 
 # Celery broker and backend settings
 broker_url = os.getenv('CELERY_BROKER_URL', 'redis://localhost:6379/0')
 result_backend = os.getenv('CELERY_RESULT_BACKEND', 'redis://localhost:6379/0')
 
+# Queues: user-triggered scrapes don't wait behind the backlog of periodic ones
+interactive_queue = 'interactive'
+periodic_queue = 'periodic'
+
+# Message priorities (Redis: 0 is the highest)
+interactive_priority = 0  # POST /scrape/{username}
+batch_priority = 5  # POST /scrape/batch (interactive queue, behind single scrapes)
+periodic_priority = 5
+
+# Seconds a started task may run before Redis hands its message to another worker
+# (tasks are acknowledged after they finish, see task_acks_late)
+visibility_timeout = int(os.getenv('CELERY_VISIBILITY_TIMEOUT', '7200'))
+
+# Seconds between scheduler runs (each run dispatches tracked accounts that are due)
+schedule_tick = float(os.getenv('SCHEDULE_TICK', '60'))
+
 # Create Celery app
 celery_app = Celery(
     'instagram_scraper',
@@ -23,6 +39,26 @@ celery_app.conf.update(
     timezone='UTC',
     enable_utc=True,
     
+    # Routing settings
+    task_queues=tuple(
+        Queue(name, Exchange(name), routing_key=name)
+        for name in (interactive_queue, periodic_queue)
+    ),
+    task_default_queue=interactive_queue,
+    task_routes={
+        'tasks.scrape_instagram': {'queue': interactive_queue, 'priority': interactive_priority},
+        'tasks.scrape_batch_lane': {'queue': interactive_queue, 'priority': batch_priority},
+        'tasks.scrape_instagram_periodic': {'queue': periodic_queue, 'priority': periodic_priority},
+        # Scheduler run is short, don't let it wait behind periodic scrapes
+        'tasks.schedule_due_scrapes': {'queue': periodic_queue, 'priority': 0}
+    },
+    task_default_priority=interactive_priority,
+    
+    # Worker settings: a process reserves only the task it runs, so messages
+    # aren't held by a busy process while others are free (scrapes are long)
+    worker_prefetch_multiplier=1,
+    task_acks_late=True,  # Scrapes are upserts, running one again is safe
+    
     # Result settings
     result_expires=3600,  # 1 hour
     task_track_started=True,
@@ -30,13 +66,18 @@ celery_app.conf.update(
     # Broker settings
     broker_connection_retry_on_startup=True,
     broker_connection_max_retries=10,
+    broker_transport_options={
+        'priority_steps': list(range(10)),
+        'sep': ':',
+        'queue_order_strategy': 'priority',
+        'visibility_timeout': visibility_timeout
+    },
     
-    # Beat scheduler settings
+    # Beat scheduler settings (accounts and their intervals are in the tracked_accounts table)
     beat_schedule={
-        'scrape-instagram-every-10-minutes': {
-            'task': 'tasks.scrape_instagram_periodic',
-            'schedule': crontab(minute='*/10'),  # Every 10 minutes
-            'args': ['nasa', 10]  # username, num_posts
+        'schedule-due-scrapes': {
+            'task': 'tasks.schedule_due_scrapes',
+            'schedule': schedule_tick
         }
     }
 )
@@ -1,4 +1,31 @@
-from celery_app import celery_app
+from celery_app import celery_app, interactive_queue, periodic_queue
+import argparse
+import os
+
+# Queues consumed by the worker (run separate workers per queue to keep
+# interactive scrapes fast under a periodic backlog)
+CELERY_WORKER_QUEUES = os.getenv('CELERY_WORKER_QUEUES', f'{interactive_queue},{periodic_queue}')
+
+# Worker processes (default: number of CPUs)
+CELERY_WORKER_CONCURRENCY = os.getenv('CELERY_WORKER_CONCURRENCY')
+
+def worker_argv(queues, concurrency=None, loglevel='info'):
+    """Get Celery worker command line for queues"""
+    argv = ['worker', f'--loglevel={loglevel}', '-Q', queues]
+    
+    # Node name per queue set, so several workers can run on one host
+    argv += ['-n', f"{queues.replace(',', '-')}@%h"]
+    
+    if concurrency:
+        argv.append(f'--concurrency={concurrency}')
+    
+    return argv
 
 if __name__ == '__main__':
-    celery_app.worker_main(['worker', '--loglevel=info']) 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Start Celery worker")
+    parser.add_argument('--queues', '-Q', default=CELERY_WORKER_QUEUES, help="Comma-separated queues to consume")
+    parser.add_argument('--concurrency', '-c', type=int, default=CELERY_WORKER_CONCURRENCY, help="Number of worker processes")
+    parser.add_argument('--loglevel', '-l', default='info', help="Logging level")
+    args = parser.parse_args()
+    
+    celery_app.worker_main(worker_argv(args.queues, args.concurrency, args.loglevel))
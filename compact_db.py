@@ -0,0 +1,123 @@
+"""
+Database compaction script
+Removes duplicate posts stored before posts were keyed by shortcode
+Run this script once on an existing database (safe to run again)
+"""
+
+from sqlalchemy import inspect, text
+import argparse
+import logging
+import re
+
+from models import engine
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Shortcode in post URL (https://www.instagram.com/p/<shortcode>/)
+SHORTCODE_PATTERN = re.compile(r'/p/([^/?#]+)')
+
+def add_shortcode_column():
+    """Add shortcode column to posts table created before it existed"""
+    columns = [column["name"] for column in inspect(engine).get_columns("posts")]
+    if "shortcode" in columns:
+        return
+    
+    logger.info("Adding shortcode column")
+    with engine.begin() as connection:
+        connection.execute(text("ALTER TABLE posts ADD COLUMN shortcode VARCHAR"))
+
+def backfill_shortcodes(batch_size):
+    """Fill shortcode of posts from their URL"""
+    last_id = 0
+    filled = 0
+    
+    while True:
+        with engine.begin() as connection:
+            rows = connection.execute(
+                text("SELECT id, url FROM posts WHERE shortcode IS NULL AND id > :last_id ORDER BY id LIMIT :limit"),
+                {"last_id": last_id, "limit": batch_size}
+            ).all()
+            
+            if not rows:
+                break
+            
+            last_id = rows[-1].id
+            
+            # Posts without post URL (placeholders) stay without shortcode
+            updates = []
+            for row in rows:
+                match = SHORTCODE_PATTERN.search(row.url or "")
+                if match:
+                    updates.append({"id": row.id, "shortcode": match.group(1)})
+            
+            if updates:
+                connection.execute(text("UPDATE posts SET shortcode = :shortcode WHERE id = :id"), updates)
+                filled += len(updates)
+    
+    logger.info(f"Filled shortcode of {filled} posts")
+
+def remove_duplicates(batch_size):
+    """Keep only the newest row (latest likes and comments) of each shortcode"""
+    removed = 0
+    
+    while True:
+        with engine.begin() as connection:
+            duplicates = connection.execute(
+                text(
+                    "SELECT shortcode, MAX(id) AS keep_id FROM posts "
+                    "WHERE shortcode IS NOT NULL "
+                    "GROUP BY shortcode HAVING COUNT(*) > 1 "
+                    "LIMIT :limit"
+                ),
+                {"limit": batch_size}
+            ).all()
+            
+            if not duplicates:
+                break
+            
+            result = connection.execute(
+                text("DELETE FROM posts WHERE shortcode = :shortcode AND id <> :keep_id"),
+                [{"shortcode": row.shortcode, "keep_id": row.keep_id} for row in duplicates]
+            )
+            removed += result.rowcount
+            logger.info(f"Removed {removed} duplicate posts so far")
+    
+    logger.info(f"Removed {removed} duplicate posts")
+    
+    # Hashtags of removed posts (foreign keys aren't enforced by SQLite)
+    if inspect(engine).has_table("post_hashtags"):
+        with engine.begin() as connection:
+            connection.execute(text("DELETE FROM post_hashtags WHERE post_id NOT IN (SELECT id FROM posts)"))
+
+def add_unique_index():
+    """Create unique index used by upsert of posts"""
+    with engine.begin() as connection:
+        connection.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ix_posts_shortcode ON posts (shortcode)"))
+
+def compact_database(batch_size=1000, vacuum=True):
+    """Deduplicate posts by shortcode and add the unique key"""
+    
+    logger.info("Starting database compaction")
+    
+    add_shortcode_column()
+    backfill_shortcodes(batch_size)
+    remove_duplicates(batch_size)
+    add_unique_index()
+    
+    # Give space of removed rows back to the file system
+    if vacuum and engine.dialect.name == "sqlite":
+        logger.info("Vacuuming database")
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            connection.execute(text("VACUUM"))
+    
+    logger.info("Database compaction complete")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Remove duplicate posts from the database")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Rows processed per transaction")
+    parser.add_argument("--no-vacuum", action="store_true", help="Don't VACUUM SQLite database afterwards")
+    args = parser.parse_args()
+    
+    compact_database(args.batch_size, vacuum=not args.no_vacuum)
@@ -0,0 +1,342 @@
+from sqlalchemy import func, inspect, or_, text, column, tuple_, Float
+from sqlalchemy.dialects import postgresql, sqlite
+from datetime import datetime, timedelta
+import base64
+import json
+
+from models import Post, PostHashtag
+
+# Ranked full-text queries (higher rank is better)
+SQLITE_SEARCH_QUERY = """
+    SELECT posts.*, -bm25(posts_fts, 2.0, 1.0) AS rank
+    FROM posts_fts JOIN posts ON posts.id = posts_fts.rowid
+    WHERE posts_fts MATCH :query
+    ORDER BY rank DESC, posts.id DESC
+    LIMIT :limit OFFSET :offset
+"""
+
+POSTGRES_SEARCH_QUERY = """
+    SELECT posts.*, ts_rank_cd(posts.search_vector, query) AS rank
+    FROM posts, websearch_to_tsquery('simple', :query) AS query
+    WHERE posts.search_vector @@ query
+    ORDER BY rank DESC, posts.id DESC
+    LIMIT :limit OFFSET :offset
+"""
+
+def save_posts(db, posts, username):
+    """
+    Save a page of scraped posts with one multi-row upsert
+    
+    Posts are keyed by shortcode: a post that is already stored is not
+    added again, only its likes and comments are refreshed. The caller
+    commits the transaction.
+    
+    Args:
+        db (Session): Database session
+        posts (list): Posts returned by the scraper
+        username (str): Instagram username the posts belong to
+    
+    Returns:
+        list: Saved posts for response (with database IDs and original hashtags)
+    """
+    # One row per shortcode (a statement can't update the same row twice);
+    # posts without shortcode can't be matched and are always added
+    unique_posts = {}
+    for index, post_data in enumerate(posts):
+        unique_posts[post_data.get("shortcode") or index] = post_data
+    posts = list(unique_posts.values())
+    
+    if not posts:
+        return []
+    
+    rows = [
+        {
+            "shortcode": post_data.get("shortcode") or None,
+            "url": post_data["url"],
+            "text": post_data["text"],
+            "title": post_data.get("title", ""),
+            "likes": to_count(post_data.get("likes")),
+            "comments": to_count(post_data.get("comments")),
+            "hashtags": json.dumps(post_data["hashtags"]),
+            "timestamp": datetime.fromisoformat(post_data["timestamp"]),
+            "username": username
+        }
+        for post_data in posts
+    ]
+    
+    # INSERT ... ON CONFLICT (shortcode) DO UPDATE, one statement per batch
+    # of rows, not one round trip per post
+    dialect_insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+    statement = dialect_insert(Post)
+    statement = statement.on_conflict_do_update(
+        index_elements=[Post.shortcode],
+        set_={"likes": statement.excluded.likes, "comments": statement.excluded.comments}
+    ).returning(Post.id, Post.shortcode)
+    
+    # Match returned IDs to rows by shortcode (updated rows keep their old IDs)
+    ids = {}
+    unkeyed_ids = []
+    for post_id, shortcode in db.execute(statement, rows):
+        if shortcode:
+            ids[shortcode] = post_id
+        else:
+            unkeyed_ids.append(post_id)
+    unkeyed_ids = iter(sorted(unkeyed_ids))
+    
+    # Create new objects for response with unchanged hashtags
+    saved_posts = []
+    for row, post_data in zip(rows, posts):
+        saved_posts.append({
+            "id": ids[row["shortcode"]] if row["shortcode"] else next(unkeyed_ids),
+            "url": row["url"],
+            "text": row["text"],
+            "title": row["title"],
+            "likes": row["likes"],
+            "comments": row["comments"],
+            "hashtags": post_data["hashtags"],  # Use original hashtags
+            "timestamp": post_data["timestamp"],
+            "username": username
+        })
+    
+    save_hashtags(db, saved_posts)
+    
+    return saved_posts
+
+def to_count(value):
+    """Convert scraped like or comment count to int (older results have strings)"""
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        return 0
+
+def normalize_hashtag(hashtag):
+    """Normalize hashtag for storage and search (lowercase, without #)"""
+    return hashtag.strip().lstrip('#').lower()
+
+def save_hashtags(db, posts):
+    """
+    Save hashtags of saved posts to the hashtag index with one statement
+    
+    Args:
+        db (Session): Database session
+        posts (list): Posts with database IDs and hashtag lists
+    """
+    rows = {
+        (normalize_hashtag(hashtag), post["id"])
+        for post in posts
+        for hashtag in post["hashtags"]
+        if normalize_hashtag(hashtag)
+    }
+    
+    if not rows:
+        return
+    
+    # Hashtags of posts saved before are already there
+    dialect_insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+    db.execute(
+        dialect_insert(PostHashtag).on_conflict_do_nothing(),
+        [{"hashtag": hashtag, "post_id": post_id} for hashtag, post_id in sorted(rows)]
+    )
+
+def search_posts(db, query, limit=20, offset=0):
+    """
+    Full-text search in post titles and captions
+    
+    Args:
+        db (Session): Database session
+        query (str): Search words (all must match)
+        limit (int): Maximum number of posts
+        offset (int): Number of best matches to skip
+    
+    Returns:
+        list: (Post, rank) tuples, best match first
+    """
+    words = query.split()
+    if not words:
+        return []
+    
+    bind = db.get_bind()
+    params = {"limit": limit, "offset": offset}
+    
+    if bind.dialect.name == "sqlite" and inspect(bind).has_table("posts_fts"):
+        # Quote words so FTS5 syntax characters in user input are matched as text
+        params["query"] = " ".join('"' + word.replace('"', '""') + '"' for word in words)
+        statement = SQLITE_SEARCH_QUERY
+    elif bind.dialect.name == "postgresql":
+        params["query"] = query
+        statement = POSTGRES_SEARCH_QUERY
+    else:
+        # No full-text index: unranked substring search
+        conditions = [or_(Post.title.contains(word), Post.text.contains(word)) for word in words]
+        posts = db.query(Post).filter(*conditions).order_by(Post.id.desc()).offset(offset).limit(limit).all()
+        return [(post, 0.0) for post in posts]
+    
+    return db.query(Post, column("rank", Float)).from_statement(text(statement)).params(**params).all()
+
+def get_user_posts(db, username, limit=50, before=None):
+    """
+    Get one page of posts of a user, newest first (keyset pagination)
+    
+    Args:
+        db (Session): Database session
+        username (str): Instagram username
+        limit (int): Maximum number of posts
+        before (str): Cursor returned with the previous page (None for the first page)
+    
+    Returns:
+        tuple: (list of posts, cursor of the next page or None if this is the last one)
+    
+    Raises:
+        ValueError: If the cursor is not valid
+    """
+    query = db.query(Post).filter(Post.username == username)
+    
+    # Continue right after the last post of the previous page
+    # (uses the (username, timestamp DESC, id DESC) index, whatever the page number)
+    if before:
+        timestamp, post_id = decode_cursor(before)
+        query = query.filter(tuple_(Post.timestamp, Post.id) < tuple_(timestamp, post_id))
+    
+    # One extra post tells if there is a next page
+    posts = query.order_by(Post.timestamp.desc(), Post.id.desc()).limit(limit + 1).all()
+    
+    if len(posts) <= limit:
+        return posts, None
+    
+    posts = posts[:limit]
+    return posts, encode_cursor(posts[-1].timestamp, posts[-1].id)
+
+def encode_cursor(timestamp, post_id):
+    """Create opaque pagination cursor pointing after post with timestamp and ID"""
+    value = f"{timestamp.isoformat()}|{post_id}"
+    return base64.urlsafe_b64encode(value.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor):
+    """Get (timestamp, id) from pagination cursor, ValueError if it's not valid"""
+    try:
+        value = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        timestamp, post_id = value.split("|")
+        return datetime.fromisoformat(timestamp), int(post_id)
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+def get_posts_by_ids(db, post_ids):
+    """
+    Get posts by database IDs
+    
+    Args:
+        db (Session): Database session
+        post_ids (list): Post IDs
+    
+    Returns:
+        list: Posts in the order of post_ids (deleted posts are left out)
+    """
+    if not post_ids:
+        return []
+    
+    posts = {post.id: post for post in db.query(Post).filter(Post.id.in_(post_ids))}
+    return [posts[post_id] for post_id in post_ids if post_id in posts]
+
+def get_hashtag_posts(db, hashtag, limit=50, offset=0):
+    """
+    Get one page of posts with a hashtag, newest first (uses the hashtag index)
+    
+    Args:
+        db (Session): Database session
+        hashtag (str): Hashtag (with or without #, any case)
+        limit (int): Maximum number of posts
+        offset (int): Number of posts to skip
+    
+    Returns:
+        list: Posts
+    """
+    return (
+        db.query(Post)
+        .join(PostHashtag, PostHashtag.post_id == Post.id)
+        .filter(PostHashtag.hashtag == normalize_hashtag(hashtag))
+        .order_by(Post.timestamp.desc(), Post.id.desc())
+        .offset(offset)
+        .limit(limit)
+        .all()
+    )
+
+def get_top_posts(db, limit=10, username=None, days=None):
+    """
+    Get most liked posts (uses the likes index)
+    
+    Args:
+        db (Session): Database session
+        limit (int): Maximum number of posts
+        username (str): Only posts of this user (None for all users)
+        days (int): Only posts of the last days (None for all posts)
+    
+    Returns:
+        list: Posts, most liked first
+    """
+    query = db.query(Post)
+    
+    if username:
+        query = query.filter(Post.username == username)
+    if days:
+        query = query.filter(Post.timestamp >= datetime.now() - timedelta(days=days))
+    
+    return query.order_by(Post.likes.desc(), Post.id.desc()).limit(limit).all()
+
+def get_daily_engagement(db, days=30, username=None):
+    """
+    Get number of posts, likes and comments per user per day
+    
+    Args:
+        db (Session): Database session
+        days (int): Number of last days
+        username (str): Only this user (None for all users)
+    
+    Returns:
+        list: Rows with username, day, posts, likes and comments, newest day first
+    """
+    day = func.date(Post.timestamp)
+    query = (
+        db.query(
+            Post.username,
+            day.label("day"),
+            func.count(Post.id).label("posts"),
+            func.sum(Post.likes).label("likes"),
+            func.sum(Post.comments).label("comments")
+        )
+        .filter(Post.timestamp >= datetime.now() - timedelta(days=days))
+    )
+    
+    # Filter by user first: (username, timestamp) index
+    if username:
+        query = query.filter(Post.username == username)
+    
+    return query.group_by(Post.username, day).order_by(day.desc(), Post.username).all()
+
+def get_hashtag_engagement(db, limit=20, min_posts=1):
+    """
+    Get average likes and comments of posts per hashtag
+    
+    Args:
+        db (Session): Database session
+        limit (int): Maximum number of hashtags
+        min_posts (int): Leave out hashtags used in fewer posts
+    
+    Returns:
+        list: Rows with hashtag, posts, avg_likes and avg_comments, highest average likes first
+    """
+    avg_likes = func.avg(Post.likes).label("avg_likes")
+    
+    return (
+        db.query(
+            PostHashtag.hashtag,
+            func.count(Post.id).label("posts"),
+            avg_likes,
+            func.avg(Post.comments).label("avg_comments")
+        )
+        .join(Post, Post.id == PostHashtag.post_id)
+        .group_by(PostHashtag.hashtag)
+        .having(func.count(Post.id) >= min_posts)
+        .order_by(avg_likes.desc(), PostHashtag.hashtag)
+        .limit(limit)
+        .all()
+    )
@@ -0,0 +1,125 @@
+import json
+import re
+
+# All markers of embedded profile data, found in one pass over the page.
+# Branches are grouped by first character so most positions are rejected at once.
+# JSON markers end right where the JSON starts, so it can be decoded in place.
+MARKER_PATTERN = re.compile(
+    r'window\.(?:'
+    r'_sharedData\s*=\s*(?P<shared>)'
+    r'|__additionalDataLoaded\s*\(\s*[\'"]profile[\'"]\s*,\s*(?P<additional>))'
+    r'|<(?:'
+    r'script type="application/json" data-sjs>\s*(?P<sjs>)'
+    r'|meta\b[^>]*?al:ios:url(?P<ios_url>))'
+    r'|"(?:'
+    r'user_id":"(?P<user_id>\d+)"'
+    r'|profilePage_(?P<profile_page>\d+)")'
+)
+
+# Order in which found data is used (first available wins)
+SHARED_DATA_MARKERS = ["shared", "additional", "sjs"]
+USER_ID_MARKERS = ["user_id", "profile_page", "ios_url"]
+
+IOS_URL_USER_ID_PATTERN = re.compile(r'user\?id=(\d+)')
+
+_decoder = json.JSONDecoder()
+
+def find_user_in_shared_data(shared_data):
+    """Find user data in shared_data structure"""
+    # Search in main format
+    if 'entry_data' in shared_data and 'ProfilePage' in shared_data['entry_data']:
+        if len(shared_data['entry_data']['ProfilePage']) > 0:
+            if 'graphql' in shared_data['entry_data']['ProfilePage'][0]:
+                if 'user' in shared_data['entry_data']['ProfilePage'][0]['graphql']:
+                    return shared_data['entry_data']['ProfilePage'][0]['graphql']['user']
+    
+    # Search in alternative format
+    if 'user' in shared_data:
+        return shared_data['user']
+    
+    return None
+
+def extract_profile_data(html):
+    """
+    Extract embedded profile data from Instagram HTML page
+    
+    The page is scanned once for all known markers and embedded JSON is
+    decoded where it starts, without searching for its end or building a DOM.
+    
+    Args:
+        html (str): Profile page HTML
+    
+    Returns:
+        dict: shared_data (dict or None) and user_id (str or None, taken from
+            shared_data if present there, otherwise from other markers)
+    """
+    found = {}
+    
+    for match in MARKER_PATTERN.finditer(html):
+        kind = match.lastgroup
+        if kind in found:
+            continue
+        
+        if kind in SHARED_DATA_MARKERS:
+            value = _decode_json_at(html, match.end(kind), kind)
+        elif kind == "ios_url":
+            value = _find_user_id_in_meta(html, match.start(), match.end())
+        else:
+            value = match.group(kind)
+        
+        if value is None:
+            continue
+        
+        found[kind] = value
+        
+        # Main format has everything needed, rest of the page doesn't matter
+        if kind == "shared" and _user_id_of(value):
+            break
+    
+    shared_data = next((found[kind] for kind in SHARED_DATA_MARKERS if kind in found), None)
+    
+    user_id = _user_id_of(shared_data) if shared_data else None
+    if not user_id:
+        user_id = next((found[kind] for kind in USER_ID_MARKERS if kind in found), None)
+    
+    return {"shared_data": shared_data, "user_id": user_id}
+
+def _decode_json_at(html, index, kind):
+    """Decode JSON starting at index, None if it's not valid or not profile data"""
+    try:
+        data, _ = _decoder.raw_decode(html, index)
+    except ValueError:
+        return None
+    
+    if not isinstance(data, dict):
+        return None
+    
+    if kind != "sjs":
+        return data
+    
+    # New Instagram format: user data is somewhere in require list
+    for item in data.get('require', []):
+        if isinstance(item, list) and len(item) > 2 and isinstance(item[2], dict):
+            if 'user' in item[2]:
+                return item[2]
+    
+    return None
+
+def _find_user_id_in_meta(html, start, end):
+    """Get user ID from <meta property="al:ios:url" content="instagram://user?id=..."> tag starting at start"""
+    tag_end = html.find('>', end)
+    if tag_end == -1:
+        return None
+    
+    match = IOS_URL_USER_ID_PATTERN.search(html, start, tag_end)
+    if not match:
+        return None
+    
+    return match.group(1)
+
+def _user_id_of(shared_data):
+    """Get user ID from shared_data, None if not there"""
+    user_data = find_user_in_shared_data(shared_data)
+    if user_data and user_data.get('id'):
+        return user_data.get('id')
+    return None
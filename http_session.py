@@ -0,0 +1,65 @@
+import requests
+from requests.adapters import HTTPAdapter
+import logging
+import os
+import threading
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Connection pool settings
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "10"))  # Number of hosts to keep pools for
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "20"))  # Maximum connections per host
+HTTP_POOL_BLOCK = os.getenv("HTTP_POOL_BLOCK", "true").lower() == "true"  # Wait for a free connection instead of opening extra ones
+
+# Session shared by the current process
+_session = None
+_session_pid = None
+_lock = threading.Lock()
+
+def create_session():
+    """Create HTTP session with keep-alive and a bounded connection pool per host"""
+    session = requests.Session()
+    
+    adapter = HTTPAdapter(
+        pool_connections=HTTP_POOL_CONNECTIONS,
+        pool_maxsize=HTTP_POOL_MAXSIZE,
+        pool_block=HTTP_POOL_BLOCK
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    
+    return session
+
+def get_session():
+    """
+    Get HTTP session shared by the current process
+    
+    The session is created once per process (a forked worker process never
+    reuses the connections of its parent), so connections and cookies
+    are kept between tasks.
+    
+    Returns:
+        requests.Session: Shared session
+    """
+    global _session, _session_pid
+    
+    with _lock:
+        if _session is None or _session_pid != os.getpid():
+            logger.info(f"Creating HTTP session for process {os.getpid()}")
+            _session = create_session()
+            _session_pid = os.getpid()
+        
+        return _session
+
+def reset_session():
+    """Close shared HTTP session, a new one is created on next use"""
+    global _session, _session_pid
+    
+    with _lock:
+        # Never close connections inherited from the parent process
+        if _session is not None and _session_pid == os.getpid():
+            _session.close()
+        
+        _session = None
+        _session_pid = None
@@ -1,13 +1,19 @@
-import requests
 import json
 import re
 import random
-from bs4 import BeautifulSoup
 from datetime import datetime, timedelta
 import logging
+import os
 import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any
 
+from http_session import get_session
+from html_extractor import extract_profile_data, find_user_in_shared_data
+from user_id_cache import user_id_cache as default_user_id_cache
+from method_stats import method_stats as default_method_stats
+from rate_limiter import rate_limiter as default_rate_limiter
+
 # Setup logging
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -15,11 +21,57 @@ logger.setLevel(logging.INFO)
 logging.getLogger("urllib3").setLevel(logging.WARNING)
 logging.getLogger("requests").setLevel(logging.WARNING)
 
-class InstagramScraper:
-    """Class for scraping data from public Instagram accounts"""
+# Request next timeline page while the current one is processed
+SCRAPER_PIPELINE_PAGES = os.getenv("SCRAPER_PIPELINE_PAGES", "true").lower() == "true"
+
+# Number of accounts scraped at once by get_posts_many
+SCRAPER_BATCH_WORKERS = int(os.getenv("SCRAPER_BATCH_WORKERS", "4"))
+
+# Maximum number of pages requested in incremental mode to reach the high-water mark
+SCRAPER_INCREMENTAL_MAX_PAGES = int(os.getenv("SCRAPER_INCREMENTAL_MAX_PAGES", "20"))
+
+class ScrapeCancelled(Exception):
+    """Scraping was cancelled through the scraper's cancel_event"""
+
+class BaseInstagramScraper:
+    """Request settings and response parsing shared by the sync and async scrapers"""
+    
+    # GraphQL query hashes (updated periodically by Instagram)
+    TIMELINE_QUERY_HASH = "472f257a40c653c64c666ce877d59d2b"
+    MORE_POSTS_QUERY_HASH = "e769aa130647d2354c40ea6a439bfc08"
     
-    def __init__(self):
-        """Initialize scraper with settings for HTTP requests"""
+    # Application ID required by the web_profile_info API
+    IG_APP_ID = '936619743392459'
+    
+    # Size of the first page in incremental mode (usually enough to reach stored posts)
+    INCREMENTAL_PAGE_SIZE = 12
+    
+    # Scraping methods in default order (see _get_posts_via_<name>)
+    METHODS = ["graphql", "html", "alternative_api"]
+    
+    def __init__(self, user_id_cache=None, method_stats=None, rate_limiter=None, cancel_event=None):
+        """
+        Initialize scraper settings shared by sync and async requests
+        
+        Args:
+            user_id_cache (UserIdCache): Cache for username -> user ID resolution,
+                the process-wide cache by default
+            method_stats (MethodStats): Success rate, latency and circuit breaker
+                of scraping methods, shared by all workers by default
+            rate_limiter (RateLimiter): Request budget per host and identity,
+                shared by all workers by default
+            cancel_event (threading.Event): Once set, the next request raises
+                ScrapeCancelled instead of being made
+        """
+        # Resolved user IDs shared between scrapers
+        self.user_id_cache = user_id_cache or default_user_id_cache
+        
+        # Used to try the currently best scraping method first
+        self.method_stats = method_stats or default_method_stats
+        
+        # Throttles requests instead of fixed delays
+        self.rate_limiter = rate_limiter or default_rate_limiter
+        
         # List of User-Agent strings to simulate different browsers
         self.user_agents = [
             "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36",
@@ -49,6 +101,19 @@ class InstagramScraper:
             'Cache-Control': 'max-age=0'
         }
         
+        # High-water mark for incremental scraping (see get_posts)
+        self.since = None
+        self.reached_watermark = False
+        
+        # Last page of the timeline was fetched (no older posts left)
+        self.reached_end = False
+        
+        # Scraping method in use (see METHODS)
+        self.current_method = None
+        
+        # Cancellation by the caller (see _check_cancelled)
+        self.cancel_event = cancel_event
+        
         # Add cookies and token for authentication - important for real scraping
         self.cookies = {
             'ig_did': f'{self._generate_ig_did()}',
@@ -58,464 +123,648 @@ class InstagramScraper:
             'sessionid': '',
             'rur': '"RVA,{}"'.format(''.join(random.choice("0123456789") for _ in range(10)))
         }
+        
+        # Identity for per-identity request budget (one per scraper by default)
+        self.identity = self.cookies['mid']
+    
+    def _extract_posts_from_edges(self, edges, username, limit, last_page=False):
+        """
+        Extract up to limit posts from timeline edges
+        
+        In incremental mode, stored posts are skipped and reached_watermark is
+        set if the page ends with stored posts. Pinned posts come first
+        regardless of their date, so an old post followed by newer ones
+        doesn't stop pagination.
+        
+        Args:
+            edges (list): Timeline edges of one page
+            username (str): Instagram username
+            limit (int): Maximum number of posts
+            last_page (bool): No older page follows (sets reached_end unless
+                posts are cut off by limit)
+        """
+        posts = []
+        stored_tail = False
+        
+        # Process each post
+        for edge in edges:
+            if len(posts) >= limit:
+                last_page = False
+                break
+            
+            node = edge.get('node', {})
+            
+            if not node:
+                continue
+            
+            # Skip posts that are already stored (incremental mode)
+            if self._is_already_seen(node):
+                stored_tail = stored_tail or not node.get('pinned_for_users')
+                continue
+            
+            stored_tail = False
+            posts.append(self._extract_post_from_node(node, username))
+        
+        if stored_tail:
+            self.reached_watermark = True
+        
+        if last_page:
+            self.reached_end = True
+        
+        return posts
+    
+    def _post_limit(self, num_posts):
+        """
+        Number of posts to retrieve
+        
+        In incremental mode all posts newer than the high-water mark are
+        retrieved regardless of num_posts (posts left out would never be
+        fetched later), up to SCRAPER_INCREMENTAL_MAX_PAGES pages.
+        """
+        if not self.since:
+            return num_posts
+        return self.INCREMENTAL_PAGE_SIZE + (SCRAPER_INCREMENTAL_MAX_PAGES - 1) * 50
+    
+    def _first_page_size(self):
+        """Number of posts to request on the first page"""
+        # Maximum 50 posts per request, new posts are usually few in incremental mode
+        return self.INCREMENTAL_PAGE_SIZE if self.since else 50
+    
+    def _is_already_seen(self, node):
+        """Check if post node is not newer than the high-water mark (incremental mode)"""
+        if not self.since:
+            return False
+        
+        return node.get('shortcode') == self.since.get('shortcode') or \
+            node.get('taken_at_timestamp', 0) <= self.since.get('timestamp', 0)
+    
+    def _extract_post_from_node(self, node, username):
+        """Extract post information from GraphQL node"""
+        try:
+            # Basic post information
+            post_url = f"https://www.instagram.com/p/{node.get('shortcode', '')}/"
+            
+            # Extract caption
+            caption_node = node.get('edge_media_to_caption', {}).get('edges', [])
+            caption = caption_node[0]['node']['text'] if caption_node else ""
+            
+            # Extract hashtags
+            hashtags = []
+            for tag in re.findall(r'#(\w+)', caption):
+                hashtags.append(tag.lower())
+            
+            # Form title from first 30 characters of text
+            title = caption[:30] + ("..." if len(caption) > 30 else "")
+            
+            # Gather information about likes and comments
+            likes = node.get('edge_liked_by', {}).get('count', 0) or node.get('edge_media_preview_like', {}).get('count', 0) or 0
+            comments = node.get('edge_media_to_comment', {}).get('count', 0) or 0
+            
+            # Create publication date
+            timestamp = datetime.fromtimestamp(node.get('taken_at_timestamp', 0))
+            
+            # If username is not specified, try to extract it from node
+            if not username:
+                owner = node.get('owner', {})
+                username = owner.get('username', "")
+            
+            # Create post object
+            post = {
+                "url": post_url,
+                "shortcode": node.get('shortcode', ''),
+                "text": caption,
+                "title": title,
+                "likes": likes,
+                "comments": comments,
+                "hashtags": hashtags,
+                "timestamp": timestamp.isoformat(),
+                "username": username
+            }
+            
+            return post
+            
+        except Exception:
+            # Return empty post in case of error
+            return {
+                "url": "",
+                "shortcode": "",
+                "text": "",
+                "title": "",
+                "likes": 0,
+                "comments": 0,
+                "hashtags": [],
+                "timestamp": datetime.now().isoformat(),
+                "username": username
+            }
     
-    def get_posts(self, username, num_posts=10):
+    def _extract_shared_data(self, html):
+        """Extract shared_data from Instagram HTML page"""
+        try:
+            return extract_profile_data(html)["shared_data"]
+        
+        except Exception:
+            return None
+    
+    def _check_cancelled(self):
+        """Raise ScrapeCancelled if the caller cancelled scraping"""
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise ScrapeCancelled()
+    
+    def _build_graphql_url(self, query_hash, variables):
+        """Build URL for GraphQL query"""
+        return f"https://www.instagram.com/graphql/query/?query_hash={query_hash}&variables={json.dumps(variables)}"
+    
+    def _find_user_id_in_profile_json(self, data):
+        """Find user ID in profile JSON response (?__a=1)"""
+        # Response structure may vary
+        if 'graphql' in data and 'user' in data['graphql']:
+            return data['graphql']['user']['id']
+        elif 'user' in data:
+            return data['user']['id']
+        
+        return None
+    
+    def _find_user_in_shared_data(self, shared_data):
+        """Find user data in shared_data structure"""
+        return find_user_in_shared_data(shared_data)
+    
+    def _find_user_id_in_html(self, html):
+        """Find user ID in profile page HTML (shared_data, other markers or meta data)"""
+        return extract_profile_data(html)["user_id"]
+    
+    def _generate_ig_did(self):
+        """Generate random ig_did for headers"""
+        return ''.join(random.choice("0123456789abcdef") for _ in range(32))
+    
+    def _generate_mid(self):
+        """Generate random mid for headers"""
+        return ''.join(random.choice("0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ") for _ in range(26))
+    
+    def _generate_csrftoken(self):
+        """Generate random csrftoken for headers"""
+        return ''.join(random.choice("0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ") for _ in range(32))
+    
+    def _generate_random_id(self, length=11):
+        """Generate random Instagram-style post ID"""
+        chars = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_-"
+        return ''.join(random.choice(chars) for _ in range(length))
+
+class InstagramScraper(BaseInstagramScraper):
+    """Class for scraping data from public Instagram accounts"""
+    
+    def __init__(self, session=None, user_id_cache=None, method_stats=None, rate_limiter=None, cancel_event=None):
+        """
+        Initialize scraper with settings for HTTP requests
+        
+        Args:
+            session (requests.Session): HTTP session to use, the process-wide
+                pooled session by default
+            user_id_cache (UserIdCache): Cache for username -> user ID resolution,
+                the process-wide cache by default
+            method_stats (MethodStats): Success rate, latency and circuit breaker
+                of scraping methods, shared by all workers by default
+            rate_limiter (RateLimiter): Request budget per host and identity,
+                shared by all workers by default
+            cancel_event (threading.Event): Once set, the next request raises
+                ScrapeCancelled instead of being made
+        """
+        super().__init__(user_id_cache, method_stats, rate_limiter, cancel_event)
+        
+        # Keep-alive session shared between scrapers
+        self.session = session or get_session()
+        
+        # Pipelined pagination (see _iter_timeline_pages)
+        self.pipeline_pages = SCRAPER_PIPELINE_PAGES
+        
+        # Keep cookies already set in the shared session (and refreshed by Instagram)
+        for name, value in self.cookies.items():
+            if name not in self.session.cookies:
+                self.session.cookies.set(name, value, domain='.instagram.com', path='/')
+        
+        # Identity for per-identity request budget (requests share session cookies)
+        self.identity = str(self.session.cookies.get('mid') or self.cookies['mid'])
+    
+    def get_posts(self, username, num_posts=10, since=None):
         """
         Get recent posts from Instagram account
         
         Args:
             username (str): Instagram username (without @)
-            num_posts (int): Number of posts to retrieve
+            num_posts (int): Number of posts to retrieve (ignored in incremental mode)
+            since (dict): High-water mark of the newest stored post
+                ({"shortcode": str, "timestamp": int}). If set, all newer posts
+                are returned and pagination stops once a stored post is reached
             
         Returns:
             list: List of posts with metadata
         """
         all_posts = []
         
+        # Incremental mode state
+        self.since = since
+        self.reached_watermark = False
+        self.reached_end = False
+        num_posts = self._post_limit(num_posts)
+        
         try:
             logger.info(f"Scraping data for @{username}")
             
-            # Try all methods silently
-            all_posts = self._get_posts_via_graphql(username, num_posts)
-            
-            if not all_posts:
-                all_posts = self._get_posts_via_html(username, num_posts)
+            # Try methods silently, best first (failing ones are skipped for a while)
+            for method in self.method_stats.order(self.METHODS):
+                self.current_method = method
+                started = time.time()
+                all_posts = getattr(self, f"_get_posts_via_{method}")(username, num_posts)
                 
-            if not all_posts:
-                all_posts = self._get_posts_via_alternative_api(username, num_posts)
+                success = bool(all_posts) or self.reached_watermark
+                
+                # Method didn't fail, it was stopped
+                if not success:
+                    self._check_cancelled()
+                
+                self.method_stats.record(method, success, time.time() - started)
+                
+                if success:
+                    break
                 
             # If all methods failed, raise exception
-            if not all_posts:
+            if not all_posts and not self.reached_watermark:
                 raise Exception("Failed to get data")
                 
             logger.info(f"Retrieved {len(all_posts)} posts")
             return all_posts[:num_posts]
             
+        except ScrapeCancelled:
+            logger.info(f"Scraping cancelled for @{username}")
+            raise
+            
         except Exception as e:
             # Only log the exception without details
             logger.error(f"Scraping failed for @{username}")
             raise Exception(f"Scraping failed")
     
-    def _get_posts_via_graphql(self, username, num_posts):
-        """Get posts via GraphQL API"""
-        posts = []
+    def iter_pages(self, username, limit=10, since=None):
+        """
+        Get recent posts from Instagram account page by page
         
-        try:
-            # Request to Instagram to get user ID
-            user_id = self._get_user_id(username)
+        Each page is yielded as soon as it is parsed, so callers can process
+        (and save) posts while the next page is requested. A method is replaced
+        by the next one only if it fails before returning any posts.
+        
+        Args:
+            username (str): Instagram username (without @)
+            limit (int): Maximum number of posts to retrieve (ignored in incremental mode)
+            since (dict): High-water mark of the newest stored post (see get_posts)
             
-            if not user_id:
-                return []
+        Yields:
+            list: Posts of one page
+        """
+        # Incremental mode state
+        self.since = since
+        self.reached_watermark = False
+        self.reached_end = False
+        limit = self._post_limit(limit)
+        
+        logger.info(f"Scraping data for @{username}")
+        
+        # Try methods silently, best first (failing ones are skipped for a while)
+        for method in self.method_stats.order(self.METHODS):
+            self.current_method = method
+            started = time.time()
+            success = False
+            count = 0
+            
+            for page in getattr(self, f"_iter_pages_via_{method}")(username, limit):
+                if not success and (page or self.reached_watermark):
+                    success = True
+                    self.method_stats.record(method, True, time.time() - started)
                 
-            # Query GraphQL API for posts
-            query_hash = "472f257a40c653c64c666ce877d59d2b"  # Current hash for media query (updated periodically)
+                count += len(page)
+                if page:
+                    yield page
             
-            variables = {
-                "id": user_id,
-                "first": min(num_posts, 50),  # Maximum 50 posts per request
-                "after": None
-            }
+            if success:
+                logger.info(f"Retrieved {count} posts")
+                return
             
-            url = f"https://www.instagram.com/graphql/query/?query_hash={query_hash}&variables={json.dumps(variables)}"
+            # Method didn't fail, it was stopped
+            self._check_cancelled()
             
-            # Simulate delay like a normal user
-            time.sleep(random.uniform(2, 4))
+            self.method_stats.record(method, False, time.time() - started)
+        
+        # All methods failed, only log without details
+        logger.error(f"Scraping failed for @{username}")
+        raise Exception("Scraping failed")
+    
+    def iter_posts(self, username, limit=10, since=None):
+        """
+        Get recent posts from Instagram account one by one as pages are parsed
+        
+        Args:
+            username (str): Instagram username (without @)
+            limit (int): Maximum number of posts to retrieve
+            since (dict): High-water mark of the newest stored post (see get_posts)
             
-            # Update User-Agent for each request
-            self.headers['User-Agent'] = random.choice(self.user_agents)
+        Yields:
+            dict: Post with metadata
+        """
+        for page in self.iter_pages(username, limit, since):
+            yield from page
+    
+    def get_posts_many(self, usernames, num_posts=10, max_workers=SCRAPER_BATCH_WORKERS):
+        """
+        Get recent posts from several Instagram accounts concurrently
+        
+        Each account is scraped by its own scraper instance sharing the HTTP
+        connection pool, caches and rate limiter of this one, so the request
+        budget stays the same as for sequential scraping.
+        
+        Args:
+            usernames (list): Instagram usernames (without @)
+            num_posts (int): Maximum number of posts to retrieve per account
+            max_workers (int): Maximum number of accounts scraped at once
             
-            # Make request
-            response = requests.get(
-                url, 
-                headers=self.headers, 
-                cookies=self.cookies,
-                timeout=10
+        Returns:
+            dict: Username -> list of posts (accounts that failed are missing)
+        """
+        # Drop duplicates, keep order
+        usernames = list(dict.fromkeys(usernames))
+        if not usernames:
+            return {}
+        
+        def scrape(username):
+            scraper = InstagramScraper(
+                session=self.session,
+                user_id_cache=self.user_id_cache,
+                method_stats=self.method_stats,
+                rate_limiter=self.rate_limiter,
+                cancel_event=self.cancel_event
             )
-            
-            if response.status_code != 200:
-                return []
-                
-            data = response.json()
-            
-            # Extract post data
-            user_data = data.get('data', {}).get('user', {})
-            if not user_data:
-                return []
-                
-            edge_owner_to_timeline_media = user_data.get('edge_owner_to_timeline_media', {})
-            edges = edge_owner_to_timeline_media.get('edges', [])
-            
-            # Process each post
-            for edge in edges:
-                node = edge.get('node', {})
-                
-                if not node:
-                    continue
-                
-                post = self._extract_post_from_node(node, username)
-                posts.append(post)
-            
-            # Check if we need to request additional posts with pagination
-            page_info = edge_owner_to_timeline_media.get('page_info', {})
-            has_next_page = page_info.get('has_next_page', False)
-            end_cursor = page_info.get('end_cursor')
-            
-            # Request additional pages if not enough posts
-            while has_next_page and len(posts) < num_posts:
-                # Update variables for next request
-                variables["after"] = end_cursor
-                
-                # Update URL
-                url = f"https://www.instagram.com/graphql/query/?query_hash={query_hash}&variables={json.dumps(variables)}"
-                
-                # Simulate delay
-                time.sleep(random.uniform(3, 6))
-                
-                # Update User-Agent
-                self.headers['User-Agent'] = random.choice(self.user_agents)
-                
-                # Make request
-                response = requests.get(
-                    url, 
-                    headers=self.headers, 
-                    cookies=self.cookies,
-                    timeout=15
-                )
-                
-                if response.status_code != 200:
-                    break
-                    
-                data = response.json()
-                
-                # Extract post data
-                user_data = data.get('data', {}).get('user', {})
-                edge_owner_to_timeline_media = user_data.get('edge_owner_to_timeline_media', {})
-                edges = edge_owner_to_timeline_media.get('edges', [])
-                
-                # Process each post
-                for edge in edges:
-                    if len(posts) >= num_posts:
-                        break
-                        
-                    node = edge.get('node', {})
-                    
-                    if not node:
-                        continue
-                    
-                    post = self._extract_post_from_node(node, username)
-                    posts.append(post)
-                
-                # Check if there are more pages
-                page_info = edge_owner_to_timeline_media.get('page_info', {})
-                has_next_page = page_info.get('has_next_page', False) and len(posts) < num_posts
-                end_cursor = page_info.get('end_cursor')
-            
-        except Exception:
-            # Silently fail and return empty list
-            return []
+            return scraper.get_posts(username, num_posts)
         
-        return posts
+        results = {}
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(usernames)))) as executor:
+            futures = {username: executor.submit(scrape, username) for username in usernames}
+            
+            for username, future in futures.items():
+                try:
+                    results[username] = future.result()
+                except Exception as e:
+                    logger.error(f"Error scraping @{username}: {str(e)}")
+        
+        return results
+    
+    def _get_posts_via_graphql(self, username, num_posts):
+        """Get posts via GraphQL API"""
+        return self._collect_pages(self._iter_pages_via_graphql(username, num_posts))
     
     def _get_posts_via_html(self, username, num_posts):
         """Get posts by parsing profile HTML page"""
+        return self._collect_pages(self._iter_pages_via_html(username, num_posts))
+    
+    def _get_posts_via_alternative_api(self, username, num_posts):
+        """Get posts via alternative API"""
+        return self._collect_pages(self._iter_pages_via_alternative_api(username, num_posts))
+    
+    def _collect_pages(self, pages):
+        """Join pages of posts into one list"""
         posts = []
+        for page in pages:
+            posts.extend(page)
+        return posts
+    
+    def _iter_pages_via_graphql(self, username, num_posts):
+        """Get posts via GraphQL API, page by page"""
+        # Request to Instagram to get user ID
+        user_id = self._get_user_id(username)
+        
+        if not user_id:
+            return
         
+        yield from self._iter_timeline_pages(self.TIMELINE_QUERY_HASH, user_id, username, num_posts)
+    
+    def _iter_pages_via_html(self, username, num_posts):
+        """Get posts by parsing profile HTML page (first page only)"""
         try:
             # Get profile page
             url = f"https://www.instagram.com/{username}/"
             
-            # Simulate delay
-            time.sleep(random.uniform(1, 3))
-            
-            # Update User-Agent
-            self.headers['User-Agent'] = random.choice(self.user_agents)
-            
-            # Make request
-            response = requests.get(
+            # Make request with a new User-Agent
+            response = self._get(
                 url, 
-                headers=self.headers, 
-                cookies=self.cookies,
+                headers={**self.headers, 'User-Agent': random.choice(self.user_agents)}, 
                 timeout=10
             )
             
             if response.status_code != 200:
-                return []
+                return
             
             # Get shared_data from HTML
             shared_data = self._extract_shared_data(response.text)
             
             if not shared_data:
-                return []
+                return
             
             # Extract profile and post data
-            user_data = None
-            
-            # Search in main format
-            if 'entry_data' in shared_data and 'ProfilePage' in shared_data['entry_data']:
-                if len(shared_data['entry_data']['ProfilePage']) > 0:
-                    if 'graphql' in shared_data['entry_data']['ProfilePage'][0]:
-                        if 'user' in shared_data['entry_data']['ProfilePage'][0]['graphql']:
-                            user_data = shared_data['entry_data']['ProfilePage'][0]['graphql']['user']
-            
-            # Search in alternative format
-            if not user_data and 'user' in shared_data:
-                user_data = shared_data['user']
+            user_data = self._find_user_in_shared_data(shared_data)
             
             if not user_data:
-                return []
+                return
+            
+            # Remember user ID for next GraphQL requests
+            self.user_id_cache.set(username, user_data.get('id'))
             
             # Extract node with posts
             edge_owner_to_timeline_media = user_data.get('edge_owner_to_timeline_media')
             
             if not edge_owner_to_timeline_media:
-                return []
+                return
             
-            # Iterate through posts
-            for edge in edge_owner_to_timeline_media.get('edges', []):
-                node = edge.get('node', {})
-                
-                if not node:
-                    continue
-                
-                post = self._extract_post_from_node(node, username)
-                posts.append(post)
+            posts = self._extract_posts_from_edges(
+                edge_owner_to_timeline_media.get('edges', []), username, num_posts,
+                last_page=not edge_owner_to_timeline_media.get('page_info', {}).get('has_next_page', False)
+            )
             
         except Exception:
-            # Silently fail and return empty list
-            return []
+            # Silently fail
+            return
         
-        return posts
+        yield posts
     
-    def _get_posts_via_alternative_api(self, username, num_posts):
-        """Get posts via alternative API"""
-        posts = []
-        
+    def _iter_pages_via_alternative_api(self, username, num_posts):
+        """Get posts via alternative API, page by page"""
         try:
             # Use Instagram's public API to get first 12 posts
             url = f"https://www.instagram.com/api/v1/users/web_profile_info/?username={username}"
             
-            # Simulate delay
-            time.sleep(random.uniform(2, 4))
-            
             # Add special headers for this API
             headers = self.headers.copy()
-            headers['X-IG-App-ID'] = '936619743392459'  # Important header for this API
+            headers['X-IG-App-ID'] = self.IG_APP_ID  # Important header for this API
             headers['X-Requested-With'] = 'XMLHttpRequest'
             
             # Make request
-            response = requests.get(
+            response = self._get(
                 url, 
                 headers=headers, 
-                cookies=self.cookies,
                 timeout=10
             )
             
             if response.status_code != 200:
-                return []
+                return
             
             data = response.json()
             
             # Extract user and post information
             user_data = data.get('data', {}).get('user', {})
             if not user_data:
-                return []
+                return
+            
+            # Remember user ID for next GraphQL requests
+            self.user_id_cache.set(username, user_data.get('id'))
             
             edge_owner_to_timeline_media = user_data.get('edge_owner_to_timeline_media', {})
-            edges = edge_owner_to_timeline_media.get('edges', [])
             
-            # Process each post
-            for edge in edges:
-                node = edge.get('node', {})
-                
-                if not node:
-                    continue
-                
-                post = self._extract_post_from_node(node, username)
-                posts.append(post)
+            # Get pagination information
+            page_info = edge_owner_to_timeline_media.get('page_info', {})
             
-            # If we need more posts, use pagination
-            if len(posts) < num_posts:
-                # Get pagination information
-                page_info = edge_owner_to_timeline_media.get('page_info', {})
-                has_next_page = page_info.get('has_next_page', False)
-                end_cursor = page_info.get('end_cursor')
-                
-                if has_next_page and end_cursor:
-                    user_id = user_data.get('id')
-                    additional_posts = self._get_more_posts_via_api(user_id, end_cursor, num_posts - len(posts))
-                    posts.extend(additional_posts)
+            posts = self._extract_posts_from_edges(
+                edge_owner_to_timeline_media.get('edges', []), username, num_posts,
+                last_page=not page_info.get('has_next_page', False)
+            )
             
         except Exception:
-            # Silently fail and return empty list
-            return []
+            # Silently fail
+            return
         
-        return posts
+        yield posts
+        
+        # If we need more posts, use pagination
+        if len(posts) < num_posts and page_info.get('has_next_page', False) and page_info.get('end_cursor') \
+                and not self.reached_watermark:
+            yield from self._iter_timeline_pages(
+                self.MORE_POSTS_QUERY_HASH, user_data.get('id'), username,
+                num_posts - len(posts), end_cursor=page_info['end_cursor']
+            )
     
-    def _get_more_posts_via_api(self, user_id, end_cursor, num_posts):
-        """Get additional posts via API with pagination"""
-        additional_posts = []
+    def _iter_timeline_pages(self, query_hash, user_id, username, num_posts, end_cursor=None):
+        """
+        Get posts of user timeline via GraphQL API with pagination
+        
+        In pipelined mode the next page is requested in background as soon as
+        its cursor is known, while the current page is parsed and processed
+        by the caller (the request still waits for the rate limiter).
+        
+        Args:
+            query_hash (str): GraphQL query hash
+            user_id (str): Instagram user ID
+            username (str): Instagram username
+            num_posts (int): Maximum number of posts to retrieve
+            end_cursor (str): Cursor to start after (None for the first page)
+            
+        Yields:
+            list: Posts of one page
+        """
+        count = 0
+        
+        # Not in incremental mode, where the first page is usually the last one
+        executor = ThreadPoolExecutor(max_workers=1) if self.pipeline_pages and not self.since else None
         
         try:
-            # Form URL for requesting additional posts
             variables = {
                 "id": user_id,
-                "first": min(num_posts, 50),
+                "first": min(num_posts, self._first_page_size() if end_cursor is None else 50),
                 "after": end_cursor
             }
             
-            url = f"https://www.instagram.com/graphql/query/?query_hash=e769aa130647d2354c40ea6a439bfc08&variables={json.dumps(variables)}"
+            data = self._fetch_timeline_page(query_hash, variables)
             
-            # Simulate delay
-            time.sleep(random.uniform(3, 5))
-            
-            # Update User-Agent
-            self.headers['User-Agent'] = random.choice(self.user_agents)
-            
-            # Make request
-            response = requests.get(
-                url, 
-                headers=self.headers, 
-                cookies=self.cookies,
-                timeout=15
-            )
-            
-            if response.status_code != 200:
-                return []
-            
-            data = response.json()
-            
-            # Extract post data
-            user_data = data.get('data', {}).get('user', {})
-            edge_owner_to_timeline_media = user_data.get('edge_owner_to_timeline_media', {})
-            edges = edge_owner_to_timeline_media.get('edges', [])
-            
-            # Process each post
-            for edge in edges:
-                node = edge.get('node', {})
+            while data is not None:
+                # Extract post data
+                user_data = data.get('data', {}).get('user', {})
+                if not user_data:
+                    if count == 0 and end_cursor is None:
+                        # Cached user ID may be outdated
+                        self.user_id_cache.delete(username)
+                    return
                 
-                if not node:
-                    continue
+                edge_owner_to_timeline_media = user_data.get('edge_owner_to_timeline_media', {})
+                edges = edge_owner_to_timeline_media.get('edges', [])
                 
-                # Extract post information
-                post = self._extract_post_from_node(node, "")  # Username will be filled later
-                additional_posts.append(post)
-            
-        except Exception:
-            # Silently fail
-            pass
-        
-        return additional_posts
-    
-    def _extract_post_from_node(self, node, username):
-        """Extract post information from GraphQL node"""
-        try:
-            # Basic post information
-            post_url = f"https://www.instagram.com/p/{node.get('shortcode', '')}/"
-            
-            # Extract caption
-            caption_node = node.get('edge_media_to_caption', {}).get('edges', [])
-            caption = caption_node[0]['node']['text'] if caption_node else ""
-            
-            # Extract hashtags
-            hashtags = []
-            for tag in re.findall(r'#(\w+)', caption):
-                hashtags.append(tag.lower())
-            
-            # Form title from first 30 characters of text
-            title = caption[:30] + ("..." if len(caption) > 30 else "")
-            
-            # Gather information about likes and comments
-            likes = str(node.get('edge_liked_by', {}).get('count', 0) or node.get('edge_media_preview_like', {}).get('count', 0))
-            comments = str(node.get('edge_media_to_comment', {}).get('count', 0))
-            
-            # Create publication date
-            timestamp = datetime.fromtimestamp(node.get('taken_at_timestamp', 0))
-            
-            # If username is not specified, try to extract it from node
-            if not username:
-                owner = node.get('owner', {})
-                username = owner.get('username', "")
-            
-            # Create post object
-            post = {
-                "url": post_url,
-                "text": caption,
-                "title": title,
-                "likes": likes,
-                "comments": comments,
-                "hashtags": hashtags,
-                "timestamp": timestamp.isoformat(),
-                "username": username
-            }
-            
-            return post
-            
-        except Exception:
-            # Return empty post in case of error
-            return {
-                "url": "",
-                "text": "",
-                "title": "",
-                "likes": "0",
-                "comments": "0",
-                "hashtags": [],
-                "timestamp": datetime.now().isoformat(),
-                "username": username
-            }
-    
-    def _extract_shared_data(self, html):
-        """Extract shared_data from Instagram HTML page"""
-        try:
-            # Look for shared_data block
-            match = re.search(r'window\._sharedData\s*=\s*(.+?);</script>', html)
-            
-            if match:
-                json_str = match.group(1)
-                return json.loads(json_str)
-            
-            # Alternative search in different format
-            match = re.search(r'window\.__additionalDataLoaded\s*\(\s*[\'"]profile[\'"],\s*(.+?)\s*\);</script>', html)
-            
-            if match:
-                json_str = match.group(1)
-                return json.loads(json_str)
+                # Check if there are more pages
+                page_info = edge_owner_to_timeline_media.get('page_info', {})
+                has_next_page = page_info.get('has_next_page', False)
                 
-            # Another format (new Instagram)
-            match = re.search(r'<script type="application/json" data-sjs>(.+?)</script>', html)
-            
-            if match:
-                json_str = match.group(1)
-                data = json.loads(json_str)
+                # Request next page before parsing this one if it will be needed
+                prefetch = None
+                if executor and has_next_page and count + len(edges) < num_posts:
+                    prefetch = executor.submit(self._fetch_timeline_page, query_hash, {
+                        "id": user_id,
+                        "first": min(num_posts - count - len(edges), 50),
+                        "after": page_info.get('end_cursor')
+                    })
                 
-                # Now need to find user data in this structure
-                if 'require' in data:
-                    for item in data['require']:
-                        if isinstance(item, list) and len(item) > 2 and isinstance(item[2], dict):
-                            if 'user' in item[2]:
-                                return item[2]
-            
-            return None
+                page = self._extract_posts_from_edges(edges, username, num_posts - count, last_page=not has_next_page)
+                count += len(page)
+                
+                yield page
+                
+                # Request additional pages if not enough posts and no stored post reached
+                if not has_next_page or count >= num_posts or self.reached_watermark:
+                    return
+                
+                if prefetch:
+                    data = prefetch.result()
+                else:
+                    data = self._fetch_timeline_page(query_hash, {
+                        "id": user_id,
+                        "first": min(num_posts - count, 50),
+                        "after": page_info.get('end_cursor')
+                    })
             
         except Exception:
+            # Silently stop, pages already yielded are kept
+            return
+        
+        finally:
+            if executor:
+                # Drop prefetched page that is not needed anymore
+                executor.shutdown(wait=False, cancel_futures=True)
+    
+    def _fetch_timeline_page(self, query_hash, variables):
+        """
+        Request one page of user timeline via GraphQL API
+        
+        Returns:
+            dict: Response JSON or None if request failed
+        """
+        url = self._build_graphql_url(query_hash, variables)
+        
+        # New User-Agent for each request, passed per request instead of stored in
+        # self.headers (the prefetch thread requests pages while the caller goes on)
+        response = self._get(
+            url, 
+            headers={**self.headers, 'User-Agent': random.choice(self.user_agents)}, 
+            timeout=10 if variables["after"] is None else 15
+        )
+        
+        if response.status_code != 200:
             return None
+        
+        return response.json()
     
     def _get_user_id(self, username):
-        """Get Instagram user ID"""
+        """Get Instagram user ID (cached, as user IDs don't change)"""
+        user_id = self.user_id_cache.get(username)
+        if user_id:
+            return user_id
+        
         try:
             # Request user information
             url = f"https://www.instagram.com/{username}/?__a=1&__d=dis"
             
-            # Simulate delay
-            time.sleep(random.uniform(1, 2))
-            
-            # Update User-Agent
-            self.headers['User-Agent'] = random.choice(self.user_agents)
-            
-            # Make request
-            response = requests.get(
+            # Make request with a new User-Agent
+            response = self._get(
                 url, 
-                headers=self.headers, 
-                cookies=self.cookies,
+                headers={**self.headers, 'User-Agent': random.choice(self.user_agents)}, 
                 timeout=10
             )
             
@@ -524,17 +773,15 @@ class InstagramScraper:
                 return self._get_user_id_from_html(username)
             
             # Parse JSON response
-            data = response.json()
+            user_id = self._find_user_id_in_profile_json(response.json())
             
-            # Response structure may vary
-            if 'graphql' in data and 'user' in data['graphql']:
-                return data['graphql']['user']['id']
-            elif 'user' in data:
-                return data['user']['id']
-            else:
+            if not user_id:
                 # Try alternative method - via HTML page
                 return self._get_user_id_from_html(username)
             
+            self.user_id_cache.set(username, user_id)
+            return user_id
+            
         except Exception:
             # Try alternative method - via HTML page
             return self._get_user_id_from_html(username)
@@ -545,17 +792,10 @@ class InstagramScraper:
             # Request user page
             url = f"https://www.instagram.com/{username}/"
             
-            # Simulate delay
-            time.sleep(random.uniform(2, 3))
-            
-            # Update User-Agent
-            self.headers['User-Agent'] = random.choice(self.user_agents)
-            
-            # Make request
-            response = requests.get(
+            # Make request with a new User-Agent
+            response = self._get(
                 url, 
-                headers=self.headers, 
-                cookies=self.cookies,
+                headers={**self.headers, 'User-Agent': random.choice(self.user_agents)}, 
                 timeout=10
             )
             
@@ -563,60 +803,20 @@ class InstagramScraper:
                 return None
             
             # Look for user ID in HTML
-            # Option 1: look in shared_data
-            shared_data = self._extract_shared_data(response.text)
-            
-            if shared_data:
-                # Search in main format
-                if 'entry_data' in shared_data and 'ProfilePage' in shared_data['entry_data']:
-                    if len(shared_data['entry_data']['ProfilePage']) > 0:
-                        if 'graphql' in shared_data['entry_data']['ProfilePage'][0]:
-                            if 'user' in shared_data['entry_data']['ProfilePage'][0]['graphql']:
-                                return shared_data['entry_data']['ProfilePage'][0]['graphql']['user'].get('id')
-                
-                # Search in alternative format
-                if 'user' in shared_data:
-                    return shared_data['user'].get('id')
-            
-            # Option 2: regular expressions
-            match = re.search(r'"user_id":"(\d+)"', response.text)
-            if match:
-                return match.group(1)
-                
-            match = re.search(r'"profilePage_(\d+)"', response.text)
-            if match:
-                return match.group(1)
-                
-            # Option 3: reading meta data
-            soup = BeautifulSoup(response.text, 'html.parser')
-            for meta in soup.find_all('meta'):
-                if 'property' in meta.attrs and meta.attrs['property'] == 'al:ios:url':
-                    content = meta.attrs.get('content', '')
-                    match = re.search(r'user\?id=(\d+)', content)
-                    if match:
-                        return match.group(1)
-            
-            return None
+            user_id = self._find_user_id_in_html(response.text)
+            self.user_id_cache.set(username, user_id)
+            return user_id
             
         except Exception:
             return None
     
-    def _generate_ig_did(self):
-        """Generate random ig_did for headers"""
-        return ''.join(random.choice("0123456789abcdef") for _ in range(32))
-    
-    def _generate_mid(self):
-        """Generate random mid for headers"""
-        return ''.join(random.choice("0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ") for _ in range(26))
-    
-    def _generate_csrftoken(self):
-        """Generate random csrftoken for headers"""
-        return ''.join(random.choice("0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ") for _ in range(32))
-    
-    def _generate_random_id(self, length=11):
-        """Generate random Instagram-style post ID"""
-        chars = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_-"
-        return ''.join(random.choice(chars) for _ in range(length))
+    def _get(self, url, headers=None, timeout=10):
+        """Make GET request once allowed by the request budget"""
+        self._check_cancelled()
+        self.rate_limiter.acquire(url, self.identity)
+        self._check_cancelled()
+        
+        return self.session.get(url, headers=headers, timeout=timeout)
 
 if __name__ == "__main__":
     scraper = InstagramScraper()
@@ -1,27 +1,46 @@
 from fastapi import FastAPI, HTTPException, Depends, Query, BackgroundTasks, Form
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+import asyncio
 import json
-from datetime import datetime
+import threading
+from datetime import datetime, date
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 import uuid
 import time
 import os
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.responses import HTMLResponse
-from fastapi import Request
-from fastapi.responses import JSONResponse
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from redis import asyncio as redis_asyncio
 import logging
 
 from instagram_scraper import InstagramScraper
-from models import SessionLocal, Post
-from tasks import scrape_instagram, get_task_result
-from celery_app import celery_app
+from models import SessionLocal, AsyncSessionLocal, init_db
+from crud import save_posts, search_posts, get_user_posts, get_hashtag_posts, get_posts_by_ids
+from crud import get_top_posts, get_daily_engagement, get_hashtag_engagement
+from tasks import scrape_instagram, get_task_result, start_batch, get_batch_progress, is_compact_result
+from tasks import make_result, save_task, load_task
+from celery_app import celery_app, schedule_tick, result_backend, visibility_timeout
+from scheduler import get_schedule, track_account, untrack_account
+from scheduler import SCHEDULE_BATCH_SIZE, SCHEDULE_MIN_INTERVAL, SCHEDULE_MAX_INTERVAL
+from scrape_lock import scrape_lock
 from city_analyzer import CityAnalyzer
 from news_fetcher import NewsFetcher
 
-app = FastAPI(title="Instagram Scraper API")
+@asynccontextmanager
+async def lifespan(app):
+    """Set up database schema before serving requests"""
+    # Blocking schema inspection runs off the event loop
+    await asyncio.to_thread(init_db)
+    yield
+
+app = FastAPI(title="Instagram Scraper API", lifespan=lifespan)
 
 # Create necessary directories if they don't exist
 os.makedirs('static', exist_ok=True)
@@ -31,9 +50,6 @@ os.makedirs('templates', exist_ok=True)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
 
-# Simulated Celery task storage (for backward compatibility)
-celery_tasks = {}
-
 # Initialize city analyzer and news fetcher
 city_analyzer = CityAnalyzer()
 news_fetcher = NewsFetcher()
@@ -45,8 +61,8 @@ class PostBase(BaseModel):
     url: str
     text: str
     title: Optional[str] = ""
-    likes: str
-    comments: Optional[str] = "0"
+    likes: int
+    comments: Optional[int] = 0
     hashtags: List[str]
     timestamp: datetime
     username: str
@@ -54,6 +70,22 @@ class PostBase(BaseModel):
     class Config:
         from_attributes = True
 
+class SearchResult(PostBase):
+    rank: float
+
+class DailyEngagement(BaseModel):
+    username: str
+    day: date
+    posts: int
+    likes: int
+    comments: int
+
+class HashtagEngagement(BaseModel):
+    hashtag: str
+    posts: int
+    avg_likes: float
+    avg_comments: float
+
 class TaskStatus(BaseModel):
     task_id: str
     status: str
@@ -61,6 +93,14 @@ class TaskStatus(BaseModel):
     created_at: datetime
     completed_at: Optional[datetime] = None
 
+class BatchScrapeRequest(BaseModel):
+    usernames: List[str]
+    num_posts: Optional[int] = 10
+
+class TrackAccountRequest(BaseModel):
+    username: str
+    num_posts: Optional[int] = 10
+
 class NewsItem(BaseModel):
     title: str
     link: str
@@ -72,6 +112,22 @@ class CityAnalysisResult(BaseModel):
     text: str
     cities: List[Dict[str, Any]]
 
+# Maximum number of accounts in one batch request
+SCRAPE_BATCH_MAX_SIZE = int(os.getenv("SCRAPE_BATCH_MAX_SIZE", "500"))
+
+# Seconds a scrape may wait in the queue before workers drop it
+SCRAPE_QUEUE_TIMEOUT = int(os.getenv("SCRAPE_QUEUE_TIMEOUT", "3600"))
+
+# Manual scrapes run in their own thread pool, never on the event loop
+MANUAL_SCRAPE_WORKERS = int(os.getenv("MANUAL_SCRAPE_WORKERS", "4"))  # Manual scrapes running at once (others wait)
+MANUAL_SCRAPE_TIMEOUT = float(os.getenv("MANUAL_SCRAPE_TIMEOUT", "120"))  # Seconds, including time waiting for a thread
+manual_scrape_executor = ThreadPoolExecutor(max_workers=MANUAL_SCRAPE_WORKERS, thread_name_prefix="manual-scrape")
+
+# Task progress streams (GET /tasks/{task_id}/stream)
+TASK_STREAM_TIMEOUT = float(os.getenv("TASK_STREAM_TIMEOUT", "600"))  # Seconds before the stream is closed
+TASK_STREAM_HEARTBEAT = float(os.getenv("TASK_STREAM_HEARTBEAT", "15"))  # Seconds between keep-alive comments
+TASK_STREAM_POLL_INTERVAL = float(os.getenv("TASK_STREAM_POLL_INTERVAL", "2"))  # Used if Redis pub/sub is not available
+
 def get_db():
     db = SessionLocal()
     try:
@@ -79,26 +135,95 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    """Async database session (queries don't block the event loop)"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def post_to_dict(post):
+    """Create object for response from database post"""
+    return {
+        "url": post.url,
+        "text": post.text,
+        "title": post.title,
+        "likes": post.likes,
+        "comments": post.comments,
+        "hashtags": json.loads(post.hashtags),  # Convert JSON string to list
+        "timestamp": post.timestamp,
+        "username": post.username
+    }
+
 # Home page for news analysis
 @app.get("/news/analyzer", response_class=HTMLResponse)
 async def news_analyzer(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
 # Instagram scraper endpoints
+# Declared before /scrape/{username}, which would match "batch" too
+@app.post("/scrape/batch", response_model=Dict[str, Any])
+async def scrape_posts_batch(request: BatchScrapeRequest):
+    """Start scraping of several accounts as one batch"""
+    # Normalize usernames and drop empty ones
+    usernames = [username.strip().lstrip('@') for username in request.usernames]
+    usernames = [username for username in usernames if username]
+    
+    if not usernames:
+        raise HTTPException(status_code=400, detail="No usernames given")
+    
+    if len(usernames) > SCRAPE_BATCH_MAX_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {SCRAPE_BATCH_MAX_SIZE} usernames per batch")
+    
+    try:
+        # Start Celery tasks
+        batch = start_batch(usernames, request.num_posts)
+        
+        # Return batch ID
+        return {
+            "batch_id": batch["batch_id"],
+            "status": "PROCESSING",
+            "total": len(batch["tasks"]),
+            "tasks": batch["tasks"],
+            "message": f"Batch started to retrieve posts from {len(batch['tasks'])} accounts"
+        }
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/scrape/batch/{batch_id}", response_model=Dict[str, Any])
+async def get_batch_status(batch_id: str):
+    """Get aggregate progress of a batch"""
+    progress = get_batch_progress(batch_id)
+    
+    if progress is None:
+        raise HTTPException(status_code=404, detail=f"Batch with ID {batch_id} not found")
+    
+    return progress
+
 @app.post("/scrape/{username}", response_model=Dict[str, Any])
 async def scrape_posts(username: str, num_posts: Optional[int] = 10, db: Session = Depends(get_db), background_tasks: BackgroundTasks = None):
     try:
-        # Start Celery task
-        celery_task = scrape_instagram.delay(username, num_posts)
-        task_id = celery_task.id
+        # One scrape per account at a time: attach to the running one. The lock
+        # covers the queue wait and a redelivery of the message, the task shortens
+        # it to SCRAPE_LOCK_TTL once it runs
+        task_id = str(uuid.uuid4())
+        holder = await asyncio.to_thread(scrape_lock.acquire, username, task_id, SCRAPE_QUEUE_TIMEOUT + visibility_timeout)
+        if holder != task_id:
+            return {
+                "task_id": holder,
+                "status": "PROCESSING",
+                "message": f"Scraping of {username} is already in progress"
+            }
         
-        # Save task information for backward compatibility
-        celery_tasks[task_id] = {
-            "status": "STARTED",
-            "created_at": datetime.now(),
-            "completed_at": None,
-            "result": None
-        }
+        # Result backend doesn't know the task until a worker starts it
+        await asyncio.to_thread(save_task, task_id, task_record("PROCESSING", datetime.now().isoformat()))
+        
+        # Start Celery task (the task releases the lock when it's done, or when
+        # it's dropped after waiting longer than SCRAPE_QUEUE_TIMEOUT)
+        try:
+            scrape_instagram.apply_async((username, num_posts), task_id=task_id, expires=SCRAPE_QUEUE_TIMEOUT)
+        except Exception:
+            await asyncio.to_thread(scrape_lock.release, username, task_id)
+            raise
         
         # Return task ID
         return {
@@ -110,58 +235,207 @@ async def scrape_posts(username: str, num_posts: Optional[int] = 10, db: Session
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def task_record(status, created_at, result=None):
+    """
+    Create record of a task started by the API (same fields as get_task_result)
+    
+    Args:
+        status (str): Task status
+        created_at (str): Start time of the task (ISO format)
+        result: Task result
+    
+    Returns:
+        dict: Task record
+    """
+    return {
+        "status": status,
+        "created_at": created_at,
+        "completed_at": None if status in ("PROCESSING", "STARTED") else datetime.now().isoformat(),
+        "result": result,
+        "progress": None
+    }
+
+def run_manual_scrape(username, num_posts, cancel_event):
+    """
+    Scrape and save posts (runs in manual_scrape_executor)
+    
+    Args:
+        username (str): Instagram username
+        num_posts (int): Maximum number of posts
+        cancel_event (threading.Event): Stops scraping before the next request once set
+    
+    Returns:
+        list: Saved posts
+    """
+    scraper = InstagramScraper(cancel_event=cancel_event)
+    db = SessionLocal()
+    
+    try:
+        # Save posts page by page
+        saved_posts = []
+        for page in scraper.iter_pages(username, num_posts):
+            saved_posts.extend(save_posts(db, page, username))
+            db.commit()
+        
+        return saved_posts
+    
+    finally:
+        db.close()
+
+async def wait_for_disconnect(request):
+    """Return once the client has closed the connection"""
+    while not await request.is_disconnected():
+        await asyncio.sleep(0.5)
+
+async def wait_for_task(task_id, request, db):
+    """
+    Wait for a running scrape task to finish (manual scrape attached to it)
+    
+    Args:
+        task_id (str): Task ID
+        request (Request): Request of the waiting client
+        db (AsyncSession): Database session
+    
+    Returns:
+        dict: Final task status (see load_task_status), None if the task is unknown
+    """
+    deadline = time.monotonic() + MANUAL_SCRAPE_TIMEOUT
+    
+    while True:
+        status = await load_task_status(task_id, True, db)
+        if status is None or status["status"] not in ("PROCESSING", "STARTED"):
+            return status
+        
+        if await request.is_disconnected():
+            raise HTTPException(status_code=499, detail="Client disconnected")
+        
+        if time.monotonic() >= deadline:
+            raise HTTPException(status_code=504, detail=f"Task {task_id} took longer than {MANUAL_SCRAPE_TIMEOUT} seconds")
+        
+        await asyncio.sleep(TASK_STREAM_POLL_INTERVAL)
+
+def task_posts(status):
+    """
+    Get posts saved by a finished scrape task
+    
+    Args:
+        status (dict): Task status (see load_task_status)
+    
+    Returns:
+        list: Saved posts (HTTP 500 if the scrape failed)
+    """
+    result = status["result"]
+    if status["status"] == "SUCCESS" and isinstance(result, dict):
+        if result.get("status") == "SUCCESS":
+            return result["result"]
+        
+        # Account was being scraped by yet another task
+        if result.get("status") == "SKIPPED":
+            return []
+    
+    # Error of the scrape inside a Celery result
+    if isinstance(result, dict) and isinstance(result.get("result"), dict):
+        result = result["result"]
+    error = result.get("error") if isinstance(result, dict) else None
+    
+    raise HTTPException(status_code=500, detail=error or f"Task {status['task_id']} ended with status {status['status']}")
+
 @app.post("/scrape/manual/{username}", response_model=Dict[str, Any])
-async def scrape_posts_manual(username: str, num_posts: Optional[int] = 10, db: Session = Depends(get_db)):
+async def scrape_posts_manual(
+    username: str,
+    request: Request,
+    num_posts: Optional[int] = 10,
+    db: AsyncSession = Depends(get_async_db)
+):
     """Manual start of the scraping task without Celery (for compatibility)"""
-    try:
-        # Create task ID
-        task_id = str(uuid.uuid4())
-        celery_tasks[task_id] = {
-            "status": "STARTED",
-            "created_at": datetime.now(),
-            "completed_at": None,
-            "result": None
+    # Create task ID
+    task_id = str(uuid.uuid4())
+    
+    # One scrape per account at a time: wait for the running one and return its posts
+    holder = await asyncio.to_thread(scrape_lock.acquire, username, task_id)
+    if holder != task_id:
+        status = await wait_for_task(holder, request, db)
+        if status is None:
+            raise HTTPException(status_code=409, detail=f"Scraping of {username} is already in progress")
+        
+        posts = task_posts(status)
+        return {
+            "task_id": holder,
+            "status": "SUCCESS",
+            "posts": posts,
+            "message": f"Successfully retrieved {len(posts)} posts from {username} (scraped by task {holder})"
         }
+    
+    return await run_manual_scrape_task(task_id, username, request, num_posts)
+
+def run_locked_manual_scrape(task_id, username, num_posts, cancel_event):
+    """
+    Run manual scrape, then release the account lock of task_id (runs in manual_scrape_executor)
+    
+    The lock is held until the scrape has really stopped: after a timeout or
+    a disconnect the scrape only stops before its next request.
+    """
+    try:
+        return run_manual_scrape(username, num_posts, cancel_event)
+    finally:
+        scrape_lock.release(username, task_id)
+
+async def run_manual_scrape_task(task_id, username, request, num_posts):
+    """
+    Run manual scrape with timeout and cancellation, record it in task storage
+    
+    Takes over the account lock acquired for task_id: it's released by the
+    scrape thread when it's done.
+    """
+    created_at = datetime.now().isoformat()
+    try:
+        await asyncio.to_thread(save_task, task_id, task_record("STARTED", created_at))
+    except Exception:
+        await asyncio.to_thread(scrape_lock.release, username, task_id)
+        raise
+    
+    # Scrape in a worker thread, stop it on timeout or when the client goes away
+    cancel_event = threading.Event()
+    future = manual_scrape_executor.submit(run_locked_manual_scrape, task_id, username, num_posts, cancel_event)
+    scrape = asyncio.wrap_future(future)
+    disconnect = asyncio.ensure_future(wait_for_disconnect(request))
+    
+    try:
+        await asyncio.wait({scrape, disconnect}, timeout=MANUAL_SCRAPE_TIMEOUT, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        disconnect.cancel()
+    
+    if not scrape.done():
+        # Running: stops before its next request and releases the lock then
+        cancel_event.set()
         
-        # Create scraper instance and get posts
-        scraper = InstagramScraper()
-        posts = scraper.get_posts(username, num_posts)
+        # Not started yet: dropped from the queue, so the lock is released here
+        if future.cancel():
+            await asyncio.to_thread(scrape_lock.release, username, task_id)
+        scrape.cancel()
         
-        # Save posts to database
-        saved_posts = []
-        for post_data in posts:
-            db_post = Post(
-                url=post_data["url"],
-                text=post_data["text"],
-                title=post_data.get("title", ""),
-                likes=post_data["likes"],
-                comments=post_data.get("comments", "0"),
-                hashtags=json.dumps(post_data["hashtags"]),
-                timestamp=datetime.fromisoformat(post_data["timestamp"]),
-                username=username
-            )
-            db.add(db_post)
-            db.flush()  # Ensure ID is generated
-            
-            # Create new object for response with unchanged hashtags
-            response_post = {
-                "url": db_post.url,
-                "text": db_post.text,
-                "title": db_post.title,
-                "likes": db_post.likes,
-                "comments": db_post.comments,
-                "hashtags": post_data["hashtags"],  # Use original hashtags
-                "timestamp": db_post.timestamp,
-                "username": db_post.username
-            }
-            saved_posts.append(response_post)
+        client_gone = disconnect.done() and not disconnect.cancelled()
+        await asyncio.to_thread(save_task, task_id, task_record(
+            "CANCELLED" if client_gone else "FAILURE", created_at,
+            {"error": "Client disconnected" if client_gone else "Timeout"}
+        ))
         
-        db.commit()
+        if client_gone:
+            logger.info(f"Client disconnected, manual scraping of @{username} cancelled")
+            raise HTTPException(status_code=499, detail="Client disconnected")
         
-        # Update task status
-        celery_tasks[task_id]["status"] = "SUCCESS"
-        celery_tasks[task_id]["completed_at"] = datetime.now()
-        celery_tasks[task_id]["result"] = saved_posts
+        raise HTTPException(status_code=504, detail=f"Scraping of {username} took longer than {MANUAL_SCRAPE_TIMEOUT} seconds")
+    
+    try:
+        saved_posts = scrape.result()
+        
+        # Update task status (result shaped like the one of a Celery scrape)
+        await asyncio.to_thread(save_task, task_id, task_record("SUCCESS", created_at, {
+            "status": "SUCCESS",
+            "created_at": created_at,
+            "completed_at": datetime.now().isoformat(),
+            "result": make_result(saved_posts, username)
+        }))
         
         # Return task ID and result
         return {
@@ -173,122 +447,296 @@ async def scrape_posts_manual(username: str, num_posts: Optional[int] = 10, db:
         
     except Exception as e:
         # In case of error, also record it in the task storage
-        if 'task_id' in locals():
-            celery_tasks[task_id]["status"] = "FAILURE"
-            celery_tasks[task_id]["completed_at"] = datetime.now()
-            celery_tasks[task_id]["result"] = {"error": str(e)}
-            
+        await asyncio.to_thread(save_task, task_id, task_record("FAILURE", created_at, {"error": str(e)}))
+        
         raise HTTPException(status_code=500, detail=str(e))
 
+# Declared before /posts/{username}, which would match "search" too
+@app.get("/posts/search", response_model=List[SearchResult])
+async def search_posts_full_text(
+    q: str = Query(..., min_length=2),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Full-text search in post titles and captions, best match first"""
+    # Shared query code runs on the async connection
+    results = await db.run_sync(search_posts, q, limit, offset)
+    
+    return [dict(post_to_dict(post), rank=rank) for post, rank in results]
+
 @app.get("/posts/{username}", response_model=List[PostBase])
-async def get_posts(username: str, db: Session = Depends(get_db)):
-    db_posts = db.query(Post).filter(Post.username == username).all()
-    
-    # Create list of objects for response
-    result = []
-    for post in db_posts:
-        result.append({
-            "url": post.url,
-            "text": post.text,
-            "title": post.title,
-            "likes": post.likes,
-            "comments": post.comments,
-            "hashtags": json.loads(post.hashtags),  # Convert JSON string to list
-            "timestamp": post.timestamp,
-            "username": post.username
-        })
-    
-    return result
+async def get_posts(
+    username: str,
+    response: Response,
+    limit: int = Query(50, ge=1, le=500),
+    before: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get posts of a user, newest first (cursor of the next page in X-Next-Cursor header)"""
+    try:
+        db_posts, next_cursor = await db.run_sync(get_user_posts, username, limit, before)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # Pass ?before=<cursor> to get the next page
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    
+    return [post_to_dict(post) for post in db_posts]
 
 @app.get("/posts/hashtag/{hashtag}", response_model=List[PostBase])
-async def get_posts_by_hashtag(hashtag: str, db: Session = Depends(get_db)):
-    # Add # at the beginning if it's missing
-    if not hashtag.startswith('#'):
-        hashtag = f"#{hashtag}"
-    
-    # Get all posts
-    all_posts = db.query(Post).all()
-    
-    # Filter posts containing the specified hashtag
-    result = []
-    for post in all_posts:
-        hashtags_list = json.loads(post.hashtags)
-        if hashtag in hashtags_list:
-            result.append({
-                "url": post.url,
-                "text": post.text,
-                "title": post.title,
-                "likes": post.likes,
-                "comments": post.comments,
-                "hashtags": hashtags_list,
-                "timestamp": post.timestamp,
-                "username": post.username
-            })
-    
-    return result
+async def get_posts_by_hashtag(
+    hashtag: str,
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    db: AsyncSession = Depends(get_async_db)
+):
+    # Get one page of posts with the hashtag using the hashtag index
+    db_posts = await db.run_sync(get_hashtag_posts, hashtag, limit, offset)
+    
+    return [post_to_dict(post) for post in db_posts]
 
 @app.get("/posts/title/search", response_model=List[PostBase])
-async def search_posts_by_title(query: str = Query(..., min_length=2), db: Session = Depends(get_db)):
-    # Get all posts containing the specified string in the title
-    posts = db.query(Post).filter(Post.title.contains(query)).all()
-    
-    # Create list of objects for response
-    result = []
-    for post in posts:
-        result.append({
-            "url": post.url,
-            "text": post.text,
-            "title": post.title,
-            "likes": post.likes,
-            "comments": post.comments,
-            "hashtags": json.loads(post.hashtags),  # Convert JSON string to list
-            "timestamp": post.timestamp,
-            "username": post.username
-        })
-    
-    return result
+async def search_posts_by_title(
+    query: str = Query(..., min_length=2),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    db: AsyncSession = Depends(get_async_db)
+):
+    # Same full-text search as /posts/search (kept for compatibility)
+    return await search_posts_full_text(query, limit, offset, db)
 
-@app.get("/tasks/{task_id}", response_model=Dict[str, Any])
-async def get_task_status(task_id: str):
-    # First check in Celery tasks
-    celery_result = get_task_result(task_id)
-    if celery_result:
-        return {
-            "task_id": task_id,
-            "status": celery_result["status"],
-            "result": celery_result["result"],
-            "created_at": celery_result["created_at"],
-            "completed_at": celery_result["completed_at"]
-        }
+@app.get("/analytics/top-posts", response_model=List[PostBase])
+async def get_top_posts_analytics(
+    limit: int = Query(10, ge=1, le=100),
+    username: Optional[str] = None,
+    days: Optional[int] = Query(None, ge=1),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Most liked posts, optionally of one user or of the last days"""
+    db_posts = await db.run_sync(get_top_posts, limit, username, days)
     
-    # Then check in local task storage
-    if task_id in celery_tasks:
-        task_info = celery_tasks[task_id]
-        return {
-            "task_id": task_id,
-            "status": task_info["status"],
-            "result": task_info["result"],
-            "created_at": task_info["created_at"],
-            "completed_at": task_info["completed_at"]
-        }
+    return [post_to_dict(post) for post in db_posts]
+
+@app.get("/analytics/engagement/daily", response_model=List[DailyEngagement])
+async def get_daily_engagement_analytics(
+    days: int = Query(30, ge=1, le=365),
+    username: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Posts, likes and comments per user per day (aggregated in the database)"""
+    rows = await db.run_sync(get_daily_engagement, days, username)
+    
+    return [row._asdict() for row in rows]
+
+@app.get("/analytics/hashtags", response_model=List[HashtagEngagement])
+async def get_hashtag_engagement_analytics(
+    limit: int = Query(20, ge=1, le=100),
+    min_posts: int = Query(1, ge=1),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Average likes and comments per hashtag (aggregated in the database)"""
+    rows = await db.run_sync(get_hashtag_engagement, limit, min_posts)
+    
+    return [row._asdict() for row in rows]
+
+async def load_task_status(task_id, include_posts, db):
+    """
+    Get status of a scraping task
+    
+    Args:
+        task_id (str): Task ID
+        include_posts (bool): Load posts of compact results from the database
+        db (AsyncSession): Database session
+    
+    Returns:
+        dict: Task status or None if the task is unknown
+    """
+    # First check in Celery tasks (storage is read off the event loop)
+    task_info = await asyncio.to_thread(get_task_result, task_id)
+    
+    # Then in task records of the API (queued Celery tasks and manual scrapes)
+    if task_info is None:
+        task_info = await asyncio.to_thread(load_task, task_id)
+    
+    if task_info is None:
+        return None
+    
+    result = task_info["result"]
+    
+    # Compact task results only have post IDs: load the posts from the database
+    if include_posts and isinstance(result, dict) and is_compact_result(result.get("result")):
+        compact = result["result"]
+        db_posts = await db.run_sync(get_posts_by_ids, compact["post_ids"])
+        result = dict(
+            result,
+            result=[dict(post_to_dict(post), id=post.id) for post in db_posts],
+            count=compact["count"],
+            cursor=compact["cursor"]
+        )
+    
+    return {
+        "task_id": task_id,
+        "status": task_info["status"],
+        "result": result,
+        "progress": task_info.get("progress"),
+        "created_at": task_info["created_at"],
+        "completed_at": task_info["completed_at"]
+    }
+
+@app.get("/tasks/{task_id}", response_model=Dict[str, Any])
+async def get_task_status(
+    task_id: str,
+    include_posts: bool = True,
+    db: AsyncSession = Depends(get_async_db)
+):
+    status = await load_task_status(task_id, include_posts, db)
     
     # If task not found
-    raise HTTPException(status_code=404, detail=f"Task with ID {task_id} not found")
+    if status is None:
+        raise HTTPException(status_code=404, detail=f"Task with ID {task_id} not found")
+    
+    return status
+
+def sse_event(event, data):
+    """Format Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+async def subscribe_task_updates(task_id):
+    """
+    Subscribe to state updates the Redis result backend publishes for a task
+    
+    Returns:
+        PubSub: Subscription or None if the result backend is not Redis or not available
+    """
+    if not result_backend.startswith(("redis://", "rediss://")):
+        return None
+    
+    client = redis_asyncio.from_url(result_backend, socket_connect_timeout=1, decode_responses=True)
+    pubsub = client.pubsub()
+    try:
+        # Channel of the result key (Celery publishes every stored state to it)
+        await pubsub.subscribe(f"celery-task-meta-{task_id}")
+        return pubsub
+    except Exception as e:
+        logger.warning(f"Redis pub/sub is not available, polling task {task_id}: {str(e)}")
+        await pubsub.aclose()
+        await pubsub.connection_pool.disconnect()
+        return None
+
+async def stream_task_events(task_id, include_posts, db):
+    """Yield progress events of a task as they are published, then its final result"""
+    # Subscribe before reading the current state, so no update is missed in between
+    pubsub = await subscribe_task_updates(task_id)
+    
+    deadline = time.monotonic() + TASK_STREAM_TIMEOUT
+    last_sent = time.monotonic()
+    progress = None
+    sent_progress = None
+    
+    try:
+        while True:
+            # Read state from the backend only when it's not in the update itself
+            if progress is None:
+                status = await load_task_status(task_id, include_posts, db)
+                
+                if status is None:
+                    yield sse_event("error", {"task_id": task_id, "detail": f"Task with ID {task_id} not found"})
+                    return
+                
+                if status["status"] not in ("PROCESSING", "STARTED"):
+                    yield sse_event("result", status)
+                    return
+                
+                progress = status["progress"]
+            
+            if progress and progress != sent_progress:
+                yield sse_event("progress", dict(progress, task_id=task_id))
+                sent_progress = progress
+                last_sent = time.monotonic()
+            
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                yield sse_event("timeout", {"task_id": task_id, "detail": "Task is still running, request the stream again"})
+                return
+            
+            # Wait for the next update
+            progress = None
+            if pubsub is not None:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=min(remaining, TASK_STREAM_HEARTBEAT))
+                if message is not None:
+                    meta = json.loads(message["data"])
+                    if meta.get("status") == "PROGRESS":
+                        progress = meta.get("result")
+            else:
+                await asyncio.sleep(min(remaining, TASK_STREAM_POLL_INTERVAL))
+            
+            # Keep connection open through proxies
+            if time.monotonic() - last_sent >= TASK_STREAM_HEARTBEAT:
+                yield ": keep-alive\n\n"
+                last_sent = time.monotonic()
+    
+    finally:
+        if pubsub is not None:
+            await pubsub.aclose()
+            await pubsub.connection_pool.disconnect()
+
+@app.get("/tasks/{task_id}/stream")
+async def stream_task_status(
+    task_id: str,
+    include_posts: bool = True,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Push progress of a scraping task and its final result as Server-Sent Events"""
+    # Unknown or expired task: answer right away instead of streaming until the timeout
+    if await load_task_status(task_id, False, db) is None:
+        raise HTTPException(status_code=404, detail=f"Task with ID {task_id} not found")
+    
+    return StreamingResponse(
+        stream_task_events(task_id, include_posts, db),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @app.get("/schedule")
-async def get_schedule():
-    """Get information about scheduled periodic tasks"""
+async def get_scrape_schedule(db: AsyncSession = Depends(get_async_db)):
+    """Get current plan of periodic scraping (tracked accounts, next scrape first)"""
+    accounts = await db.run_sync(get_schedule)
+    
     return {
-        "scheduled_tasks": [
-            {
-                "name": "scrape-instagram-every-10-minutes",
-                "task": "tasks.scrape_instagram_periodic",
-                "schedule": "every 10 minutes",
-                "args": ["nasa", 10]
-            }
-        ]
+        "scheduler": {
+            "task": "tasks.schedule_due_scrapes",
+            "every_seconds": schedule_tick,
+            "batch_size": SCHEDULE_BATCH_SIZE,
+            "min_interval": SCHEDULE_MIN_INTERVAL,
+            "max_interval": SCHEDULE_MAX_INTERVAL
+        },
+        "due": sum(1 for account in accounts if account["due"]),
+        "accounts": accounts
     }
 
+@app.post("/schedule/accounts", response_model=Dict[str, Any])
+async def add_tracked_account(request: TrackAccountRequest, db: AsyncSession = Depends(get_async_db)):
+    """Scrape account periodically (first scrape at the next scheduler run)"""
+    username = request.username.strip().lstrip('@')
+    if not username:
+        raise HTTPException(status_code=400, detail="No username given")
+    
+    await db.run_sync(track_account, username, request.num_posts)
+    await db.commit()
+    
+    return {"username": username, "num_posts": request.num_posts, "message": f"{username} is tracked"}
+
+@app.delete("/schedule/accounts/{username}", response_model=Dict[str, Any])
+async def remove_tracked_account(username: str, db: AsyncSession = Depends(get_async_db)):
+    """Stop scraping account periodically"""
+    if not await db.run_sync(untrack_account, username):
+        raise HTTPException(status_code=404, detail=f"Account {username} is not tracked")
+    await db.commit()
+    
+    return {"username": username, "message": f"{username} is no longer tracked"}
+
 # News analysis endpoints
 @app.get("/news/sources")
 async def get_news_sources():
@@ -298,7 +746,8 @@ async def get_news_sources():
 @app.get("/news/rss/{source}", response_model=List[NewsItem])
 async def get_news(source: str = "bbc", limit: int = Query(5, ge=1, le=20)):
     """Get news from RSS feed"""
-    news = news_fetcher.get_news_from_rss(source, limit)
+    # Fetcher waits for the rate limiter with time.sleep: keep it off the event loop
+    news = await asyncio.to_thread(news_fetcher.get_news_from_rss, source, limit)
     if not news:
         raise HTTPException(status_code=404, detail=f"Could not get news from source {source}")
     return news
@@ -333,8 +782,8 @@ async def analyze_news_text(text: str = Form(...)):
 @app.get("/news/analyze/rss/{source}/{index}")
 async def analyze_news_from_rss(source: str, index: int):
     try:
-        # Get news from source
-        news_items = news_fetcher.get_news_from_rss(source)
+        # Get news from source (off the event loop, see get_news)
+        news_items = await asyncio.to_thread(news_fetcher.get_news_from_rss, source)
         
         if index < 0 or index >= len(news_items):
             return JSONResponse(status_code=404, content={"error": "News item not found"})
@@ -0,0 +1,151 @@
+import logging
+import os
+import threading
+import time
+
+from redis_client import get_redis
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Circuit breaker settings
+SCRAPER_BREAKER_THRESHOLD = int(os.getenv("SCRAPER_BREAKER_THRESHOLD", "5"))  # Consecutive failures to skip a method
+SCRAPER_BREAKER_COOLDOWN = int(os.getenv("SCRAPER_BREAKER_COOLDOWN", "600"))  # Seconds to skip a failing method
+
+# Weight of the latest result in success rate and latency averages
+STATS_SMOOTHING = 0.2
+
+class MethodStats:
+    """
+    Success rate and latency of scraping methods with a circuit breaker per method
+    
+    Stats are kept in Redis so all worker processes share them
+    (in-process if Redis is not available).
+    """
+    
+    def __init__(self, threshold=SCRAPER_BREAKER_THRESHOLD, cooldown=SCRAPER_BREAKER_COOLDOWN, redis_getter=get_redis):
+        """
+        Initialize stats
+        
+        Args:
+            threshold (int): Number of consecutive failures that opens the breaker
+            cooldown (int): Seconds a method is skipped after the breaker opens
+            redis_getter (callable): Returns Redis client or None
+        """
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.redis_getter = redis_getter
+        
+        # In-process fallback storage: method -> stats
+        self._local = {}
+        self._lock = threading.Lock()
+    
+    def get(self, method):
+        """
+        Get stats of a method
+        
+        Returns:
+            dict: success_rate, latency (None if never measured), failures
+                (consecutive), open_until (timestamp)
+        """
+        stats = {"success_rate": 1.0, "latency": None, "failures": 0, "open_until": 0.0}
+        
+        client = self.redis_getter()
+        if client is not None:
+            try:
+                stored = client.hgetall(self._key(method))
+                for field, value in stored.items():
+                    stats[field] = int(value) if field == "failures" else float(value)
+                return stats
+            except Exception as e:
+                logger.warning(f"Error reading method stats from Redis: {str(e)}")
+        
+        with self._lock:
+            stats.update(self._local.get(method, {}))
+        
+        return stats
+    
+    def record(self, method, success, latency):
+        """
+        Record result of a method call
+        
+        Args:
+            method (str): Method name
+            success (bool): Whether the method returned data
+            latency (float): Call duration in seconds
+        """
+        # Read-modify-write: concurrent updates may overwrite each other,
+        # which is fine for averages used as a heuristic
+        stats = self.get(method)
+        
+        stats["success_rate"] += STATS_SMOOTHING * ((1.0 if success else 0.0) - stats["success_rate"])
+        if stats["latency"] is None:
+            stats["latency"] = latency
+        else:
+            stats["latency"] += STATS_SMOOTHING * (latency - stats["latency"])
+        
+        if success:
+            stats["failures"] = 0
+            stats["open_until"] = 0.0
+        else:
+            stats["failures"] += 1
+            # Open the breaker (again, if a trial call after cool-down failed too)
+            if stats["failures"] >= self.threshold:
+                stats["open_until"] = time.time() + self.cooldown
+                logger.warning(f"Method {method} failed {stats['failures']} times in a row, "
+                               f"skipping it for {self.cooldown} seconds")
+        
+        client = self.redis_getter()
+        if client is not None:
+            try:
+                client.hset(self._key(method), mapping=stats)
+                return
+            except Exception as e:
+                logger.warning(f"Error saving method stats to Redis: {str(e)}")
+        
+        with self._lock:
+            self._local[method] = stats
+    
+    def is_open(self, method):
+        """Check if method is currently skipped by the circuit breaker"""
+        return self.get(method)["open_until"] > time.time()
+    
+    def order(self, methods):
+        """
+        Order methods from best to worst, skipping methods with open breaker
+        
+        If all breakers are open, the method whose breaker closes first is
+        returned as a trial call (half-open), so scraping isn't blocked
+        for the whole cool-down.
+        
+        Args:
+            methods (list): Method names in default order
+        
+        Returns:
+            list: Method names to try
+        """
+        available = []
+        skipped = []
+        for method in methods:
+            stats = self.get(method)
+            if stats["open_until"] > time.time():
+                skipped.append((stats["open_until"], method))
+                continue
+            
+            # Higher success rate first, then lower latency; methods never
+            # measured keep default order after measured ones
+            latency = stats["latency"] if stats["latency"] is not None else float("inf")
+            available.append(((-round(stats["success_rate"], 1), latency), method))
+        
+        if not available and skipped:
+            return [min(skipped, key=lambda item: item[0])[1]]
+        
+        available.sort(key=lambda item: item[0])
+        return [method for _, method in available]
+    
+    def _key(self, method):
+        """Redis key for method stats"""
+        return f"instagram:method_stats:{method}"
+
+# Stats shared by all scrapers in the process
+method_stats = MethodStats()
@@ -0,0 +1,88 @@
+"""
+Engagement columns migration script
+Converts likes and comments of posts from text to integer columns
+Run this script once on an existing database (safe to run again)
+"""
+
+from sqlalchemy import inspect, text, Integer
+import logging
+
+from models import engine, init_db, Post
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Counts that aren't numbers (e.g. empty strings) become 0
+POSTGRES_ALTER_COLUMN = (
+    "ALTER TABLE posts ALTER COLUMN {column} TYPE INTEGER "
+    "USING COALESCE(NULLIF(regexp_replace({column}, '[^0-9]', '', 'g'), '')::integer, 0)"
+)
+
+def engagement_columns_are_integers():
+    """Check if likes and comments columns already store integers"""
+    columns = {column["name"]: column["type"] for column in inspect(engine).get_columns("posts")}
+    return all(isinstance(columns[name], Integer) for name in ("likes", "comments"))
+
+def migrate_postgres():
+    """Change column types in place"""
+    with engine.begin() as connection:
+        for column in ("likes", "comments"):
+            connection.execute(text(POSTGRES_ALTER_COLUMN.format(column=column)))
+
+def migrate_sqlite():
+    """Rebuild posts table (SQLite can't change column types)"""
+    old_columns = [column["name"] for column in inspect(engine).get_columns("posts")]
+    columns = [column.name for column in Post.__table__.columns if column.name in old_columns]
+    
+    # Copy of a column, likes and comments converted to integers
+    values = [
+        f"COALESCE(CAST({name} AS INTEGER), 0)" if name in ("likes", "comments") else name
+        for name in columns
+    ]
+    
+    # Explicit transaction: the table is rebuilt completely or not at all
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(text("BEGIN"))
+        try:
+            # Full-text index triggers belong to the old table, init_db creates them again
+            connection.execute(text("DROP TABLE IF EXISTS posts_fts"))
+            
+            connection.execute(text("CREATE TABLE posts_old AS SELECT * FROM posts"))
+            connection.execute(text("DROP TABLE posts"))
+            
+            # New table with all indexes of the model
+            Post.__table__.create(bind=connection)
+            
+            connection.execute(text(
+                f"INSERT INTO posts ({', '.join(columns)}) SELECT {', '.join(values)} FROM posts_old"
+            ))
+            connection.execute(text("DROP TABLE posts_old"))
+            connection.execute(text("COMMIT"))
+        except Exception:
+            connection.execute(text("ROLLBACK"))
+            raise
+
+def migrate_engagement():
+    """Store likes and comments of posts as integers"""
+    
+    logger.info("Starting engagement columns migration")
+    
+    if not inspect(engine).has_table("posts"):
+        logger.info("No posts table, it's created with integer columns")
+    elif engagement_columns_are_integers():
+        logger.info("Likes and comments are already integers")
+    elif engine.dialect.name == "postgresql":
+        migrate_postgres()
+    elif engine.dialect.name == "sqlite":
+        migrate_sqlite()
+    else:
+        raise RuntimeError(f"Unsupported database: {engine.dialect.name}")
+    
+    # Indexes used by analytics (and the full-text index removed on SQLite)
+    init_db()
+    
+    logger.info("Engagement columns migration complete")
+
+if __name__ == "__main__":
+    migrate_engagement()
@@ -1,7 +1,14 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime
+from sqlalchemy import create_engine, event, inspect, text, Column, Integer, String, Text, DateTime, Float, Boolean, ForeignKey, Index
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+import logging
 import os
+import threading
+
+# Setup logging
+logger = logging.getLogger(__name__)
 
 # Get database URL from environment variable or use SQLite as fallback
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///instagram_posts.db")
@@ -11,8 +18,60 @@ DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///instagram_posts.db")
 if DATABASE_URL.startswith("postgres://"):
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
+# Connection pool settings (server databases; SQLite connections are local files)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))  # Connections kept open per process
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))  # Extra connections opened under load
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # Seconds before a connection is replaced
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"  # Check connection before use
+
+# SQLite settings: WAL lets readers (API) and a writer (worker) work at the same time
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000"))  # Milliseconds to wait for a lock
+
+def get_engine_options(url):
+    """Get create_engine options for database URL"""
+    url = make_url(url)
+    
+    # In-memory SQLite uses a single connection, file SQLite the default pool
+    if url.get_backend_name() == "sqlite":
+        return {}
+    
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING
+    }
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Configure each new SQLite connection"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}")
+    cursor.close()
+
+def create_db_engine(url=DATABASE_URL, **options):
+    """
+    Create database engine with pool settings from environment
+    
+    Args:
+        url (str): Database URL
+        **options: Additional create_engine options (override the defaults)
+    
+    Returns:
+        Engine: Database engine
+    """
+    engine = create_engine(url, **{**get_engine_options(url), **options})
+    
+    if engine.dialect.name == "sqlite":
+        event.listen(engine, "connect", set_sqlite_pragmas)
+    
+    return engine
+
 # Create database engine
-engine = create_engine(DATABASE_URL)
+engine = create_db_engine()
 
 # Create declarative base
 Base = declarative_base()
@@ -20,19 +79,202 @@ Base = declarative_base()
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async drivers used by the API (Celery tasks keep the sync engine)
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg"
+}
+
+def get_async_url(url):
+    """Get URL of the same database for its async driver"""
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername))
+
+def create_async_db_engine(url=DATABASE_URL, **options):
+    """Create async database engine with the same settings as create_db_engine"""
+    async_url = get_async_url(url)
+    async_engine = create_async_engine(async_url, **{**get_engine_options(async_url), **options})
+    
+    if async_engine.dialect.name == "sqlite":
+        event.listen(async_engine.sync_engine, "connect", set_sqlite_pragmas)
+    
+    return async_engine
+
+# Create async database engine and session factory
+async_engine = create_async_db_engine()
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 class Post(Base):
     """Instagram post model"""
     __tablename__ = "posts"
     
     id = Column(Integer, primary_key=True, index=True)
+    shortcode = Column(String, unique=True, index=True)  # Post key on Instagram (posts are upserted by it)
     url = Column(String, index=True)
     text = Column(Text)
     title = Column(String)
-    likes = Column(String)
-    comments = Column(String)
+    likes = Column(Integer, default=0)
+    comments = Column(Integer, default=0)
     hashtags = Column(Text)  # Stored as JSON string
     timestamp = Column(DateTime)
     username = Column(String, index=True)
 
-# Create tables
-Base.metadata.create_all(bind=engine) 
\ No newline at end of file
+# Newest posts of a user first (keyset pagination of /posts/{username})
+posts_username_timestamp_index = Index(
+    "ix_posts_username_timestamp", Post.username, Post.timestamp.desc(), Post.id.desc()
+)
+
+# Most liked posts first (top posts analytics)
+posts_likes_index = Index("ix_posts_likes", Post.likes.desc(), Post.id.desc())
+
+class PostHashtag(Base):
+    """Hashtag of a post (normalized copy of Post.hashtags for indexed search)"""
+    __tablename__ = "post_hashtags"
+    
+    # Primary key (hashtag, post_id) is the index used to find posts by hashtag
+    hashtag = Column(String, primary_key=True)  # Lowercase, without #
+    post_id = Column(Integer, ForeignKey("posts.id", ondelete="CASCADE"), primary_key=True, index=True)
+
+class ScrapeWatermark(Base):
+    """Newest post seen for an Instagram account (used for incremental scraping)"""
+    __tablename__ = "scrape_watermarks"
+    
+    username = Column(String, primary_key=True)
+    shortcode = Column(String)
+    timestamp = Column(DateTime)
+    updated_at = Column(DateTime)
+
+class TrackedAccount(Base):
+    """Instagram account scraped periodically (polling interval adapts to its posting rate)"""
+    __tablename__ = "tracked_accounts"
+    
+    username = Column(String, primary_key=True)
+    num_posts = Column(Integer, default=10)  # Maximum number of posts per scrape
+    enabled = Column(Boolean, default=True)
+    interval = Column(Integer)  # Seconds between scrapes
+    posts_per_day = Column(Float)  # Observed posting rate
+    next_scrape_at = Column(DateTime, index=True)  # Scheduler dispatches accounts that are due
+    last_scraped_at = Column(DateTime)
+    last_status = Column(String)  # Status of the last scrape task
+    created_at = Column(DateTime)
+
+# Full-text index of post title and caption (kept in sync by the database)
+SQLITE_SEARCH_INDEX_DDL = [
+    # External content table: only the index is stored, text is read from posts
+    "CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5(title, text, content='posts', content_rowid='id')",
+    """CREATE TRIGGER IF NOT EXISTS posts_fts_insert AFTER INSERT ON posts BEGIN
+        INSERT INTO posts_fts(rowid, title, text) VALUES (new.id, new.title, new.text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS posts_fts_delete AFTER DELETE ON posts BEGIN
+        INSERT INTO posts_fts(posts_fts, rowid, title, text) VALUES ('delete', old.id, old.title, old.text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS posts_fts_update AFTER UPDATE OF title, text ON posts BEGIN
+        INSERT INTO posts_fts(posts_fts, rowid, title, text) VALUES ('delete', old.id, old.title, old.text);
+        INSERT INTO posts_fts(rowid, title, text) VALUES (new.id, new.title, new.text);
+    END""",
+    # Index posts stored before the index existed
+    "INSERT INTO posts_fts(posts_fts) VALUES ('rebuild')"
+]
+
+POSTGRES_SEARCH_INDEX_DDL = [
+    # 'simple' configuration: captions are in many languages
+    """ALTER TABLE posts ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(text, '')), 'B')
+    ) STORED""",
+    "CREATE INDEX IF NOT EXISTS ix_posts_search_vector ON posts USING GIN (search_vector)"
+]
+
+def create_search_index(bind):
+    """Create full-text index of posts if it doesn't exist yet"""
+    if bind.dialect.name == "sqlite":
+        if inspect(bind).has_table("posts_fts"):
+            return
+        statements = SQLITE_SEARCH_INDEX_DDL
+    elif bind.dialect.name == "postgresql":
+        if "search_vector" in [column["name"] for column in inspect(bind).get_columns("posts")]:
+            return
+        statements = POSTGRES_SEARCH_INDEX_DDL
+    else:
+        return
+    
+    try:
+        with bind.begin() as connection:
+            for statement in statements:
+                connection.execute(text(statement))
+    except Exception as e:
+        # Search falls back to LIKE (e.g. SQLite built without FTS5)
+        logger.warning(f"Could not create full-text index: {str(e)}")
+
+def check_posts_schema(bind):
+    """
+    Check that an existing posts table has the unique shortcode key and integer engagement columns
+    
+    Posts are upserted by shortcode and analytics sort likes and comments
+    as numbers. Databases created before have to be migrated by
+    compact_db.py and migrate_engagement.py (create_all doesn't change
+    existing tables).
+    
+    Raises:
+        RuntimeError: If shortcode column or its unique index is missing,
+            or likes and comments are not integer columns
+    """
+    inspector = inspect(bind)
+    if not inspector.has_table("posts"):
+        return
+    
+    columns = {column["name"]: column["type"] for column in inspector.get_columns("posts")}
+    unique_keys = [index["column_names"] for index in inspector.get_indexes("posts") if index["unique"]]
+    unique_keys += [constraint["column_names"] for constraint in inspector.get_unique_constraints("posts")]
+    
+    if "shortcode" not in columns or ["shortcode"] not in unique_keys:
+        raise RuntimeError(
+            "Posts table has no unique shortcode key (created by an older version), "
+            "run `python compact_db.py` to migrate the database"
+        )
+    
+    # Text columns would be sorted as text ("9" > "10")
+    if not all(isinstance(columns.get(name, Integer()), Integer) for name in ("likes", "comments")):
+        raise RuntimeError(
+            "Likes and comments of posts are not integer columns (created by an older version), "
+            "run `python migrate_engagement.py` to migrate the database"
+        )
+
+# Databases whose schema was set up by this process
+_initialized_binds = set()
+_init_lock = threading.Lock()
+
+def init_db(bind=None):
+    """
+    Create missing tables and indexes (safe to call more than once)
+    
+    Called once at startup by the API, the Celery worker and the scripts;
+    importing this module doesn't touch the database.
+    
+    Args:
+        bind (Engine): Database engine (default: engine of DATABASE_URL)
+    """
+    bind = bind or engine
+    
+    with _init_lock:
+        if bind in _initialized_binds:
+            return
+        
+        # Existing tables of older versions have to be migrated first
+        check_posts_schema(bind)
+        
+        logger.info("Creating database schema")
+        
+        # Create tables
+        Base.metadata.create_all(bind=bind)
+        create_search_index(bind)
+        
+        # Indexes added after the posts table (create_all doesn't add them to an existing table)
+        posts_username_timestamp_index.create(bind=bind, checkfirst=True)
+        posts_likes_index.create(bind=bind, checkfirst=True)
+        
+        _initialized_binds.add(bind)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    init_db()
@@ -3,6 +3,8 @@ import requests
 from bs4 import BeautifulSoup
 import logging
 
+from rate_limiter import rate_limiter as default_rate_limiter
+
 # Setup logging
 logging.basicConfig(level=logging.INFO, 
                     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -11,8 +13,13 @@ logger = logging.getLogger(__name__)
 class NewsFetcher:
     """Class for retrieving news from RSS feeds of various sources"""
     
-    def __init__(self):
-        """Initialize the class with RSS feed settings"""
+    def __init__(self, rate_limiter=None):
+        """
+        Initialize the class with RSS feed settings
+        
+        Args:
+            rate_limiter (RateLimiter): Request budget per host, shared by all workers by default
+        """
         # Dictionary with URLs of RSS feeds from various news sources
         self.rss_feeds = {
             "bbc": "https://feeds.bbci.co.uk/news/world/rss.xml",
@@ -40,6 +47,9 @@ class NewsFetcher:
         # Setup logging
         self.logger = logging.getLogger(__name__)
         
+        # Throttles requests to each news site
+        self.rate_limiter = rate_limiter or default_rate_limiter
+        
         # User agents for requests
         self.user_agents = [
             "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36",
@@ -74,6 +84,7 @@ class NewsFetcher:
             
             try:
                 self.logger.info(f"Fetching RSS feed from {source}: {feed_url}")
+                self.rate_limiter.acquire(feed_url)
                 response = requests.get(feed_url, headers=headers, timeout=10)
                 
                 if response.status_code != 200:
@@ -82,6 +93,7 @@ class NewsFetcher:
                     if source == "ap":
                         feed_url = "https://storage.googleapis.com/afs-prod/feeds/world.rss.xml"
                         self.logger.info(f"Trying alternative feed for {source}: {feed_url}")
+                        self.rate_limiter.acquire(feed_url)
                         response = requests.get(feed_url, headers=headers, timeout=10)
                 
                 if response.status_code == 200:
@@ -95,6 +107,7 @@ class NewsFetcher:
                 self.logger.error(f"Request exception fetching RSS feed {source}: {str(e)}")
                 # Try directly parsing the URL with feedparser as a fallback
                 self.logger.info(f"Trying feedparser directly for {source}")
+                self.rate_limiter.acquire(feed_url)
                 feed = feedparser.parse(feed_url)
             
             # Check if there are items in the feed
@@ -162,6 +175,7 @@ class NewsFetcher:
                 "Sec-Fetch-Site": "none"
             }
             
+            self.rate_limiter.acquire(url)
             response = requests.get(url, headers=headers, timeout=15)
             
             if response.status_code != 200:
@@ -0,0 +1,188 @@
+from urllib.parse import urlparse
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+
+from redis_client import get_redis
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Request budgets (requests per minute) shared by all workers
+INSTAGRAM_REQUESTS_PER_MINUTE = float(os.getenv("INSTAGRAM_REQUESTS_PER_MINUTE", "30"))
+DEFAULT_HOST_REQUESTS_PER_MINUTE = float(os.getenv("DEFAULT_HOST_REQUESTS_PER_MINUTE", "60"))
+IDENTITY_REQUESTS_PER_MINUTE = float(os.getenv("IDENTITY_REQUESTS_PER_MINUTE", "12"))
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "3"))
+
+# Budgets of hosts that need a different one than the default
+HOST_BUDGETS = {
+    "www.instagram.com": INSTAGRAM_REQUESTS_PER_MINUTE,
+    "instagram.com": INSTAGRAM_REQUESTS_PER_MINUTE
+}
+
+# Takes one token from every bucket or none of them.
+# KEYS: bucket keys, ARGV: rate (tokens per second) and capacity for each key.
+# Returns "0" if tokens were taken, otherwise seconds to wait.
+TOKEN_BUCKET_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local wait = 0
+local tokens = {}
+
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 2 - 1])
+    local capacity = tonumber(ARGV[i * 2])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local available = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    available = math.min(capacity, available + math.max(0, now - ts) * rate)
+    tokens[i] = available
+    if available < 1 then
+        wait = math.max(wait, (1 - available) / rate)
+    end
+end
+
+if wait > 0 then
+    return tostring(wait)
+end
+
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 2 - 1])
+    local capacity = tonumber(ARGV[i * 2])
+    redis.call('HSET', key, 'tokens', tokens[i] - 1, 'ts', now)
+    redis.call('EXPIRE', key, math.ceil(capacity / rate) + 60)
+end
+
+return '0'
+"""
+
+class RateLimiter:
+    """
+    Token bucket rate limiter per target host and per identity
+    
+    Buckets are kept in Redis so the budget is shared by all workers
+    (in-process if Redis is not available), so adding workers doesn't
+    multiply the request rate.
+    """
+    
+    def __init__(self, host_budgets=None, default_rate=DEFAULT_HOST_REQUESTS_PER_MINUTE,
+                 identity_rate=IDENTITY_REQUESTS_PER_MINUTE, burst=RATE_LIMIT_BURST, redis_getter=get_redis):
+        """
+        Initialize rate limiter
+        
+        Args:
+            host_budgets (dict): Requests per minute for specific hosts
+            default_rate (float): Requests per minute for other hosts
+            identity_rate (float): Requests per minute for one identity (cookie set)
+            burst (int): Number of requests that can be made at once (bucket capacity)
+            redis_getter (callable): Returns Redis client or None
+        """
+        self.host_budgets = HOST_BUDGETS if host_budgets is None else host_budgets
+        self.default_rate = default_rate
+        self.identity_rate = identity_rate
+        self.burst = burst
+        self.redis_getter = redis_getter
+        
+        # In-process fallback buckets: key -> (tokens, timestamp)
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._script = None
+    
+    def acquire(self, url, identity=None):
+        """
+        Wait until a request to url is allowed by the budget
+        
+        Args:
+            url (str): Request URL (its host selects the bucket)
+            identity (str): Identity making the request (e.g. session cookie)
+        """
+        while True:
+            wait = self.try_acquire(url, identity)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+    
+    async def acquire_async(self, url, identity=None):
+        """Wait until a request to url is allowed by the budget (without blocking the event loop)"""
+        while True:
+            # Redis script call is blocking, run it in a thread
+            wait = await asyncio.to_thread(self.try_acquire, url, identity)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+    
+    def try_acquire(self, url, identity=None):
+        """
+        Take a token for the request if available
+        
+        Returns:
+            float: 0 if the request is allowed, otherwise seconds to wait before retrying
+        """
+        buckets = self._get_buckets(url, identity)
+        
+        client = self.redis_getter()
+        if client is not None:
+            try:
+                if self._script is None:
+                    self._script = client.register_script(TOKEN_BUCKET_SCRIPT)
+                
+                args = []
+                for _, rate, capacity in buckets:
+                    args.extend([rate, capacity])
+                
+                wait = float(self._script(keys=[key for key, _, _ in buckets], args=args))
+                return self._with_jitter(wait)
+            except Exception as e:
+                logger.warning(f"Error using Redis rate limiter: {str(e)}")
+        
+        return self._with_jitter(self._try_acquire_local(buckets))
+    
+    def _get_buckets(self, url, identity):
+        """
+        Get buckets that must allow the request
+        
+        Returns:
+            list: (key, rate in tokens per second, capacity) tuples
+        """
+        host = urlparse(url).netloc.lower()
+        host_rate = self.host_budgets.get(host, self.default_rate)
+        
+        buckets = [(f"ratelimit:host:{host}", host_rate / 60, self.burst)]
+        if identity:
+            buckets.append((f"ratelimit:identity:{identity}", self.identity_rate / 60, self.burst))
+        
+        return buckets
+    
+    def _try_acquire_local(self, buckets):
+        """In-process version of TOKEN_BUCKET_SCRIPT"""
+        with self._lock:
+            now = time.time()
+            wait = 0
+            tokens = []
+            
+            for key, rate, capacity in buckets:
+                available, ts = self._buckets.get(key, (capacity, now))
+                available = min(capacity, available + max(0, now - ts) * rate)
+                tokens.append(available)
+                if available < 1:
+                    wait = max(wait, (1 - available) / rate)
+            
+            if wait > 0:
+                return wait
+            
+            for (key, _, _), available in zip(buckets, tokens):
+                self._buckets[key] = (available - 1, now)
+            
+            return 0
+    
+    def _with_jitter(self, wait):
+        """Add small random delay so waiting workers don't retry at the same moment"""
+        if wait <= 0:
+            return 0
+        return wait + random.uniform(0, min(wait, 1.0) * 0.25)
+
+# Rate limiter shared by all scrapers and fetchers in the process
+rate_limiter = RateLimiter()
@@ -0,0 +1,49 @@
+import redis
+import logging
+import os
+import time
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Redis used for shared state between processes (broker Redis by default)
+REDIS_URL = os.getenv("REDIS_URL", os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/0"))
+
+# Seconds to wait before trying to reconnect to unavailable Redis
+REDIS_RETRY_INTERVAL = int(os.getenv("REDIS_RETRY_INTERVAL", "30"))
+
+_client = None
+_unavailable_until = 0
+
+def get_redis():
+    """
+    Get shared Redis client
+    
+    Returns:
+        redis.Redis: Redis client or None if Redis is not available,
+            in which case callers fall back to in-process state
+    """
+    global _client, _unavailable_until
+    
+    if _client is not None:
+        return _client
+    
+    # Don't wait for connection timeout on every call while Redis is down
+    if time.time() < _unavailable_until:
+        return None
+    
+    try:
+        client = redis.Redis.from_url(
+            REDIS_URL,
+            socket_connect_timeout=1,
+            socket_timeout=1,
+            decode_responses=True
+        )
+        client.ping()
+        _client = client
+    except Exception as e:
+        logger.warning(f"Redis is not available, using in-process fallback: {str(e)}")
+        _unavailable_until = time.time() + REDIS_RETRY_INTERVAL
+        return None
+    
+    return _client
@@ -8,7 +8,7 @@ from sqlalchemy import inspect
 import os
 import logging
 
-from models import engine, Base, Post
+from models import engine, init_db, Post
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -26,7 +26,7 @@ def reset_database():
     
     # Create all tables defined in models
     logger.info("Creating new database tables")
-    Base.metadata.create_all(bind=engine)
+    init_db()
     
     # Verify tables were created
     inspector = inspect(engine)
@@ -0,0 +1,204 @@
+from sqlalchemy import func
+from datetime import datetime, timedelta
+import logging
+import os
+
+from models import Post, TrackedAccount
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Bounds of the polling interval of an account in seconds
+SCHEDULE_MIN_INTERVAL = int(os.getenv("SCHEDULE_MIN_INTERVAL", "600"))  # 10 minutes
+SCHEDULE_MAX_INTERVAL = int(os.getenv("SCHEDULE_MAX_INTERVAL", "86400"))  # 1 day
+
+# Interval of accounts without stored posts yet
+SCHEDULE_DEFAULT_INTERVAL = int(os.getenv("SCHEDULE_DEFAULT_INTERVAL", "3600"))
+
+# New posts expected per scrape (1: an account posting 6 times a day is scraped every 4 hours)
+SCHEDULE_POSTS_PER_SCRAPE = float(os.getenv("SCHEDULE_POSTS_PER_SCRAPE", "1"))
+
+# Days of stored posts the posting rate is measured on
+SCHEDULE_RATE_WINDOW_DAYS = int(os.getenv("SCHEDULE_RATE_WINDOW_DAYS", "14"))
+
+# Shortest stored history the posting rate is measured on (newly tracked accounts)
+SCHEDULE_RATE_MIN_SPAN_HOURS = float(os.getenv("SCHEDULE_RATE_MIN_SPAN_HOURS", "1"))
+
+# Maximum number of accounts dispatched by one scheduler run
+SCHEDULE_BATCH_SIZE = int(os.getenv("SCHEDULE_BATCH_SIZE", "50"))
+
+# Accounts tracked on a new database (comma-separated)
+SCHEDULE_SEED_ACCOUNTS = os.getenv("SCHEDULE_SEED_ACCOUNTS", "nasa")
+
+def compute_interval(posts_per_day):
+    """
+    Get polling interval for posting rate
+    
+    Args:
+        posts_per_day (float): Observed posting rate (None if unknown)
+    
+    Returns:
+        int: Seconds between scrapes
+    """
+    if posts_per_day is None:
+        return SCHEDULE_DEFAULT_INTERVAL
+    
+    # Dormant account
+    if posts_per_day <= 0:
+        return SCHEDULE_MAX_INTERVAL
+    
+    interval = SCHEDULE_POSTS_PER_SCRAPE * 86400 / posts_per_day
+    return int(min(max(interval, SCHEDULE_MIN_INTERVAL), SCHEDULE_MAX_INTERVAL))
+
+def get_posting_rate(db, username, now=None):
+    """
+    Measure posting rate of an account from stored posts
+    
+    Returns:
+        float: Posts per day in the last SCHEDULE_RATE_WINDOW_DAYS days (or
+            since the oldest stored post if the history is shorter),
+            None if no posts of the account are stored
+    """
+    now = now or datetime.now()
+    since = now - timedelta(days=SCHEDULE_RATE_WINDOW_DAYS)
+    
+    # Counted on the (username, timestamp) index
+    count, oldest = (
+        db.query(func.count(Post.id), func.min(Post.timestamp))
+        .filter(Post.username == username, Post.timestamp >= since)
+        .one()
+    )
+    
+    if not count:
+        if db.query(Post.id).filter(Post.username == username).first() is None:
+            return None
+        return 0.0
+    
+    # A newly tracked account only has posts of its first scrapes
+    if db.query(Post.id).filter(Post.username == username, Post.timestamp < since).first() is None:
+        span = max((now - oldest).total_seconds() / 86400, SCHEDULE_RATE_MIN_SPAN_HOURS / 24)
+    else:
+        span = SCHEDULE_RATE_WINDOW_DAYS
+    
+    return count / min(span, SCHEDULE_RATE_WINDOW_DAYS)
+
+def track_account(db, username, num_posts=10):
+    """
+    Add account to the schedule (or update it), first scrape is due right away
+    
+    Returns:
+        TrackedAccount: Tracked account
+    """
+    now = datetime.now()
+    account = db.get(TrackedAccount, username)
+    
+    if account is None:
+        posts_per_day = get_posting_rate(db, username, now)
+        account = TrackedAccount(
+            username=username,
+            posts_per_day=posts_per_day,
+            interval=compute_interval(posts_per_day),
+            next_scrape_at=now,
+            created_at=now
+        )
+        db.add(account)
+    
+    account.num_posts = num_posts
+    account.enabled = True
+    
+    return account
+
+def untrack_account(db, username):
+    """Remove account from the schedule, False if it wasn't tracked"""
+    account = db.get(TrackedAccount, username)
+    if account is None:
+        return False
+    
+    db.delete(account)
+    return True
+
+def seed_tracked_accounts(db):
+    """Track SCHEDULE_SEED_ACCOUNTS if no account is tracked yet"""
+    if db.query(TrackedAccount.username).first() is not None:
+        return
+    
+    for username in SCHEDULE_SEED_ACCOUNTS.split(","):
+        if username.strip():
+            track_account(db, username.strip())
+
+def claim_due_accounts(db, now=None, limit=SCHEDULE_BATCH_SIZE):
+    """
+    Get accounts due for a scrape, most overdue first
+    
+    Their next scrape time is moved forward by their interval, so they
+    aren't dispatched again while the scrape runs. The caller commits.
+    
+    Returns:
+        list: Tracked accounts
+    """
+    now = now or datetime.now()
+    
+    accounts = (
+        db.query(TrackedAccount)
+        .filter(TrackedAccount.enabled.is_(True), TrackedAccount.next_scrape_at <= now)
+        .order_by(TrackedAccount.next_scrape_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    
+    for account in accounts:
+        account.next_scrape_at = now + timedelta(seconds=account.interval or SCHEDULE_DEFAULT_INTERVAL)
+    
+    return accounts
+
+def reschedule_account(db, username, status, now=None):
+    """
+    Update posting rate and interval of an account after a scrape
+    
+    Args:
+        db (Session): Database session
+        username (str): Instagram username
+        status (str): Status of the scrape task
+        now (datetime): Time of the scrape
+    
+    Returns:
+        TrackedAccount: Tracked account or None if the account isn't tracked
+    """
+    now = now or datetime.now()
+    account = db.get(TrackedAccount, username)
+    if account is None:
+        return None
+    
+    account.posts_per_day = get_posting_rate(db, username, now)
+    account.interval = compute_interval(account.posts_per_day)
+    account.next_scrape_at = now + timedelta(seconds=account.interval)
+    account.last_scraped_at = now
+    account.last_status = status
+    
+    return account
+
+def get_schedule(db, now=None):
+    """
+    Get current plan of the scheduler
+    
+    Returns:
+        list: Tracked accounts (dicts), next scrape first
+    """
+    now = now or datetime.now()
+    accounts = db.query(TrackedAccount).order_by(TrackedAccount.next_scrape_at, TrackedAccount.username).all()
+    
+    return [
+        {
+            "username": account.username,
+            "num_posts": account.num_posts,
+            "enabled": account.enabled,
+            "interval": account.interval,
+            "posts_per_day": account.posts_per_day,
+            "next_scrape_at": account.next_scrape_at,
+            "last_scraped_at": account.last_scraped_at,
+            "last_status": account.last_status,
+            "due": bool(account.enabled and account.next_scrape_at and account.next_scrape_at <= now)
+        }
+        for account in accounts
+    ]
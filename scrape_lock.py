@@ -0,0 +1,123 @@
+import logging
+import os
+import threading
+import time
+
+from redis_client import get_redis
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Lifetime of a lock in seconds (refreshed after each page; frees accounts of crashed scrapes)
+SCRAPE_LOCK_TTL = int(os.getenv("SCRAPE_LOCK_TTL", "900"))
+
+# Delete or refresh the lock only if it's still held by the same task
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+REFRESH_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+class ScrapeLock:
+    """Single-flight lock per Instagram account: one scrape of an account at a time"""
+    
+    def __init__(self, ttl=SCRAPE_LOCK_TTL, redis_getter=get_redis):
+        """
+        Initialize lock
+        
+        Args:
+            ttl (int): Lifetime of a lock in seconds
+            redis_getter (callable): Returns Redis client shared by all processes,
+                or None (locks are then only seen in this process)
+        """
+        self.ttl = ttl
+        self.redis_getter = redis_getter
+        
+        # username -> (task_id, expires_at)
+        self._locks = {}
+        self._lock = threading.Lock()
+    
+    def acquire(self, username, task_id, ttl=None):
+        """
+        Lock account for a scrape task
+        
+        Args:
+            username (str): Instagram username
+            task_id (str): ID of the task that wants to scrape the account
+            ttl (int): Lifetime of the lock in seconds (default: self.ttl)
+        
+        Returns:
+            str: ID of the task holding the lock: task_id if it was acquired
+                (or is already held by task_id), ID of the running scrape otherwise
+        """
+        username = username.lower()
+        ttl = ttl or self.ttl
+        
+        client = self.redis_getter()
+        if client is not None:
+            try:
+                # Lock can expire between SET and GET, so try again once
+                for _ in range(2):
+                    if client.set(self._key(username), task_id, nx=True, ex=ttl):
+                        return task_id
+                    
+                    holder = client.get(self._key(username))
+                    if holder:
+                        return holder
+            except Exception as e:
+                logger.warning(f"Error acquiring scrape lock in Redis: {str(e)}")
+        
+        with self._lock:
+            holder, expires_at = self._locks.get(username, (None, 0))
+            if holder and expires_at > time.time():
+                return holder
+            
+            self._locks[username] = (task_id, time.time() + ttl)
+            return task_id
+    
+    def refresh(self, username, task_id):
+        """Extend lifetime of a lock held by task_id (called while scraping goes on)"""
+        username = username.lower()
+        
+        client = self.redis_getter()
+        if client is not None:
+            try:
+                client.eval(REFRESH_SCRIPT, 1, self._key(username), task_id, self.ttl)
+                return
+            except Exception as e:
+                logger.warning(f"Error refreshing scrape lock in Redis: {str(e)}")
+        
+        with self._lock:
+            if self._locks.get(username, (None, 0))[0] == task_id:
+                self._locks[username] = (task_id, time.time() + self.ttl)
+    
+    def release(self, username, task_id):
+        """Unlock account if the lock is held by task_id"""
+        username = username.lower()
+        
+        client = self.redis_getter()
+        if client is not None:
+            try:
+                client.eval(RELEASE_SCRIPT, 1, self._key(username), task_id)
+                return
+            except Exception as e:
+                logger.warning(f"Error releasing scrape lock in Redis: {str(e)}")
+        
+        with self._lock:
+            if self._locks.get(username, (None, 0))[0] == task_id:
+                del self._locks[username]
+    
+    def _key(self, username):
+        """Redis key for username"""
+        return f"instagram:scrape_lock:{username}"
+
+# Lock shared by API handlers and tasks in the process
+scrape_lock = ScrapeLock()
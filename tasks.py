@@ -1,68 +1,334 @@
-from celery import shared_task
+from celery import shared_task, group
+from celery.signals import worker_init, worker_process_init, task_revoked
 from datetime import datetime
+import base64
 import json
+import logging
+import os
+import threading
 import time
+import uuid
+import zlib
 
 from instagram_scraper import InstagramScraper
-from models import SessionLocal, Post
+from models import engine, init_db, SessionLocal, ScrapeWatermark
+from crud import save_posts, encode_cursor
+from http_session import get_session, reset_session
+from redis_client import get_redis
+from scrape_lock import scrape_lock
+from scheduler import claim_due_accounts, reschedule_account, seed_tracked_accounts
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Maximum number of accounts of one batch scraped at the same time
+SCRAPE_BATCH_CONCURRENCY = int(os.getenv("SCRAPE_BATCH_CONCURRENCY", "5"))
+
+# Lifetime of batch information (same as Celery results)
+SCRAPE_BATCH_TTL = int(os.getenv("SCRAPE_BATCH_TTL", "3600"))
+
+# Result of scrape tasks kept in the result backend: "compact" (post IDs, count
+# and cursor; posts are loaded from the database when the task is read) or
+# "full" (all saved posts)
+SCRAPE_RESULT_MODE = os.getenv("SCRAPE_RESULT_MODE", "compact")
+
+# Results with more JSON bytes than this are stored compressed (0 disables)
+SCRAPE_RESULT_COMPRESS_MIN_SIZE = int(os.getenv("SCRAPE_RESULT_COMPRESS_MIN_SIZE", "65536"))
+
+# Lifetime of task records of the API (same as Celery results)
+SCRAPE_TASK_TTL = int(os.getenv("SCRAPE_TASK_TTL", "3600"))
+
+# In-process fallback storage of batches and task records if Redis is not available
+_batches = {}
+_batches_lock = threading.Lock()
+_tasks = {}
+_tasks_lock = threading.Lock()
+
+@worker_init.connect
+def init_worker(**kwargs):
+    """Set up database schema once when the worker starts"""
+    init_db()
+    
+    # Accounts scraped periodically on a new database
+    db = SessionLocal()
+    try:
+        seed_tracked_accounts(db)
+        db.commit()
+    finally:
+        db.close()
+    
+    # Don't share pooled connections with forked worker processes
+    engine.dispose()
+
+@worker_process_init.connect
+def init_worker_process(**kwargs):
+    """Create pooled HTTP session once per worker process"""
+    reset_session()
+    get_session()
+
+def get_watermark(db, username):
+    """
+    Get high-water mark of the newest stored post for username
+    
+    Returns:
+        dict: {"shortcode": str, "timestamp": int} or None if nothing stored yet
+    """
+    watermark = db.query(ScrapeWatermark).filter(ScrapeWatermark.username == username).first()
+    
+    if not watermark or not watermark.timestamp:
+        return None
+    
+    return {
+        "shortcode": watermark.shortcode,
+        "timestamp": int(watermark.timestamp.timestamp())
+    }
+
+def update_watermark(db, username, posts):
+    """Move high-water mark to the newest of the scraped posts"""
+    posts = [post for post in posts if post.get("shortcode")]
+    if not posts:
+        return
+    
+    newest = max(posts, key=lambda post: post["timestamp"])
+    newest_timestamp = datetime.fromisoformat(newest["timestamp"])
+    
+    watermark = db.query(ScrapeWatermark).filter(ScrapeWatermark.username == username).first()
+    
+    if not watermark:
+        watermark = ScrapeWatermark(username=username)
+        db.add(watermark)
+    elif watermark.timestamp and watermark.timestamp >= newest_timestamp:
+        return
+    
+    watermark.shortcode = newest["shortcode"]
+    watermark.timestamp = newest_timestamp
+    watermark.updated_at = datetime.now()
+
+def is_watermark_reached(posts, watermark):
+    """
+    Check if posts scraped without a high-water mark go back to it
+    
+    Args:
+        posts (list): Scraped posts in timeline order (pinned posts first, then newest first)
+        watermark (dict): High-water mark (see get_watermark)
+    """
+    if not posts or not watermark:
+        return False
+    
+    if any(post.get("shortcode") == watermark["shortcode"] for post in posts):
+        return True
+    
+    # Oldest post of the timeline order is not newer than the mark
+    return datetime.fromisoformat(posts[-1]["timestamp"]).timestamp() <= watermark["timestamp"]
+
+def make_result(saved_posts, username):
+    """
+    Create result of a scrape task from saved posts
+    
+    Args:
+        saved_posts (list): Saved posts (with database IDs)
+        username (str): Instagram username
+    
+    Returns:
+        Compact result (dict) or saved posts, compressed if large
+    """
+    if SCRAPE_RESULT_MODE == "full":
+        return compress_result(saved_posts)
+    
+    # Oldest saved post: /posts/{username}?before=<cursor> continues after it
+    cursor = None
+    if saved_posts:
+        oldest = min(saved_posts, key=lambda post: (post["timestamp"], post["id"]))
+        cursor = encode_cursor(datetime.fromisoformat(oldest["timestamp"]), oldest["id"])
+    
+    return compress_result({
+        "username": username,
+        "count": len(saved_posts),
+        "post_ids": [post["id"] for post in saved_posts],
+        "cursor": cursor
+    })
+
+def is_compact_result(result):
+    """Check if task result is a compact result (post IDs instead of posts)"""
+    return isinstance(result, dict) and "post_ids" in result
+
+def compress_result(result):
+    """Compress result if its JSON is large (the result backend only stores JSON)"""
+    data = json.dumps(result)
+    if not SCRAPE_RESULT_COMPRESS_MIN_SIZE or len(data) < SCRAPE_RESULT_COMPRESS_MIN_SIZE:
+        return result
+    
+    return {"compression": "zlib", "data": base64.b64encode(zlib.compress(data.encode())).decode()}
+
+def decompress_result(result):
+    """Get original result of compress_result"""
+    if isinstance(result, dict) and result.get("compression") == "zlib":
+        return json.loads(zlib.decompress(base64.b64decode(result["data"])))
+    return result
+
+def count_result_posts(result):
+    """Get number of saved posts in a task result"""
+    result = decompress_result(result)
+    if is_compact_result(result):
+        return result["count"]
+    return len(result or [])
+
+@task_revoked.connect
+def release_revoked_scrape(request=None, **kwargs):
+    """Free account locked by the API for a scrape that never ran (revoked or expired in the queue)"""
+    if request is None or request.task != "tasks.scrape_instagram" or not request.args:
+        return
+    
+    scrape_lock.release(request.args[0], request.id)
+
+@shared_task(bind=True)
+def scrape_instagram(self, username, num_posts=10, incremental=False):
+    """
+    Celery task for Instagram scraping
+    
+    In incremental mode all posts newer than the stored high-water mark
+    are fetched and saved (num_posts doesn't apply).
+    """
+    return run_scrape(username, num_posts, incremental, self.request.id or str(uuid.uuid4()), self)
+
+@shared_task(bind=True)
+def scrape_instagram_periodic(self, username="nasa", num_posts=10):
+    """Periodic task for Instagram scraping (fetches only new posts)"""
+    result = run_scrape(username, num_posts, True, self.request.id or str(uuid.uuid4()), self)
+    
+    # Pick next scrape time from the posting rate (including posts just saved)
+    db = SessionLocal()
+    try:
+        reschedule_account(db, username, result["status"])
+        db.commit()
+    except Exception as e:
+        logger.warning(f"Error rescheduling @{username}: {str(e)}")
+    finally:
+        db.close()
+    
+    return result
 
 @shared_task
-def scrape_instagram(username, num_posts=10):
-    """Celery task for Instagram scraping"""
+def schedule_due_scrapes():
+    """Dispatch scrapes of tracked accounts that are due (run by beat)"""
+    db = SessionLocal()
     try:
-        # Create scraper instance
-        scraper = InstagramScraper()
+        accounts = [(account.username, account.num_posts) for account in claim_due_accounts(db)]
+        db.commit()
+    finally:
+        db.close()
+    
+    # Due accounts are scraped in parallel by the workers
+    if accounts:
+        group(scrape_instagram_periodic.si(username, num_posts) for username, num_posts in accounts).apply_async()
+        logger.info(f"Dispatched scrapes of {len(accounts)} tracked accounts")
+    
+    return {"dispatched": [username for username, _ in accounts]}
+
+def report_progress(task, task_id, **progress):
+    """Publish progress of a running scrape task (state PROGRESS)"""
+    if task is None:
+        return
+    
+    try:
+        task.update_state(task_id=task_id, state="PROGRESS", meta=progress)
+    except Exception as e:
+        logger.warning(f"Error reporting progress of task {task_id}: {str(e)}")
+
+def run_scrape(username, num_posts, incremental, task_id, task=None):
+    """
+    Scrape and save posts of an account unless it's already being scraped
+    
+    Args:
+        username (str): Instagram username
+        num_posts (int): Maximum number of posts (full mode)
+        incremental (bool): Fetch all posts newer than the high-water mark
+        task_id (str): ID of the running task (holder of the account lock)
+        task (Task): Running Celery task progress is reported for (None: no progress)
+    
+    Returns:
+        dict: Task result (status SKIPPED with the ID of the running scrape
+            if another task is scraping the account)
+    """
+    # Lock may already be held for this task (taken by the API before queuing)
+    holder = scrape_lock.acquire(username, task_id)
+    if holder == task_id:
+        # Lifetime of a running scrape instead of the queue wait of the API lock
+        scrape_lock.refresh(username, task_id)
+    else:
+        logger.info(f"@{username} is already being scraped by task {holder}, skipping")
+        return {
+            "status": "SKIPPED",
+            "created_at": datetime.now().isoformat(),
+            "completed_at": datetime.now().isoformat(),
+            "result": {"task_id": holder, "message": f"Scraping of {username} is already in progress"}
+        }
+    
+    try:
+        # Create scraper instance (reuses the worker's pooled HTTP session)
+        scraper = InstagramScraper(session=get_session())
         
-        # Get posts
-        posts = scraper.get_posts(username, num_posts)
+        # Read high-water mark without holding the connection during scraping
+        # (also in full mode, to tell if the scrape went back to the stored posts)
+        db = SessionLocal()
+        try:
+            watermark = get_watermark(db, username)
+        finally:
+            db.close()
+        since = watermark if incremental else None
         
-        # Save posts to database
+        # Save posts page by page as they are scraped, so pages already
+        # fetched are kept if scraping fails later
         db = SessionLocal()
         
         saved_posts = []
-        for post_data in posts:
-            # Create database record
-            db_post = Post(
-                url=post_data["url"],
-                text=post_data["text"],
-                title=post_data.get("title", ""),
-                likes=post_data["likes"],
-                comments=post_data.get("comments", "0"),
-                hashtags=json.dumps(post_data["hashtags"]),
-                timestamp=datetime.fromisoformat(post_data["timestamp"]),
-                username=username
-            )
+        scraped_posts = []
+        try:
+            for page_number, page in enumerate(scraper.iter_pages(username, num_posts, since=since), 1):
+                # Save whole page with one statement
+                saved_posts.extend(save_posts(db, page, username))
+                
+                # Commit page to database
+                db.commit()
+                scraped_posts.extend(page)
+                
+                # Keep account locked while scraping goes on
+                scrape_lock.refresh(username, task_id)
+                
+                # Pushed to clients by GET /tasks/{task_id}/stream
+                report_progress(
+                    task, task_id,
+                    username=username,
+                    num_posts=num_posts,
+                    posts_fetched=len(saved_posts),
+                    page=page_number,
+                    current_method=scraper.current_method
+                )
             
-            # Add to session
-            db.add(db_post)
-            db.flush()  # To get ID before commit
+            # Remember newest post for next incremental scrape (only after the whole
+            # scrape succeeded, so older posts of unfetched pages aren't skipped next time).
+            # The old mark is kept if num_posts or the page cap cut off posts newer than it
+            if incremental:
+                reached_watermark = scraper.reached_watermark
+            else:
+                reached_watermark = is_watermark_reached(scraped_posts, watermark)
             
-            # Create new object for response with unchanged hashtags
-            response_post = {
-                "id": db_post.id,
-                "url": db_post.url,
-                "text": db_post.text,
-                "title": db_post.title,
-                "likes": db_post.likes,
-                "comments": db_post.comments,
-                "hashtags": post_data["hashtags"],  # Use original hashtags
-                "timestamp": post_data["timestamp"],
-                "username": db_post.username
-            }
-            saved_posts.append(response_post)
-        
-        # Commit changes to database
-        db.commit()
-        
-        # Close connection
-        db.close()
+            if watermark is None or reached_watermark or scraper.reached_end:
+                update_watermark(db, username, scraped_posts)
+                db.commit()
+            elif incremental:
+                logger.warning(f"Stored posts of @{username} not reached within the page cap")
+            
+        finally:
+            # Close connection
+            db.close()
         
         # Return result
         return {
             "status": "SUCCESS",
             "created_at": datetime.now().isoformat(),
             "completed_at": datetime.now().isoformat(),
-            "result": saved_posts
+            "result": make_result(saved_posts, username)
         }
         
     except Exception as e:
@@ -72,37 +338,288 @@ def scrape_instagram(username, num_posts=10):
             "completed_at": datetime.now().isoformat(),
             "result": {"error": str(e)}
         }
+    
+    finally:
+        scrape_lock.release(username, task_id)
 
-@shared_task
-def scrape_instagram_periodic(username="nasa", num_posts=10):
-    """Periodic task for Instagram scraping"""
-    return scrape_instagram(username, num_posts)
+def start_batch(usernames, num_posts=10, concurrency=SCRAPE_BATCH_CONCURRENCY):
+    """
+    Start scraping of several accounts as one batch
+    
+    Accounts are split into at most `concurrency` lanes. Lanes run in parallel,
+    each lane is one task scraping its accounts one after another, so a large
+    batch doesn't occupy all workers at once.
+    
+    Args:
+        usernames (list): Instagram usernames
+        num_posts (int): Maximum number of posts per account
+        concurrency (int): Maximum number of accounts scraped at the same time
+        
+    Returns:
+        dict: Batch information (batch_id, created_at, tasks: username -> task ID,
+            lanes: lane task ID -> usernames)
+    """
+    # Drop duplicates, keep order
+    usernames = list(dict.fromkeys(usernames))
+    
+    # Task IDs are known before start, so progress can be tracked right away
+    tasks = {username: str(uuid.uuid4()) for username in usernames}
+    
+    lane_count = max(1, min(concurrency, len(usernames)))
+    lanes = {str(uuid.uuid4()): usernames[i::lane_count] for i in range(lane_count) if usernames[i::lane_count]}
+    
+    batch = {
+        "batch_id": str(uuid.uuid4()),
+        "created_at": datetime.now().isoformat(),
+        "num_posts": num_posts,
+        "tasks": tasks,
+        "lanes": lanes
+    }
+    save_batch(batch)
+    
+    # Result backend doesn't know an account's task until its lane gets to it
+    for task_id in tasks.values():
+        save_task(task_id, {
+            "status": "PROCESSING",
+            "created_at": batch["created_at"],
+            "completed_at": None,
+            "result": None,
+            "progress": None
+        })
+    
+    for lane_id, lane in lanes.items():
+        scrape_batch_lane.apply_async(
+            ([[username, tasks[username]] for username in lane], num_posts),
+            task_id=lane_id
+        )
+    
+    return batch
+
+@shared_task(bind=True)
+def scrape_batch_lane(self, accounts, num_posts=10):
+    """
+    Scrape accounts of one batch lane one after another
+    
+    The result of each account is stored under its own task ID. A failing
+    account doesn't stop the lane, and accounts that already have a result
+    are skipped when the lane runs again (message delivered again).
+    
+    Args:
+        accounts (list): [username, task ID] pairs
+        num_posts (int): Maximum number of posts per account
+    """
+    for username, task_id in accounts:
+        if self.AsyncResult(task_id).ready():
+            continue
+        
+        self.backend.store_result(task_id, None, "STARTED")
+        
+        try:
+            result = run_scrape(username, num_posts, False, task_id, self)
+        except Exception as e:
+            result = {
+                "status": "FAILURE",
+                "created_at": datetime.now().isoformat(),
+                "completed_at": datetime.now().isoformat(),
+                "result": {"error": str(e)}
+            }
+        
+        self.backend.store_result(task_id, result, "SUCCESS")
+    
+    return {"accounts": len(accounts)}
+
+def save_batch(batch):
+    """Save batch information (Redis, in-process if Redis is not available)"""
+    client = get_redis()
+    if client is not None:
+        try:
+            client.set(f"instagram:batch:{batch['batch_id']}", json.dumps(batch), ex=SCRAPE_BATCH_TTL)
+            return
+        except Exception as e:
+            logger.warning(f"Error saving batch to Redis: {str(e)}")
+    
+    with _batches_lock:
+        _batches[batch["batch_id"]] = batch
+
+def load_batch(batch_id):
+    """Load batch information, None if batch is unknown or expired"""
+    client = get_redis()
+    if client is not None:
+        try:
+            batch = client.get(f"instagram:batch:{batch_id}")
+            if batch:
+                return json.loads(batch)
+        except Exception as e:
+            logger.warning(f"Error reading batch from Redis: {str(e)}")
+    
+    with _batches_lock:
+        return _batches.get(batch_id)
+
+def save_task(task_id, info):
+    """
+    Save record of a task started by the API (Redis, in-process if Redis is not available)
+    
+    Records cover what the result backend doesn't know: Celery tasks still
+    waiting in the queue and manual scrapes, which run without Celery.
+    
+    Args:
+        task_id (str): Task ID
+        info (dict): Task status, created_at, completed_at, result and progress
+    """
+    client = get_redis()
+    if client is not None:
+        try:
+            client.set(f"instagram:task:{task_id}", json.dumps(info, default=str), ex=SCRAPE_TASK_TTL)
+            return
+        except Exception as e:
+            logger.warning(f"Error saving task to Redis: {str(e)}")
+    
+    with _tasks_lock:
+        _tasks[task_id] = info
+
+def load_task(task_id):
+    """Load record of a task started by the API, None if task is unknown or expired"""
+    info = None
+    
+    client = get_redis()
+    if client is not None:
+        try:
+            data = client.get(f"instagram:task:{task_id}")
+            if data:
+                info = json.loads(data)
+        except Exception as e:
+            logger.warning(f"Error reading task from Redis: {str(e)}")
+    
+    if info is None:
+        with _tasks_lock:
+            info = _tasks.get(task_id)
+    
+    # Scrape result with compressed posts
+    if info and isinstance(info.get("result"), dict) and "result" in info["result"]:
+        info = dict(info, result=dict(info["result"], result=decompress_result(info["result"]["result"])))
+    
+    return info
+
+def get_batch_progress(batch_id):
+    """
+    Get aggregate progress of a batch
+    
+    Returns:
+        dict: Batch status, counters and status of each account,
+            None if batch is unknown or expired
+    """
+    from celery_app import celery_app
+    
+    batch = load_batch(batch_id)
+    if batch is None:
+        return None
+    
+    counts = {"PENDING": 0, "STARTED": 0, "SUCCESS": 0, "FAILURE": 0}
+    accounts = []
+    posts = 0
+    
+    # Lane of each account: accounts a finished lane didn't scrape never will be
+    # (lane revoked, or failed with its worker)
+    lane_ids = {username: lane_id for lane_id, lane in batch.get("lanes", {}).items() for username in lane}
+    finished_lanes = {lane_id for lane_id in batch.get("lanes", {}) if celery_app.AsyncResult(lane_id).ready()}
+    
+    for username, task_id in batch["tasks"].items():
+        result = celery_app.AsyncResult(task_id)
+        status = result.state if result.state in counts else "STARTED"
+        account = {"username": username, "task_id": task_id, "status": status}
+        
+        if not result.ready() and lane_ids.get(username) in finished_lanes:
+            status = "FAILURE"
+            account["status"] = status
+            account["error"] = "Batch lane stopped before the account was scraped"
+        elif result.ready():
+            # Task reports scraping errors in its result
+            value = result.result if result.successful() else None
+            if isinstance(value, dict) and value.get("status") == "SUCCESS":
+                status = "SUCCESS"
+                account["posts"] = count_result_posts(value.get("result"))
+                posts += account["posts"]
+            elif isinstance(value, dict) and value.get("status") == "SKIPPED":
+                # Account was being scraped by another task at the same time
+                status = "SUCCESS"
+                account["posts"] = 0
+                account["attached_to"] = value["result"]["task_id"]
+            else:
+                status = "FAILURE"
+                if isinstance(value, dict) and isinstance(value.get("result"), dict):
+                    account["error"] = value["result"].get("error")
+            account["status"] = status
+        
+        counts[status] += 1
+        accounts.append(account)
+    
+    total = len(accounts)
+    completed = counts["SUCCESS"] + counts["FAILURE"]
+    
+    if completed < total:
+        status = "PROCESSING"
+    elif counts["FAILURE"] == 0:
+        status = "SUCCESS"
+    elif counts["SUCCESS"] == 0:
+        status = "FAILURE"
+    else:
+        status = "PARTIAL_SUCCESS"
+    
+    return {
+        "batch_id": batch_id,
+        "status": status,
+        "created_at": batch["created_at"],
+        "total": total,
+        "completed": completed,
+        "succeeded": counts["SUCCESS"],
+        "failed": counts["FAILURE"],
+        "running": counts["STARTED"],
+        "pending": counts["PENDING"],
+        "progress": round(completed / total * 100, 1) if total else 100.0,
+        "posts": posts,
+        "accounts": accounts
+    }
 
 def get_task_result(task_id):
-    """Get Celery task result"""
+    """
+    Get Celery task result
+    
+    Returns:
+        dict: Task status or None if the result backend doesn't know the task
+            (Celery reports unknown, queued and expired tasks all as PENDING)
+            or is not available, so callers fall back to task records of the API
+    """
     from celery_app import celery_app
     
     try:
         result = celery_app.AsyncResult(task_id)
         
+        if result.state == "PENDING":
+            return None
+        
         if result.ready():
+            value = result.result
+            
+            # Task result with compressed posts
+            if isinstance(value, dict) and "result" in value:
+                value = dict(value, result=decompress_result(value["result"]))
+            
             return {
                 "status": "SUCCESS" if result.successful() else "FAILURE",
                 "created_at": datetime.now().isoformat(),
                 "completed_at": datetime.now().isoformat(),
-                "result": result.result
+                "result": value,
+                "progress": None
             }
         else:
             return {
                 "status": "PROCESSING",
                 "created_at": datetime.now().isoformat(),
                 "completed_at": None,
-                "result": None
+                "result": None,
+                # Reported by the task after each saved page
+                "progress": result.info if result.state == "PROGRESS" else None
             }
     except Exception as e:
-        return {
-            "status": "ERROR",
-            "created_at": datetime.now().isoformat(),
-            "completed_at": datetime.now().isoformat(),
-            "result": {"error": str(e)}
-        } 
\ No newline at end of file
+        logger.warning(f"Error reading task {task_id} from the result backend: {str(e)}")
+        return None 
\ No newline at end of file
@@ -1,9 +1,55 @@
+import asyncio
+import json
+import threading
+import time
 from fastapi.testclient import TestClient
 import pytest
-from main import app
+from unittest.mock import patch
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+import main
+from main import app, get_db, get_async_db
+from models import Base, create_search_index, get_async_url
+from crud import save_posts
 
 client = TestClient(app)
 
+@pytest.fixture
+def db(tmp_path):
+    """Use a temporary database for API requests (sync and async sessions)"""
+    url = f"sqlite:///{tmp_path}/test.db"
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    create_search_index(engine)
+    session = sessionmaker(bind=engine)()
+    async_engine = create_async_engine(get_async_url(url), poolclass=NullPool)
+    
+    async def get_test_async_db():
+        async with async_sessionmaker(async_engine, expire_on_commit=False)() as async_session:
+            yield async_session
+    
+    app.dependency_overrides[get_db] = lambda: session
+    app.dependency_overrides[get_async_db] = get_test_async_db
+    yield session
+    app.dependency_overrides.clear()
+    session.close()
+    engine.dispose()
+
+def make_post(shortcode, hashtags, timestamp):
+    """Create a scraped post"""
+    return {
+        "url": f"https://www.instagram.com/p/{shortcode}/",
+        "shortcode": shortcode,
+        "text": " ".join(f"#{tag}" for tag in hashtags),
+        "title": shortcode,
+        "likes": "1",
+        "comments": "0",
+        "hashtags": hashtags,
+        "timestamp": timestamp
+    }
+
 def test_read_main():
     """Test that the main route returns HTTP 200"""
     response = client.get("/")
@@ -19,4 +65,338 @@ def test_get_available_sources():
     response = client.get("/news/sources")
     assert response.status_code == 200
     assert isinstance(response.json(), list)
-    assert len(response.json()) > 0 
\ No newline at end of file
+    assert len(response.json()) > 0 
+
+def test_news_is_fetched_off_the_event_loop():
+    """Test that RSS fetching, which waits for the rate limiter, doesn't block the event loop"""
+    def get_news_from_rss(source, limit=10):
+        with pytest.raises(RuntimeError):
+            asyncio.get_running_loop()
+        return [{"title": "News", "link": "https://example.com/1", "description": "Paris", "published": "", "full_text": "Paris"}]
+    
+    with patch.object(main.news_fetcher, 'get_news_from_rss', side_effect=get_news_from_rss) as mock_get_news:
+        assert client.get("/news/rss/bbc").status_code == 200
+        assert client.get("/news/analyze/rss/bbc/0").status_code == 200
+    
+    assert mock_get_news.call_count == 2
+
+def test_scrape_batch_requires_usernames():
+    """Test that an empty batch is rejected"""
+    response = client.post("/scrape/batch", json={"usernames": [" ", "@"]})
+    assert response.status_code == 400
+
+@patch('main.start_batch')
+def test_scrape_batch_starts_batch(mock_start_batch):
+    """Test that a batch is started for normalized usernames"""
+    mock_start_batch.return_value = {"batch_id": "batch-1", "tasks": {"nasa": "task-1", "esa": "task-2"}}
+    
+    response = client.post("/scrape/batch", json={"usernames": ["@nasa", "esa"], "num_posts": 5})
+    
+    assert response.status_code == 200
+    assert response.json()["batch_id"] == "batch-1"
+    assert response.json()["total"] == 2
+    mock_start_batch.assert_called_once_with(["nasa", "esa"], 5)
+
+def test_get_posts_by_hashtag(db):
+    """Test hashtag search with and without # and pagination"""
+    save_posts(db, [
+        make_post("A", ["space"], "2024-01-01T00:00:00"),
+        make_post("B", ["space", "mars"], "2024-01-02T00:00:00"),
+        make_post("C", ["mars"], "2024-01-03T00:00:00")
+    ], "nasa")
+    db.commit()
+    
+    response = client.get("/posts/hashtag/%23Space")
+    assert response.status_code == 200
+    assert [post["title"] for post in response.json()] == ["B", "A"]
+    
+    response = client.get("/posts/hashtag/mars", params={"limit": 1, "offset": 1})
+    assert [post["title"] for post in response.json()] == ["B"]
+
+def test_search_posts(db):
+    """Test ranked full-text search in titles and captions"""
+    posts = [
+        make_post("A", ["space"], "2024-01-01T00:00:00"),
+        make_post("B", ["mars"], "2024-01-02T00:00:00"),
+        make_post("C", ["moon"], "2024-01-03T00:00:00")
+    ]
+    posts[0]["text"] = "Launch of the Mars rover"
+    posts[1]["title"] = "Mars"
+    posts[1]["text"] = "Mars, Mars and nothing else"
+    save_posts(db, posts, "nasa")
+    db.commit()
+    
+    response = client.get("/posts/search", params={"q": "MARS"})
+    assert response.status_code == 200
+    assert [post["title"] for post in response.json()] == ["Mars", "A"]
+    assert response.json()[0]["rank"] >= response.json()[1]["rank"]
+    
+    # Query syntax characters are searched as text
+    response = client.get("/posts/search", params={"q": 'rover "(', "limit": 1})
+    assert response.status_code == 200
+    assert [post["title"] for post in response.json()] == ["A"]
+    
+    response = client.get("/posts/title/search", params={"query": "launch rover"})
+    assert [post["title"] for post in response.json()] == ["A"]
+
+def test_get_posts_pages(db):
+    """Test keyset pagination of user posts"""
+    save_posts(db, [make_post(f"P{i}", [], f"2024-01-0{i}T00:00:00") for i in range(1, 6)], "nasa")
+    save_posts(db, [make_post("X", [], "2024-01-09T00:00:00")], "esa")
+    db.commit()
+    
+    titles = []
+    cursor = None
+    while True:
+        response = client.get("/posts/nasa", params={"limit": 2, **({"before": cursor} if cursor else {})})
+        assert response.status_code == 200
+        titles.append([post["title"] for post in response.json()])
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    
+    assert titles == [["P5", "P4"], ["P3", "P2"], ["P1"]]
+    assert client.get("/posts/nasa", params={"before": "broken"}).status_code == 400
+
+def test_scrape_manual_timeout_cancels_scraping():
+    """Test that a manual scrape taking too long is stopped and keeps the account locked until it has stopped"""
+    events = []
+    stopped = threading.Event()
+    finish = threading.Event()
+    
+    def slow_scrape(username, num_posts, cancel_event):
+        events.append(cancel_event)
+        cancel_event.wait(5)
+        
+        # Scrape still runs until its next request
+        stopped.set()
+        finish.wait(5)
+        return []
+    
+    with patch('main.run_manual_scrape', slow_scrape), patch('main.MANUAL_SCRAPE_TIMEOUT', 0.2):
+        response = client.post("/scrape/manual/nasa")
+    
+    assert response.status_code == 504
+    assert events[0].is_set()
+    
+    # No second scrape of the account while the first one still runs
+    assert stopped.wait(1)
+    assert main.scrape_lock.acquire("nasa", "second-task") != "second-task"
+    
+    finish.set()
+    for _ in range(100):
+        if main.scrape_lock.acquire("nasa", "second-task") == "second-task":
+            break
+        time.sleep(0.01)
+    else:
+        pytest.fail("Lock wasn't released after the scrape stopped")
+    main.scrape_lock.release("nasa", "second-task")
+
+@patch('main.run_manual_scrape')
+def test_scrape_manual_returns_posts(mock_run_manual_scrape, db):
+    """Test that posts saved by a manual scrape are returned and its task can be read"""
+    mock_run_manual_scrape.return_value = [
+        {"id": 1, "url": "https://www.instagram.com/p/A/", "timestamp": "2024-01-01T00:00:00"}
+    ]
+    
+    response = client.post("/scrape/manual/nasa", params={"num_posts": 3})
+    
+    assert response.status_code == 200
+    assert response.json()["posts"] == mock_run_manual_scrape.return_value
+    assert mock_run_manual_scrape.call_args[0][:2] == ("nasa", 3)
+    
+    with patch('main.get_task_result', return_value=None):
+        task = client.get(f"/tasks/{response.json()['task_id']}", params={"include_posts": "false"}).json()
+    
+    assert task["status"] == "SUCCESS"
+    assert task["result"]["result"]["post_ids"] == [1]
+
+@patch('celery_app.celery_app.AsyncResult', side_effect=ConnectionError("Error 111 connecting to redis:6379"))
+@patch('main.run_manual_scrape')
+def test_manual_task_is_read_when_result_backend_is_down(mock_run_manual_scrape, mock_async_result, db):
+    """Test that task records of the API are read if the result backend raises"""
+    mock_run_manual_scrape.return_value = [
+        {"id": 1, "url": "https://www.instagram.com/p/A/", "timestamp": "2024-01-01T00:00:00"}
+    ]
+    task_id = client.post("/scrape/manual/nasa").json()["task_id"]
+    
+    response = client.get(f"/tasks/{task_id}", params={"include_posts": "false"})
+    
+    assert response.status_code == 200
+    assert response.json()["status"] == "SUCCESS"
+    assert client.get("/tasks/unknown-task").status_code == 404
+    
+    # Second manual scrape of the account attaches to the recorded one
+    with patch('main.scrape_lock') as mock_scrape_lock:
+        mock_scrape_lock.acquire.return_value = task_id
+        response = client.post("/scrape/manual/nasa")
+    
+    assert response.status_code == 200
+    assert response.json()["task_id"] == task_id
+
+@patch('main.TASK_STREAM_POLL_INTERVAL', 0)
+@patch('main.get_task_result')
+@patch('main.scrape_lock')
+def test_scrape_manual_waits_for_running_task(mock_scrape_lock, mock_get_task_result, db):
+    """Test that a manual scrape of an account being scraped returns the posts of the running task"""
+    mock_scrape_lock.acquire.return_value = "running-task"
+    posts = [{"id": 1, "url": "https://www.instagram.com/p/A/"}]
+    mock_get_task_result.side_effect = [
+        {"status": "PROCESSING", "created_at": "2024-01-01T00:00:00", "completed_at": None, "result": None},
+        {"status": "SUCCESS", "created_at": "2024-01-01T00:00:00", "completed_at": "2024-01-01T00:00:00",
+         "result": {"status": "SUCCESS", "result": posts}}
+    ]
+    
+    response = client.post("/scrape/manual/nasa")
+    
+    assert response.status_code == 200
+    assert response.json()["task_id"] == "running-task"
+    assert response.json()["posts"] == posts
+
+def test_hashtag_engagement(db):
+    """Test average engagement per hashtag"""
+    posts = [make_post("A1", ["moon"], "2024-01-01T00:00:00"), make_post("A2", ["moon", "mars"], "2024-01-02T00:00:00")]
+    posts[1]["likes"] = "3"
+    save_posts(db, posts, "nasa")
+    db.commit()
+    
+    response = client.get("/analytics/hashtags")
+    
+    assert response.status_code == 200
+    assert response.json() == [
+        {"hashtag": "mars", "posts": 1, "avg_likes": 3.0, "avg_comments": 0.0},
+        {"hashtag": "moon", "posts": 2, "avg_likes": 2.0, "avg_comments": 0.0}
+    ]
+
+@patch('main.get_task_result')
+def test_task_status_loads_compact_result_posts(mock_get_task_result, db):
+    """Test that posts of a compact task result are loaded from the database"""
+    saved = save_posts(db, [make_post("A1", [], "2024-01-01T00:00:00"), make_post("A2", [], "2024-01-02T00:00:00")], "nasa")
+    db.commit()
+    compact = {"username": "nasa", "count": 2, "post_ids": [saved[1]["id"], saved[0]["id"]], "cursor": "c"}
+    mock_get_task_result.return_value = {
+        "status": "SUCCESS", "created_at": "2024-01-01T00:00:00", "completed_at": "2024-01-01T00:00:00",
+        "result": {"status": "SUCCESS", "result": compact}
+    }
+    
+    response = client.get("/tasks/task-1")
+    
+    assert response.status_code == 200
+    assert [post["title"] for post in response.json()["result"]["result"]] == ["A2", "A1"]
+    assert response.json()["result"]["count"] == 2
+    
+    response = client.get("/tasks/task-1", params={"include_posts": "false"})
+    assert response.json()["result"]["result"] == compact
+
+@patch('main.scrape_instagram')
+@patch('main.scrape_lock')
+def test_scrape_attaches_to_running_task(mock_scrape_lock, mock_scrape_instagram):
+    """Test that a second scrape of an account returns the running task"""
+    mock_scrape_lock.acquire.return_value = "running-task"
+    
+    response = client.post("/scrape/nasa")
+    
+    assert response.status_code == 200
+    assert response.json()["task_id"] == "running-task"
+    mock_scrape_instagram.apply_async.assert_not_called()
+
+@patch('main.get_task_result', return_value=None)
+@patch('main.scrape_instagram')
+def test_queued_task_is_processing(mock_scrape_instagram, mock_get_task_result, db):
+    """Test that a task still waiting in the queue (unknown to the result backend) is reported as running"""
+    task_id = client.post("/scrape/queued_account").json()["task_id"]
+    
+    try:
+        response = client.get(f"/tasks/{task_id}")
+        
+        assert response.status_code == 200
+        assert response.json()["status"] == "PROCESSING"
+        assert mock_scrape_instagram.apply_async.call_args[1]["expires"] > 0
+        assert client.get("/tasks/unknown-task").status_code == 404
+    finally:
+        main.scrape_lock.release("queued_account", task_id)
+
+@patch('tasks.get_redis', return_value=None)
+@patch('tasks.scrape_batch_lane')
+@patch('main.get_task_result', return_value=None)
+def test_queued_batch_account_is_processing(mock_get_task_result, mock_lane, mock_get_redis, db):
+    """Test that accounts of a batch still waiting in their lane are reported as running"""
+    tasks = client.post("/scrape/batch", json={"usernames": ["nasa", "esa"], "num_posts": 5}).json()["tasks"]
+    
+    for task_id in tasks.values():
+        response = client.get(f"/tasks/{task_id}")
+        
+        assert response.status_code == 200
+        assert response.json()["status"] == "PROCESSING"
+
+def test_schedule_reports_tracked_accounts(db):
+    """Test that tracked accounts are added to the live schedule"""
+    response = client.post("/schedule/accounts", json={"username": "@nasa", "num_posts": 5})
+    assert response.status_code == 200
+    
+    schedule = client.get("/schedule").json()
+    
+    assert [account["username"] for account in schedule["accounts"]] == ["nasa"]
+    assert schedule["accounts"][0]["due"] is True
+    assert schedule["due"] == 1
+    
+    assert client.delete("/schedule/accounts/nasa").status_code == 200
+    assert client.delete("/schedule/accounts/nasa").status_code == 404
+
+@patch('main.TASK_STREAM_POLL_INTERVAL', 0)
+@patch('main.subscribe_task_updates')
+@patch('main.get_task_result')
+def test_task_stream_pushes_progress_and_result(mock_get_task_result, mock_subscribe, db):
+    """Test that task progress and the final result are streamed as Server-Sent Events"""
+    mock_subscribe.return_value = None
+    
+    def state(status, progress=None, result=None):
+        return {"status": status, "created_at": "2024-01-01T00:00:00", "completed_at": None,
+                "result": result, "progress": progress}
+    
+    mock_get_task_result.side_effect = [
+        state("PROCESSING", {"posts_fetched": 12, "page": 1, "current_method": "graphql"}),
+        state("PROCESSING", {"posts_fetched": 12, "page": 1, "current_method": "graphql"}),
+        state("PROCESSING", {"posts_fetched": 12, "page": 1, "current_method": "graphql"}),
+        state("PROCESSING", {"posts_fetched": 24, "page": 2, "current_method": "graphql"}),
+        state("SUCCESS", result={"status": "SUCCESS", "result": []})
+    ]
+    
+    response = client.get("/tasks/task-1/stream")
+    
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [block.split("\n") for block in response.text.strip().split("\n\n")]
+    assert [event[0] for event in events] == ["event: progress", "event: progress", "event: result"]
+    assert json.loads(events[1][1][len("data: "):])["posts_fetched"] == 24
+    assert json.loads(events[2][1][len("data: "):])["status"] == "SUCCESS"
+
+@patch('main.get_task_result', return_value=None)
+def test_task_stream_unknown_task(mock_get_task_result, db):
+    """Test that streaming an unknown task fails right away"""
+    response = client.get("/tasks/unknown-task/stream")
+    
+    assert response.status_code == 404
+
+@patch('main.subscribe_task_updates')
+@patch('celery_app.celery_app.AsyncResult', side_effect=ConnectionError("Error 111 connecting to redis:6379"))
+def test_task_stream_unknown_task_when_result_backend_is_down(mock_async_result, mock_subscribe, db):
+    """Test that an unknown task is not found, not an error, if the result backend raises"""
+    response = client.get("/tasks/unknown-task/stream")
+    
+    assert response.status_code == 404
+    mock_subscribe.assert_not_called()
+
+@patch('main.TASK_STREAM_POLL_INTERVAL', 0)
+@patch('main.subscribe_task_updates', return_value=None)
+@patch('main.get_task_result', return_value=None)
+@patch('main.run_manual_scrape', return_value=[])
+def test_task_stream_reads_manual_task(mock_run_manual_scrape, mock_get_task_result, mock_subscribe, db):
+    """Test that tasks of manual scrapes are streamed too"""
+    task_id = client.post("/scrape/manual/nasa").json()["task_id"]
+    
+    response = client.get(f"/tasks/{task_id}/stream")
+    
+    assert response.status_code == 200
+    assert response.text.startswith("event: result")
+    assert json.loads(response.text.split("\n")[1][len("data: "):])["status"] == "SUCCESS"
@@ -0,0 +1,171 @@
+import os
+from datetime import datetime
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from models import Base, Post, PostHashtag
+from crud import save_posts, get_top_posts, get_daily_engagement, get_hashtag_engagement
+
+@pytest.fixture
+def engine():
+    """Create an in-memory database"""
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    return engine
+
+@pytest.fixture
+def db(engine):
+    """Create a database session"""
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+def make_posts(count):
+    """Create scraped posts"""
+    return [
+        {
+            "url": f"https://www.instagram.com/p/C{i}/",
+            "text": f"Post {i} #tag{i}",
+            "title": f"Post {i}",
+            "likes": str(i),
+            "comments": "0",
+            "hashtags": [f"#tag{i}"],
+            "timestamp": f"2024-01-01T00:00:{i:02d}",
+            "shortcode": f"C{i}"
+        }
+        for i in range(count)
+    ]
+
+def test_save_posts_uses_one_statement(engine, db):
+    """Test that a page of posts is inserted with a single statement"""
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    
+    saved = save_posts(db, make_posts(30), "nasa")
+    db.commit()
+    
+    assert len([sql for sql in statements if sql.startswith("INSERT INTO posts ")]) == 1
+    assert len(saved) == 30
+    
+    # Response IDs belong to the matching rows
+    for post in saved:
+        assert db.get(Post, post["id"]).url == post["url"]
+    assert saved[3]["hashtags"] == ["#tag3"]
+    assert saved[3]["timestamp"] == "2024-01-01T00:00:03"
+
+def test_save_posts_without_posts(db):
+    """Test that nothing is executed for an empty page"""
+    assert save_posts(db, [], "nasa") == []
+
+def test_save_posts_upserts_by_shortcode(db):
+    """Test that saving the same posts again only refreshes likes and comments"""
+    first = save_posts(db, make_posts(3), "nasa")
+    db.commit()
+    
+    posts = make_posts(4)
+    posts[1]["likes"] = "500"
+    posts.append(dict(posts[1], comments="7"))
+    second = save_posts(db, posts, "nasa")
+    db.commit()
+    
+    assert db.query(Post).count() == 4
+    assert [post["id"] for post in second[:3]] == [post["id"] for post in first]
+    assert (db.get(Post, first[1]["id"]).likes, db.get(Post, first[1]["id"]).comments) == (500, 7)
+
+def test_save_posts_indexes_hashtags(db):
+    """Test that hashtags are saved normalized to the hashtag index"""
+    posts = make_posts(2)
+    posts[0]["hashtags"] = ["NASA", "#space"]
+    
+    saved = save_posts(db, posts, "nasa")
+    save_posts(db, posts, "nasa")
+    db.commit()
+    
+    rows = db.query(PostHashtag).order_by(PostHashtag.hashtag).all()
+    assert [(row.hashtag, row.post_id) for row in rows] == [
+        ("nasa", saved[0]["id"]), ("space", saved[0]["id"]), ("tag1", saved[1]["id"])
+    ]
+
+def test_sqlite_engine_uses_wal(tmp_path):
+    """Test that SQLite connections from the engine factory use WAL and a busy timeout"""
+    from sqlalchemy import text
+    from models import create_db_engine
+    
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    with engine.connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert connection.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+    engine.dispose()
+
+def test_import_models_does_not_touch_database(tmp_path):
+    """Test that importing models doesn't create the database, init_db does"""
+    import subprocess
+    import sys
+    
+    path = tmp_path / "lazy.db"
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{path}"}
+    
+    subprocess.run([sys.executable, "-c", "import models, crud, tasks"], env=env, check=True)
+    assert not path.exists()
+    
+    subprocess.run([sys.executable, "-c", "import models; models.init_db(); models.init_db()"], env=env, check=True)
+    assert path.exists()
+
+def test_init_db_requires_shortcode_migration(tmp_path):
+    """Test that init_db refuses a posts table without the shortcode key and names the migration"""
+    from sqlalchemy import text
+    from models import init_db
+    
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as connection:
+        connection.execute(text(
+            "CREATE TABLE posts (id INTEGER PRIMARY KEY, url VARCHAR, text VARCHAR, title VARCHAR, likes INTEGER, "
+            "comments INTEGER, hashtags JSON, timestamp DATETIME, username VARCHAR)"
+        ))
+    
+    with pytest.raises(RuntimeError, match="compact_db.py"):
+        init_db(engine)
+    
+    with engine.begin() as connection:
+        connection.execute(text("ALTER TABLE posts ADD COLUMN shortcode VARCHAR"))
+        connection.execute(text("CREATE UNIQUE INDEX ix_posts_shortcode ON posts (shortcode)"))
+    
+    init_db(engine)
+    engine.dispose()
+
+def test_init_db_requires_engagement_migration(tmp_path):
+    """Test that init_db refuses text likes and comments columns and names the migration"""
+    from sqlalchemy import text
+    from models import init_db
+    
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as connection:
+        connection.execute(text(
+            "CREATE TABLE posts (id INTEGER PRIMARY KEY, url VARCHAR, shortcode VARCHAR, text VARCHAR, title VARCHAR, "
+            "likes VARCHAR, comments VARCHAR, hashtags JSON, timestamp DATETIME, username VARCHAR)"
+        ))
+        connection.execute(text("CREATE UNIQUE INDEX ix_posts_shortcode ON posts (shortcode)"))
+    
+    with pytest.raises(RuntimeError, match="migrate_engagement.py"):
+        init_db(engine)
+    
+    engine.dispose()
+
+def test_engagement_aggregation(db):
+    """Test that top posts and engagement are computed from integer counts"""
+    posts = make_posts(3)
+    posts[0].update(likes="9", comments="1", hashtags=["space"])
+    posts[1].update(likes=100, comments=5, hashtags=["space", "moon"])
+    posts[2].update(likes=20, comments=None, hashtags=["moon"])
+    for post in posts:
+        post["timestamp"] = datetime.now().replace(microsecond=0).isoformat()
+    save_posts(db, posts, "nasa")
+    db.commit()
+    
+    assert [post.likes for post in get_top_posts(db, limit=2)] == [100, 20]
+    
+    [day] = get_daily_engagement(db, days=1, username="nasa")
+    assert (day.posts, day.likes, day.comments) == (3, 129, 6)
+    
+    assert [(row.hashtag, row.avg_likes) for row in get_hashtag_engagement(db)] == [("moon", 60), ("space", 54.5)]
+    assert get_hashtag_engagement(db, min_posts=3) == []
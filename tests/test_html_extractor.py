@@ -0,0 +1,35 @@
+import json
+from html_extractor import extract_profile_data
+
+USER = {"id": "12345", "edge_owner_to_timeline_media": {"edges": []}}
+
+def test_extract_multiline_shared_data():
+    """Test extracting pretty-printed shared data"""
+    shared = json.dumps({"entry_data": {"ProfilePage": [{"graphql": {"user": USER}}]}}, indent=2)
+    html = f'<html><script>window._sharedData = {shared};</script></html>'
+    
+    data = extract_profile_data(html)
+    
+    assert data["shared_data"]["entry_data"]["ProfilePage"][0]["graphql"]["user"]["id"] == "12345"
+    assert data["user_id"] == "12345"
+
+def test_extract_user_from_later_data_sjs_script():
+    """Test that all data-sjs scripts are searched for user data"""
+    other = json.dumps({"require": [["ScheduledServerJS", "handle", None]]})
+    profile = json.dumps({"require": [["ProfilePage", "init", {"user": USER}]]})
+    html = (f'<script type="application/json" data-sjs>{other}</script>'
+            f'<script type="application/json" data-sjs>{profile}</script>')
+    
+    data = extract_profile_data(html)
+    
+    assert data["shared_data"] == {"user": USER}
+    assert data["user_id"] == "12345"
+
+def test_extract_user_id_fallbacks():
+    """Test user ID markers used when there is no shared data"""
+    meta = '<meta content="instagram://user?id=777" property="al:ios:url" />'
+    
+    assert extract_profile_data(f'<head>{meta}</head>')["user_id"] == "777"
+    assert extract_profile_data(f'<head>{meta}</head>{{"profilePage_555"}}')["user_id"] == "555"
+    assert extract_profile_data('{"profilePage_555","user_id":"999"}')["user_id"] == "999"
+    assert extract_profile_data('<html></html>') == {"shared_data": None, "user_id": None}
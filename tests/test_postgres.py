@@ -0,0 +1,128 @@
+import uuid
+from unittest.mock import patch
+import pytest
+from sqlalchemy import create_engine, inspect, text, Integer
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import sessionmaker
+from models import DATABASE_URL, Post, PostHashtag, init_db
+from crud import save_posts, search_posts
+import migrate_engagement
+
+# PostgreSQL paths run only against a PostgreSQL DATABASE_URL (as in CI)
+pytestmark = pytest.mark.skipif(
+    make_url(DATABASE_URL).get_backend_name() != "postgresql",
+    reason="DATABASE_URL is not a PostgreSQL database"
+)
+
+@pytest.fixture
+def engine():
+    """Create an engine on an empty schema of the PostgreSQL database (dropped afterwards)"""
+    schema = f"test_{uuid.uuid4().hex}"
+    admin_engine = create_engine(DATABASE_URL)
+    with admin_engine.begin() as connection:
+        connection.execute(text(f"CREATE SCHEMA {schema}"))
+    
+    engine = create_engine(DATABASE_URL, connect_args={"options": f"-csearch_path={schema}"})
+    yield engine
+    
+    engine.dispose()
+    with admin_engine.begin() as connection:
+        connection.execute(text(f"DROP SCHEMA {schema} CASCADE"))
+    admin_engine.dispose()
+
+@pytest.fixture
+def db(engine):
+    """Create a database session on a fully initialized schema"""
+    init_db(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+def make_post(shortcode, title, text, likes=0, comments=0, hashtags=()):
+    """Create scraped post"""
+    return {
+        "url": f"https://www.instagram.com/p/{shortcode}/",
+        "text": text,
+        "title": title,
+        "likes": likes,
+        "comments": comments,
+        "hashtags": list(hashtags),
+        "timestamp": "2024-01-01T00:00:00",
+        "shortcode": shortcode
+    }
+
+def test_search_ranks_title_matches_first(db):
+    """Test that the tsvector search matches all words and ranks title matches above caption matches"""
+    save_posts(db, [
+        make_post("CAPTION", "Weekly update", "Photos of the Mars rover landing site"),
+        make_post("TITLE", "Mars rover", "Landing site photos"),
+        make_post("ONE_WORD", "Mars", "Red planet"),
+        make_post("OTHER", "Moon", "Lunar rover")
+    ], "nasa")
+    db.commit()
+    
+    results = search_posts(db, "mars rover")
+    
+    assert [post.shortcode for post, _ in results] == ["TITLE", "CAPTION"]
+    assert results[0][1] > results[1][1] > 0
+    assert [post.shortcode for post, _ in search_posts(db, "mars rover", limit=1, offset=1)] == ["CAPTION"]
+    
+    # Search syntax of user input is not an error
+    assert [post.shortcode for post, _ in search_posts(db, 'mars -rover')] == ["ONE_WORD"]
+
+def test_search_index_is_gin_on_generated_column(engine):
+    """Test that init_db adds the generated search column and its GIN index"""
+    init_db(engine)
+    
+    assert "search_vector" in [column["name"] for column in inspect(engine).get_columns("posts")]
+    with engine.connect() as connection:
+        definition = connection.execute(text(
+            "SELECT indexdef FROM pg_indexes WHERE indexname = 'ix_posts_search_vector' AND schemaname = current_schema()"
+        )).scalar()
+    assert "USING gin (search_vector)" in definition
+
+def test_save_posts_upserts_by_shortcode(db):
+    """Test that saving the same posts again only refreshes likes and comments"""
+    posts = [make_post(f"C{i}", f"Post {i}", f"Post {i}", likes=i, hashtags=["#space"]) for i in range(4)]
+    first = save_posts(db, posts[:3], "nasa")
+    db.commit()
+    
+    posts[1]["likes"] = "500"
+    posts.append(dict(posts[1], comments="7"))
+    second = save_posts(db, posts, "nasa")
+    db.commit()
+    
+    assert db.query(Post).count() == 4
+    assert [post["id"] for post in second[:3]] == [post["id"] for post in first]
+    assert (db.get(Post, first[1]["id"]).likes, db.get(Post, first[1]["id"]).comments) == (500, 7)
+    assert db.get(Post, first[1]["id"]).title == "Post 1"
+    assert db.query(PostHashtag).count() == 4
+
+def test_migrate_engagement_converts_text_counts(engine):
+    """Test that text likes and comments are converted to integers in place"""
+    with engine.begin() as connection:
+        connection.execute(text(
+            "CREATE TABLE posts (id SERIAL PRIMARY KEY, url VARCHAR, shortcode VARCHAR, text TEXT, title VARCHAR, "
+            "likes VARCHAR, comments VARCHAR, hashtags TEXT, timestamp TIMESTAMP, username VARCHAR)"
+        ))
+        connection.execute(text("CREATE UNIQUE INDEX ix_posts_shortcode ON posts (shortcode)"))
+        connection.execute(text(
+            "INSERT INTO posts (shortcode, likes, comments, username) VALUES "
+            "('A', '1,234', '12', 'nasa'), ('B', '', NULL, 'nasa'), ('C', '9', 'n/a', 'nasa')"
+        ))
+    
+    with pytest.raises(RuntimeError, match="migrate_engagement.py"):
+        init_db(engine)
+    
+    with patch('migrate_engagement.engine', engine), patch('migrate_engagement.init_db', lambda: init_db(engine)):
+        migrate_engagement.migrate_engagement()
+        
+        # Safe to run again
+        migrate_engagement.migrate_engagement()
+    
+    columns = {column["name"]: column["type"] for column in inspect(engine).get_columns("posts")}
+    assert isinstance(columns["likes"], Integer) and isinstance(columns["comments"], Integer)
+    
+    with engine.connect() as connection:
+        rows = connection.execute(text("SELECT shortcode, likes, comments FROM posts ORDER BY shortcode")).all()
+    assert [tuple(row) for row in rows] == [("A", 1234, 12), ("B", 0, 0), ("C", 9, 0)]
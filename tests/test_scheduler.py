@@ -0,0 +1,95 @@
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from models import Base, TrackedAccount
+from crud import save_posts
+import scheduler
+import tasks
+
+@pytest.fixture
+def db():
+    """Create an in-memory database session"""
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+def make_post(shortcode, timestamp):
+    """Create a scraped post"""
+    return {
+        "url": f"https://www.instagram.com/p/{shortcode}/",
+        "shortcode": shortcode,
+        "text": "",
+        "likes": 0,
+        "hashtags": [],
+        "timestamp": timestamp
+    }
+
+def make_posts(count, days):
+    """Create scraped posts spread over the last days"""
+    now = datetime.now()
+    return [make_post(f"C{i}", (now - timedelta(days=days * i / count)).isoformat()) for i in range(count)]
+
+def test_compute_interval():
+    """Test that frequent posters are polled often and dormant accounts rarely"""
+    assert scheduler.compute_interval(None) == scheduler.SCHEDULE_DEFAULT_INTERVAL
+    assert scheduler.compute_interval(0) == scheduler.SCHEDULE_MAX_INTERVAL
+    assert scheduler.compute_interval(6) == 4 * 3600
+    assert scheduler.compute_interval(1000) == scheduler.SCHEDULE_MIN_INTERVAL
+
+def test_reschedule_from_posting_rate(db):
+    """Test that the interval follows the posting rate of stored posts"""
+    scheduler.track_account(db, "nasa")
+    scheduler.track_account(db, "dormant")
+    now = datetime.now()
+    save_posts(db, make_posts(28, 14) + [make_post("OLD", (now - timedelta(days=30)).isoformat())], "nasa")
+    db.commit()
+    
+    account = scheduler.reschedule_account(db, "nasa", "SUCCESS", now)
+    
+    assert account.posts_per_day == 2
+    assert account.interval == 12 * 3600
+    assert account.next_scrape_at == now + timedelta(hours=12)
+    assert scheduler.reschedule_account(db, "dormant", "SUCCESS", now).interval == scheduler.SCHEDULE_DEFAULT_INTERVAL
+    assert scheduler.reschedule_account(db, "unknown", "SUCCESS", now) is None
+
+def test_fresh_account_rate_uses_stored_history(db):
+    """Test that the posting rate of a newly tracked account is measured on its short history"""
+    scheduler.track_account(db, "fresh")
+    save_posts(db, make_posts(10, 0.4), "fresh")
+    db.commit()
+    
+    account = scheduler.reschedule_account(db, "fresh", "SUCCESS")
+    
+    # 10 posts in the last ~9 hours, not 10 posts in 14 days
+    assert account.posts_per_day > 20
+    assert account.interval < 2 * 3600
+
+def test_claim_due_accounts(db):
+    """Test that due accounts are dispatched once, most overdue first"""
+    now = datetime.now()
+    for username, due_in in [("late", -60), ("later", -120), ("future", 60)]:
+        db.add(TrackedAccount(username=username, num_posts=5, enabled=True, interval=600,
+                              next_scrape_at=now + timedelta(seconds=due_in)))
+    db.commit()
+    
+    assert [account.username for account in scheduler.claim_due_accounts(db, now)] == ["later", "late"]
+    assert scheduler.claim_due_accounts(db, now) == []
+    assert [account["due"] for account in scheduler.get_schedule(db, now)] == [False, False, False]
+
+@patch('tasks.group')
+def test_schedule_due_scrapes_dispatches_batch(mock_group, db):
+    """Test that the scheduler task starts periodic scrapes of due accounts"""
+    scheduler.track_account(db, "nasa", 5)
+    db.commit()
+    
+    with patch('tasks.SessionLocal', return_value=db):
+        result = tasks.schedule_due_scrapes()
+    
+    assert result == {"dispatched": ["nasa"]}
+    [signature] = list(mock_group.call_args[0][0])
+    assert signature.task == "tasks.scrape_instagram_periodic"
+    assert signature.args == ("nasa", 5)
@@ -0,0 +1,57 @@
+from unittest.mock import patch, MagicMock
+from scrape_lock import ScrapeLock
+import tasks
+
+def test_lock_single_flight():
+    """Test that a second scrape of an account gets the ID of the running one"""
+    lock = ScrapeLock(redis_getter=lambda: None)
+    
+    assert lock.acquire("NASA", "task-1") == "task-1"
+    assert lock.acquire("nasa", "task-2") == "task-1"
+    assert lock.acquire("nasa", "task-1") == "task-1"
+    
+    lock.release("nasa", "task-2")
+    assert lock.acquire("nasa", "task-3") == "task-1"
+    
+    lock.release("nasa", "task-1")
+    assert lock.acquire("nasa", "task-3") == "task-3"
+
+def test_lock_expires():
+    """Test that locks of crashed scrapes expire"""
+    lock = ScrapeLock(ttl=-1, redis_getter=lambda: None)
+    lock.acquire("nasa", "task-1")
+    
+    assert lock.acquire("nasa", "task-2") == "task-2"
+
+def test_queued_lock_covers_queue_wait():
+    """Test that a lock taken at enqueue time lives longer, until the task starts"""
+    lock = ScrapeLock(ttl=-1, redis_getter=lambda: None)
+    lock.acquire("nasa", "task-1", ttl=60)
+    
+    assert lock.acquire("nasa", "task-2") == "task-1"
+    
+    # Task started: lock gets the lifetime of a running scrape
+    lock.refresh("nasa", "task-1")
+    assert lock.acquire("nasa", "task-2") == "task-2"
+
+def test_lock_uses_redis():
+    """Test that the lock is taken with SET NX and falls back to the holder's ID"""
+    client = MagicMock()
+    client.set.return_value = None
+    client.get.return_value = "task-1"
+    lock = ScrapeLock(ttl=60, redis_getter=lambda: client)
+    
+    assert lock.acquire("nasa", "task-2") == "task-1"
+    client.set.assert_called_with("instagram:scrape_lock:nasa", "task-2", nx=True, ex=60)
+
+@patch('tasks.InstagramScraper')
+@patch('tasks.scrape_lock', ScrapeLock(redis_getter=lambda: None))
+def test_task_skips_account_being_scraped(mock_scraper):
+    """Test that a task doesn't scrape an account another task is scraping"""
+    tasks.scrape_lock.acquire("nasa", "task-1")
+    
+    result = tasks.run_scrape("nasa", 10, False, "task-2")
+    
+    assert result["status"] == "SKIPPED"
+    assert result["result"]["task_id"] == "task-1"
+    mock_scraper.assert_not_called()
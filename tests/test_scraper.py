@@ -1,6 +1,14 @@
 import pytest
-from unittest.mock import patch, MagicMock
-from instagram_scraper import InstagramScraper
+import asyncio
+import json
+import threading
+from unittest.mock import patch, MagicMock, AsyncMock
+from instagram_scraper import InstagramScraper, ScrapeCancelled
+from async_instagram_scraper import AsyncInstagramScraper
+from user_id_cache import UserIdCache
+from http_session import create_session
+from method_stats import MethodStats
+from rate_limiter import RateLimiter
 from datetime import datetime
 
 @pytest.fixture
@@ -54,9 +62,19 @@ def mock_response():
     return mock
 
 @pytest.fixture
-def scraper():
+def method_stats():
+    """Create in-process method stats"""
+    return MethodStats(threshold=2, cooldown=600, redis_getter=lambda: None)
+
+@pytest.fixture
+def rate_limiter():
+    """Create in-process rate limiter that doesn't throttle tests"""
+    return RateLimiter(default_rate=6000, identity_rate=6000, host_budgets={}, burst=100, redis_getter=lambda: None)
+
+@pytest.fixture
+def scraper(method_stats, rate_limiter):
     """Create a scraper instance"""
-    return InstagramScraper()
+    return InstagramScraper(method_stats=method_stats, rate_limiter=rate_limiter)
 
 @patch('requests.get')
 def test_scraper_extract_shared_data(mock_get, scraper, mock_response):
@@ -95,4 +113,457 @@ def test_get_posts_success(mock_graphql, mock_user_id, scraper):
     
     # Assert
     assert actual_posts == expected_posts
-    mock_graphql.assert_called_once_with(test_username, 1) 
\ No newline at end of file
+    mock_graphql.assert_called_once_with(test_username, 1) 
+
+@patch('async_instagram_scraper.AsyncInstagramScraper._get_user_id', new_callable=AsyncMock)
+@patch('async_instagram_scraper.AsyncInstagramScraper._fetch', new_callable=AsyncMock)
+def test_async_get_posts_via_graphql(mock_fetch, mock_user_id, method_stats):
+    """Test async post retrieval through GraphQL"""
+    # Arrange
+    mock_user_id.return_value = "12345"
+    mock_fetch.return_value = (200, json.dumps({
+        "data": {
+            "user": {
+                "edge_owner_to_timeline_media": {
+                    "edges": [
+                        {"node": {"shortcode": "ABC123", "taken_at_timestamp": 1623456789}},
+                        {"node": {"shortcode": "DEF456", "taken_at_timestamp": 1623456700}}
+                    ],
+                    "page_info": {"has_next_page": False}
+                }
+            }
+        }
+    }))
+    
+    # Act
+    posts = asyncio.run(AsyncInstagramScraper(method_stats=method_stats).get_posts("testuser", 2))
+    
+    # Assert
+    assert [post["url"] for post in posts] == [
+        "https://www.instagram.com/p/ABC123/",
+        "https://www.instagram.com/p/DEF456/"
+    ]
+    assert all(post["username"] == "testuser" for post in posts)
+    mock_fetch.assert_awaited_once()
+
+@patch('async_instagram_scraper.AsyncInstagramScraper._get_user_id', new_callable=AsyncMock)
+@patch('async_instagram_scraper.AsyncInstagramScraper._fetch', new_callable=AsyncMock)
+def test_async_get_posts_incremental(mock_fetch, mock_user_id, method_stats):
+    """Test that async scraping honours the high-water mark like the sync scraper"""
+    mock_user_id.return_value = "12345"
+    mock_fetch.return_value = (200, json.dumps({
+        "data": {
+            "user": {
+                "edge_owner_to_timeline_media": {
+                    "edges": [
+                        {"node": {"shortcode": "NEW", "taken_at_timestamp": 1623456789}},
+                        {"node": {"shortcode": "STORED", "taken_at_timestamp": 1623450000}}
+                    ],
+                    "page_info": {"has_next_page": True, "end_cursor": "cursor"}
+                }
+            }
+        }
+    }))
+    scraper = AsyncInstagramScraper(method_stats=method_stats)
+    
+    posts = asyncio.run(scraper.get_posts("testuser", 10, since={"shortcode": "STORED", "timestamp": 1623450000}))
+    
+    assert [post["shortcode"] for post in posts] == ["NEW"]
+    mock_fetch.assert_awaited_once()
+    assert not hasattr(scraper, "iter_pages")
+
+@patch('async_instagram_scraper.AsyncInstagramScraper._get_user_id', new_callable=AsyncMock)
+@patch('async_instagram_scraper.AsyncInstagramScraper._fetch', new_callable=AsyncMock)
+def test_async_concurrent_get_posts_keep_their_own_state(mock_fetch, mock_user_id, method_stats):
+    """Test that concurrent calls on one async scraper don't share high-water mark state"""
+    mock_user_id.side_effect = lambda username: {"old": "1", "new": "2"}[username]
+    
+    async def fetch(url, *args, **kwargs):
+        # Let the other call run in between
+        await asyncio.sleep(0)
+        shortcodes = ["A1", "STORED"] if '"id": "1"' in url else ["B1", "B2"]
+        return 200, json.dumps({"data": {"user": {"edge_owner_to_timeline_media": {
+            "edges": [{"node": {"shortcode": code, "taken_at_timestamp": 1623450000 + 100 * (1 - i)}}
+                      for i, code in enumerate(shortcodes)],
+            "page_info": {"has_next_page": False}
+        }}}})
+    
+    mock_fetch.side_effect = fetch
+    scraper = AsyncInstagramScraper(method_stats=method_stats)
+    headers = dict(scraper.headers)
+    
+    async def scrape_both():
+        return await asyncio.gather(
+            scraper.get_posts("old", 10, since={"shortcode": "STORED", "timestamp": 1623450000}),
+            scraper.get_posts("new", 10)
+        )
+    
+    old_posts, new_posts = asyncio.run(scrape_both())
+    
+    assert [post["shortcode"] for post in old_posts] == ["A1"]
+    assert [post["shortcode"] for post in new_posts] == ["B1", "B2"]
+    assert scraper.since is None
+    assert scraper.headers == headers
+
+def test_async_scraper_calls_redis_off_the_event_loop():
+    """Test that rate limiter, user ID cache and method stats (blocking Redis calls) don't run on the event loop"""
+    on_loop = []
+    
+    def redis_getter():
+        try:
+            asyncio.get_running_loop()
+            on_loop.append(True)
+        except RuntimeError:
+            on_loop.append(False)
+        return None
+    
+    async def fetch(url, *args, **kwargs):
+        await scraper.rate_limiter.acquire_async(url, scraper.identity)
+        if "__a=1" in url:
+            return 200, json.dumps({"graphql": {"user": {"id": "12345"}}})
+        return 200, json.dumps({"data": {"user": {"edge_owner_to_timeline_media": {
+            "edges": [{"node": {"shortcode": "ABC123", "taken_at_timestamp": 1623456789}}],
+            "page_info": {"has_next_page": False}
+        }}}})
+    
+    scraper = AsyncInstagramScraper(
+        user_id_cache=UserIdCache(redis_getter=redis_getter),
+        method_stats=MethodStats(redis_getter=redis_getter),
+        rate_limiter=RateLimiter(redis_getter=redis_getter)
+    )
+    
+    with patch.object(scraper, '_fetch', side_effect=fetch):
+        posts = asyncio.run(scraper.get_posts("testuser", 1))
+    
+    assert [post["shortcode"] for post in posts] == ["ABC123"]
+    assert on_loop and not any(on_loop)
+
+def test_async_session_of_finished_loop_is_closed():
+    """Test that the shared aiohttp session is closed when another event loop needs one"""
+    async def get_session():
+        return await AsyncInstagramScraper.get_session()
+    
+    first = asyncio.run(get_session())
+    second = asyncio.run(get_session())
+    
+    assert first is not second
+    assert first.closed
+    asyncio.run(AsyncInstagramScraper.close_session())
+    assert second.closed
+
+def test_scrapers_share_http_session():
+    """Test that scrapers reuse the process-wide HTTP session and keep its cookies"""
+    assert InstagramScraper().session is InstagramScraper().session
+    
+    session = create_session()
+    first = InstagramScraper(session=session)
+    second = InstagramScraper(session=session)
+    
+    assert second.session.cookies.get('mid') == first.cookies['mid']
+
+@patch('instagram_scraper.InstagramScraper._get_user_id')
+def test_get_posts_incremental_stops_at_stored_post(mock_user_id, method_stats, rate_limiter):
+    """Test that incremental scraping returns only new posts and doesn't paginate further"""
+    # Arrange
+    mock_user_id.return_value = "12345"
+    session = MagicMock()
+    session.get.return_value.status_code = 200
+    session.get.return_value.json.return_value = {
+        "data": {
+            "user": {
+                "edge_owner_to_timeline_media": {
+                    "edges": [
+                        {"node": {"shortcode": "PINNED", "taken_at_timestamp": 1600000000}},
+                        {"node": {"shortcode": "NEW", "taken_at_timestamp": 1623456789}},
+                        {"node": {"shortcode": "STORED", "taken_at_timestamp": 1623450000}}
+                    ],
+                    "page_info": {"has_next_page": True, "end_cursor": "cursor"}
+                }
+            }
+        }
+    }
+    scraper = InstagramScraper(session=session, method_stats=method_stats, rate_limiter=rate_limiter)
+    
+    # Act
+    posts = scraper.get_posts("testuser", 10, since={"shortcode": "STORED", "timestamp": 1623450000})
+    
+    # Assert
+    assert [post["shortcode"] for post in posts] == ["NEW"]
+    session.get.assert_called_once()
+
+@patch('instagram_scraper.InstagramScraper._get_user_id')
+def test_get_posts_incremental_without_new_posts(mock_user_id, method_stats, rate_limiter):
+    """Test that incremental scraping without new posts is not a failure"""
+    mock_user_id.return_value = "12345"
+    session = MagicMock()
+    session.get.return_value.status_code = 200
+    session.get.return_value.json.return_value = {
+        "data": {
+            "user": {
+                "edge_owner_to_timeline_media": {
+                    "edges": [{"node": {"shortcode": "STORED", "taken_at_timestamp": 1623450000}}],
+                    "page_info": {"has_next_page": True, "end_cursor": "cursor"}
+                }
+            }
+        }
+    }
+    scraper = InstagramScraper(session=session, method_stats=method_stats, rate_limiter=rate_limiter)
+    
+    assert scraper.get_posts("testuser", 10, since={"shortcode": "STORED", "timestamp": 1623450000}) == []
+    session.get.assert_called_once()
+
+@patch('instagram_scraper.InstagramScraper._get_user_id')
+def test_get_posts_incremental_paginates_past_pinned_post(mock_user_id, method_stats, rate_limiter):
+    """Test that an old pinned post on top of new posts doesn't stop pagination"""
+    # Arrange
+    mock_user_id.return_value = "12345"
+    
+    def timeline(edges, has_next_page):
+        response = MagicMock()
+        response.status_code = 200
+        response.json.return_value = {"data": {"user": {"edge_owner_to_timeline_media": {
+            "edges": [{"node": {"shortcode": code, "taken_at_timestamp": timestamp}} for code, timestamp in edges],
+            "page_info": {"has_next_page": has_next_page, "end_cursor": "cursor"}
+        }}}}
+        return response
+    
+    session = MagicMock()
+    session.get.side_effect = [
+        timeline([("PINNED", 1600000000)] + [(f"A{i}", 1623456789 - i) for i in range(11)], True),
+        timeline([(f"B{i}", 1623456000 - i) for i in range(10)], False)
+    ]
+    scraper = InstagramScraper(session=session, method_stats=method_stats, rate_limiter=rate_limiter)
+    
+    # Act
+    posts = scraper.get_posts("testuser", 30, since={"shortcode": "STORED", "timestamp": 1623450000})
+    
+    # Assert
+    assert len(posts) == 21
+    assert "PINNED" not in [post["shortcode"] for post in posts]
+    assert session.get.call_count == 2
+    assert not scraper.reached_watermark and scraper.reached_end
+
+@patch('instagram_scraper.SCRAPER_INCREMENTAL_MAX_PAGES', 3)
+@patch('instagram_scraper.InstagramScraper._get_user_id')
+def test_get_posts_incremental_paginates_to_stored_post(mock_user_id, method_stats, rate_limiter):
+    """Test that incremental scraping isn't cut off by num_posts before reaching stored posts"""
+    # Arrange
+    mock_user_id.return_value = "12345"
+    
+    def timeline(edges):
+        response = MagicMock()
+        response.status_code = 200
+        response.json.return_value = {"data": {"user": {"edge_owner_to_timeline_media": {
+            "edges": [{"node": {"shortcode": code, "taken_at_timestamp": timestamp}} for code, timestamp in edges],
+            "page_info": {"has_next_page": True, "end_cursor": "cursor"}
+        }}}}
+        return response
+    
+    session = MagicMock()
+    session.get.side_effect = [
+        timeline([(f"A{i}", 1623456789 - i) for i in range(12)]),
+        timeline([(f"B{i}", 1623456000 - i) for i in range(5)] + [("STORED", 1623450000)])
+    ]
+    scraper = InstagramScraper(session=session, method_stats=method_stats, rate_limiter=rate_limiter)
+    
+    # Act
+    posts = scraper.get_posts("testuser", 5, since={"shortcode": "STORED", "timestamp": 1623450000})
+    
+    # Assert
+    assert len(posts) == 17
+    assert scraper.reached_watermark
+    
+    # Stored posts out of reach: pagination stops at the page cap
+    session.get.side_effect = [timeline([(f"C{i}", 1623456789 - i) for i in range(50)])] * 5
+    session.get.reset_mock()
+    
+    posts = scraper.get_posts("testuser", 5, since={"shortcode": "STORED", "timestamp": 1623450000})
+    
+    assert session.get.call_count == 3
+    assert not scraper.reached_watermark and not scraper.reached_end
+
+@patch('instagram_scraper.InstagramScraper._get_posts_via_alternative_api')
+@patch('instagram_scraper.InstagramScraper._get_posts_via_html')
+@patch('instagram_scraper.InstagramScraper._get_posts_via_graphql')
+def test_get_posts_tries_best_method_first(mock_graphql, mock_html, mock_alternative_api, scraper):
+    """Test that a method that failed is tried after the one that works"""
+    # Arrange
+    mock_graphql.return_value = []
+    mock_html.return_value = [{"url": "https://www.instagram.com/p/ABC123/"}]
+    
+    # Act
+    for _ in range(3):
+        scraper.get_posts("testuser", 1)
+    
+    # Assert
+    assert mock_graphql.call_count == 1
+    assert mock_html.call_count == 3
+    mock_alternative_api.assert_not_called()
+
+def test_circuit_breaker_skips_failing_method(method_stats):
+    """Test that a method failing repeatedly is skipped for the cool-down period"""
+    method_stats.record("graphql", False, 1.0)
+    assert not method_stats.is_open("graphql")
+    
+    method_stats.record("graphql", False, 1.0)
+    assert method_stats.is_open("graphql")
+    assert method_stats.order(InstagramScraper.METHODS) == ["html", "alternative_api"]
+    
+    # Breaker closes after cool-down
+    method_stats.cooldown = 0
+    method_stats.record("graphql", False, 1.0)
+    assert "graphql" in method_stats.order(InstagramScraper.METHODS)
+
+def test_all_breakers_open_allows_trial_call(method_stats):
+    """Test that the method whose breaker closes first is tried when all breakers are open"""
+    for method in InstagramScraper.METHODS:
+        method_stats.record(method, False, 1.0)
+        method_stats.record(method, False, 1.0)
+    
+    method_stats.cooldown = 60
+    method_stats.record("html", False, 1.0)
+    
+    assert all(method_stats.is_open(method) for method in InstagramScraper.METHODS)
+    assert method_stats.order(InstagramScraper.METHODS) == ["html"]
+
+def test_rate_limiter_enforces_budget():
+    """Test that requests above the budget have to wait, separately per host"""
+    limiter = RateLimiter(host_budgets={"www.instagram.com": 60}, default_rate=60, burst=2, redis_getter=lambda: None)
+    
+    assert limiter.try_acquire("https://www.instagram.com/nasa/") == 0
+    assert limiter.try_acquire("https://www.instagram.com/graphql/query/") == 0
+    assert limiter.try_acquire("https://www.instagram.com/nasa/") > 0
+    assert limiter.try_acquire("https://feeds.bbci.co.uk/news/world/rss.xml") == 0
+
+def test_rate_limiter_enforces_identity_budget():
+    """Test that one identity can't use the whole host budget"""
+    limiter = RateLimiter(host_budgets={}, default_rate=6000000, identity_rate=60, burst=1, redis_getter=lambda: None)
+    
+    assert limiter.try_acquire("https://www.instagram.com/nasa/", "first") == 0
+    assert limiter.try_acquire("https://www.instagram.com/nasa/", "first") > 0
+    assert limiter.try_acquire("https://www.instagram.com/nasa/", "second") == 0
+
+def _timeline_response(shortcodes, has_next_page):
+    """Create a mock GraphQL timeline response"""
+    response = MagicMock()
+    response.status_code = 200
+    response.json.return_value = {
+        "data": {
+            "user": {
+                "edge_owner_to_timeline_media": {
+                    "edges": [{"node": {"shortcode": code, "taken_at_timestamp": 1623456789}} for code in shortcodes],
+                    "page_info": {"has_next_page": has_next_page, "end_cursor": "cursor"}
+                }
+            }
+        }
+    }
+    return response
+
+@patch('instagram_scraper.InstagramScraper._get_user_id')
+def test_iter_pages_yields_page_before_requesting_next(mock_user_id, method_stats, rate_limiter):
+    """Test that pages are yielded as soon as they are parsed"""
+    # Arrange
+    mock_user_id.return_value = "12345"
+    session = MagicMock()
+    session.get.side_effect = [
+        _timeline_response(["A", "B"], True),
+        _timeline_response(["C", "D"], False)
+    ]
+    scraper = InstagramScraper(session=session, method_stats=method_stats, rate_limiter=rate_limiter)
+    scraper.pipeline_pages = False
+    
+    # Act
+    pages = scraper.iter_pages("testuser", 4)
+    first_page = next(pages)
+    
+    # Assert
+    assert [post["shortcode"] for post in first_page] == ["A", "B"]
+    assert session.get.call_count == 1
+    assert [post["shortcode"] for post in next(pages)] == ["C", "D"]
+    assert session.get.call_count == 2
+    with pytest.raises(StopIteration):
+        next(pages)
+    assert scraper.current_method == "graphql"
+
+@patch('instagram_scraper.InstagramScraper._get_user_id')
+def test_iter_pages_prefetches_next_page(mock_user_id, method_stats, rate_limiter):
+    """Test that next page is requested while the current page is processed"""
+    # Arrange
+    mock_user_id.return_value = "12345"
+    second_page_requested = threading.Event()
+    
+    def get(url, **kwargs):
+        if '"after": "cursor"' in url:
+            second_page_requested.set()
+            return _timeline_response(["C", "D"], False)
+        return _timeline_response(["A", "B"], True)
+    
+    session = MagicMock()
+    session.get.side_effect = get
+    scraper = InstagramScraper(session=session, method_stats=method_stats, rate_limiter=rate_limiter)
+    scraper.pipeline_pages = True
+    headers = dict(scraper.headers)
+    
+    # Act
+    pages = scraper.iter_pages("testuser", 4)
+    first_page = next(pages)
+    
+    # Assert
+    assert [post["shortcode"] for post in first_page] == ["A", "B"]
+    assert second_page_requested.wait(1)
+    assert [post["shortcode"] for post in next(pages)] == ["C", "D"]
+    assert session.get.call_count == 2
+    
+    # Headers are passed per request, not changed in place (shared with the prefetch thread)
+    assert scraper.headers == headers
+    assert all(call.kwargs["headers"] is not scraper.headers for call in session.get.call_args_list)
+
+@patch('instagram_scraper.InstagramScraper._iter_pages_via_alternative_api')
+@patch('instagram_scraper.InstagramScraper._iter_pages_via_html')
+@patch('instagram_scraper.InstagramScraper._iter_pages_via_graphql')
+def test_iter_posts_fails_when_all_methods_fail(mock_graphql, mock_html, mock_alternative_api, scraper):
+    """Test that iter_posts raises like get_posts if no method returns posts"""
+    mock_graphql.return_value = iter([])
+    mock_html.return_value = iter([[]])
+    mock_alternative_api.return_value = iter([])
+    
+    with pytest.raises(Exception, match="Scraping failed"):
+        list(scraper.iter_posts("testuser", 5))
+
+@patch('instagram_scraper.InstagramScraper.get_posts', autospec=True)
+def test_get_posts_many(mock_get_posts, scraper):
+    """Test scraping several accounts with shared session and rate limiter"""
+    def get_posts(account_scraper, username, num_posts):
+        if username == "broken":
+            raise Exception("Scraping failed")
+        return [{"username": username}]
+    
+    mock_get_posts.side_effect = get_posts
+    
+    results = scraper.get_posts_many(["nasa", "esa", "nasa", "broken"], 3)
+    
+    assert results == {"nasa": [{"username": "nasa"}], "esa": [{"username": "esa"}]}
+    assert mock_get_posts.call_count == 3
+    
+    for call in mock_get_posts.call_args_list:
+        account_scraper = call.args[0]
+        assert account_scraper is not scraper
+        assert account_scraper.session is scraper.session
+        assert account_scraper.user_id_cache is scraper.user_id_cache
+        assert account_scraper.method_stats is scraper.method_stats
+        assert account_scraper.rate_limiter is scraper.rate_limiter
+
+def test_cancelled_scrape_is_not_a_method_failure(method_stats, rate_limiter):
+    """Test that cancellation stops scraping without opening circuit breakers"""
+    session = MagicMock()
+    cancel_event = threading.Event()
+    cancel_event.set()
+    scraper = InstagramScraper(session=session, method_stats=method_stats, rate_limiter=rate_limiter, cancel_event=cancel_event)
+    
+    with pytest.raises(ScrapeCancelled):
+        scraper.get_posts("testuser", 5)
+    with pytest.raises(ScrapeCancelled):
+        list(scraper.iter_pages("testuser", 5))
+    
+    session.get.assert_not_called()
+    assert method_stats.get("graphql")["failures"] == 0
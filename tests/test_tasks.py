@@ -0,0 +1,178 @@
+from datetime import datetime
+import json
+from unittest.mock import patch, MagicMock
+from scrape_lock import ScrapeLock
+import tasks
+
+@patch('tasks.get_redis', return_value=None)
+@patch('tasks.scrape_batch_lane')
+def test_start_batch_limits_concurrency(mock_lane, mock_get_redis):
+    """Test that batch accounts are split into a limited number of lanes"""
+    batch = tasks.start_batch(["a", "b", "c", "b", "d", "e"], 5, concurrency=2)
+    
+    calls = mock_lane.apply_async.call_args_list
+    assert [[username for username, _ in call.args[0][0]] for call in calls] == [["a", "c", "e"], ["b", "d"]]
+    assert [task_id for _, task_id in calls[0].args[0][0]] == [batch["tasks"][name] for name in ["a", "c", "e"]]
+    assert [call.kwargs["task_id"] for call in calls] == list(batch["lanes"])
+    assert tasks.load_batch(batch["batch_id"]) == batch
+
+@patch('tasks.get_redis', return_value=None)
+@patch('celery_app.celery_app.AsyncResult')
+def test_batch_progress(mock_async_result, mock_get_redis):
+    """Test aggregate progress of a batch"""
+    tasks.save_batch({"batch_id": "batch-1", "created_at": "2024-01-01T00:00:00", "num_posts": 5,
+                      "tasks": {"a": "task-a", "b": "task-b", "c": "task-c", "d": "task-d"},
+                      "lanes": {"lane-1": ["a", "c"], "lane-2": ["b", "d"]}})
+    
+    def async_result(task_id):
+        result = MagicMock()
+        result.state = {"task-a": "SUCCESS", "task-b": "SUCCESS", "lane-2": "REVOKED"}.get(task_id, "PENDING")
+        result.ready.return_value = result.state in ("SUCCESS", "REVOKED")
+        result.successful.return_value = result.state == "SUCCESS"
+        result.result = {
+            "task-a": {"status": "SUCCESS", "result": [{"id": 1}, {"id": 2}]},
+            "task-b": {"status": "FAILURE", "result": {"error": "Scraping failed"}}
+        }.get(task_id)
+        return result
+    
+    mock_async_result.side_effect = async_result
+    
+    progress = tasks.get_batch_progress("batch-1")
+    
+    assert progress["status"] == "PROCESSING"
+    assert (progress["completed"], progress["succeeded"], progress["failed"], progress["pending"]) == (3, 1, 2, 1)
+    assert progress["posts"] == 2
+    assert progress["accounts"][1]["error"] == "Scraping failed"
+    
+    # Account of the revoked lane is never scraped
+    assert progress["accounts"][3]["status"] == "FAILURE"
+
+@patch('tasks.run_scrape')
+def test_batch_lane_continues_after_failed_account(mock_run_scrape):
+    """Test that a lane stores each account's result and skips accounts already scraped"""
+    mock_run_scrape.side_effect = [Exception("Database is locked"), {"status": "SUCCESS", "result": []}]
+    backend = MagicMock()
+    
+    lane = type(tasks.scrape_batch_lane._get_current_object())
+    
+    with patch.object(lane, 'backend', backend), patch.object(lane, 'AsyncResult') as mock_async_result:
+        mock_async_result.side_effect = lambda task_id: MagicMock(ready=MagicMock(return_value=task_id == "task-a"))
+        tasks.scrape_batch_lane.run([["a", "task-a"], ["b", "task-b"], ["c", "task-c"]], 5)
+    
+    assert [call.args[0] for call in mock_run_scrape.call_args_list] == ["b", "c"]
+    final = [call.args[:3] for call in backend.store_result.call_args_list if call.args[2] == "SUCCESS"]
+    assert [(task_id, result["status"]) for task_id, result, _ in final] == [("task-b", "FAILURE"), ("task-c", "SUCCESS")]
+
+def test_compact_result():
+    """Test that scrape results keep only post IDs, count and cursor"""
+    saved_posts = [
+        {"id": 7, "timestamp": "2024-01-02T00:00:00", "text": "x" * 1000},
+        {"id": 3, "timestamp": "2024-01-01T00:00:00", "text": "y" * 1000}
+    ]
+    
+    result = tasks.make_result(saved_posts, "nasa")
+    
+    assert result["post_ids"] == [7, 3]
+    assert result["count"] == 2
+    assert result["cursor"] == tasks.encode_cursor(datetime(2024, 1, 1), 3)
+    assert tasks.count_result_posts(result) == 2
+
+@patch('tasks.SCRAPE_RESULT_COMPRESS_MIN_SIZE', 100)
+@patch('tasks.SCRAPE_RESULT_MODE', 'full')
+def test_full_result_is_compressed():
+    """Test that large full results are stored compressed"""
+    saved_posts = [{"id": i, "timestamp": "2024-01-01T00:00:00", "text": "caption " * 50} for i in range(20)]
+    
+    result = tasks.make_result(saved_posts, "nasa")
+    
+    assert result["compression"] == "zlib"
+    assert len(json.dumps(result)) < len(json.dumps(saved_posts)) / 5
+    assert tasks.decompress_result(result) == saved_posts
+    assert tasks.count_result_posts(result) == 20
+
+def test_scrapes_are_routed_to_separate_queues():
+    """Test that user-triggered and periodic scrapes go to their own queues"""
+    from celery_app import celery_app
+    
+    def route(name, options=None):
+        return celery_app.amqp.router.route(dict(options or {}), name, (), {})
+    
+    assert route("tasks.scrape_instagram")["queue"].name == "interactive"
+    assert route("tasks.scrape_instagram_periodic")["queue"].name == "periodic"
+    assert route("tasks.scrape_batch_lane")["queue"].name == "interactive"
+    assert route("tasks.scrape_instagram")["priority"] < route("tasks.scrape_batch_lane")["priority"]
+
+@patch('tasks.SessionLocal')
+@patch('tasks.save_posts', side_effect=lambda db, page, username: page)
+@patch('tasks.InstagramScraper')
+def test_scrape_reports_progress_per_page(mock_scraper, mock_save_posts, mock_session_local):
+    """Test that the scrape task publishes progress after each saved page"""
+    scraper = mock_scraper.return_value
+    scraper.current_method = "graphql"
+    scraper.iter_pages.return_value = iter([[{"id": 1, "timestamp": "2024-01-01T00:00:00"}],
+                                            [{"id": 2, "timestamp": "2024-01-01T00:00:00"}]])
+    task = MagicMock()
+    
+    with patch('tasks.scrape_lock', ScrapeLock(redis_getter=lambda: None)):
+        result = tasks.run_scrape("nasa", 2, False, "task-1", task)
+    
+    assert result["status"] == "SUCCESS"
+    progress = [call.kwargs["meta"] for call in task.update_state.call_args_list]
+    assert [(meta["page"], meta["posts_fetched"], meta["current_method"]) for meta in progress] == [(1, 1, "graphql"), (2, 2, "graphql")]
+
+@patch('tasks.update_watermark')
+@patch('tasks.get_watermark', return_value={"shortcode": "STORED", "timestamp": 1623450000})
+@patch('tasks.SessionLocal')
+@patch('tasks.save_posts', side_effect=lambda db, page, username: page)
+@patch('tasks.InstagramScraper')
+def test_incremental_scrape_keeps_watermark_when_capped(mock_scraper, mock_save_posts, mock_session_local,
+                                                        mock_get_watermark, mock_update_watermark):
+    """Test that the high-water mark isn't moved past posts cut off by num_posts or the page cap"""
+    scraper = mock_scraper.return_value
+    scraper.iter_pages.return_value = iter([[{"id": 1, "timestamp": "2024-01-01T00:00:00"}]])
+    scraper.reached_watermark = False
+    scraper.reached_end = False
+    
+    with patch('tasks.scrape_lock', ScrapeLock(redis_getter=lambda: None)):
+        assert tasks.run_scrape("nasa", 1, True, "task-1")["status"] == "SUCCESS"
+    mock_update_watermark.assert_not_called()
+    
+    # Stored post reached: every newer post was fetched
+    scraper.iter_pages.return_value = iter([[{"id": 1, "timestamp": "2024-01-01T00:00:00"}]])
+    scraper.reached_watermark = True
+    
+    with patch('tasks.scrape_lock', ScrapeLock(redis_getter=lambda: None)):
+        tasks.run_scrape("nasa", 1, True, "task-2")
+    mock_update_watermark.assert_called_once()
+    
+    # Full scrape cut off by num_posts before the stored post: mark is kept
+    mock_update_watermark.reset_mock()
+    scraper.iter_pages.return_value = iter([[{"id": 1, "shortcode": "NEW", "timestamp": "2024-01-01T00:00:00"}]])
+    scraper.reached_watermark = False
+    
+    with patch('tasks.scrape_lock', ScrapeLock(redis_getter=lambda: None)):
+        assert tasks.run_scrape("nasa", 1, False, "task-3")["status"] == "SUCCESS"
+    assert scraper.iter_pages.call_args.kwargs["since"] is None
+    mock_update_watermark.assert_not_called()
+    
+    # Full scrape that went back to the stored post
+    scraper.iter_pages.return_value = iter([[{"id": 1, "shortcode": "NEW", "timestamp": "2024-01-01T00:00:00"},
+                                             {"id": 2, "shortcode": "STORED", "timestamp": "2021-06-11T22:20:00"}]])
+    
+    with patch('tasks.scrape_lock', ScrapeLock(redis_getter=lambda: None)):
+        tasks.run_scrape("nasa", 2, False, "task-4")
+    mock_update_watermark.assert_called_once()
+
+@patch('celery_app.celery_app.AsyncResult')
+def test_unknown_task_has_no_result(mock_async_result):
+    """Test that tasks the result backend doesn't know (state PENDING) aren't reported as running"""
+    mock_async_result.return_value.state = "PENDING"
+    assert tasks.get_task_result("unknown-task") is None
+    
+    mock_async_result.return_value.state = "STARTED"
+    mock_async_result.return_value.ready.return_value = False
+    assert tasks.get_task_result("task-1")["status"] == "PROCESSING"
+    
+    # Result backend not available: callers fall back to task records of the API
+    mock_async_result.side_effect = ConnectionError("Error 111 connecting to redis:6379. Connection refused.")
+    assert tasks.get_task_result("task-1") is None
@@ -0,0 +1,36 @@
+import pytest
+from unittest.mock import MagicMock
+from instagram_scraper import InstagramScraper
+from user_id_cache import UserIdCache
+
+@pytest.fixture
+def cache():
+    """Create an in-memory user ID cache"""
+    return UserIdCache(max_size=2, redis_getter=lambda: None)
+
+def test_cache_evicts_least_recently_used(cache):
+    """Test that the cache keeps only the most recently used entries"""
+    cache.set("first", "1")
+    cache.set("second", "2")
+    cache.get("first")
+    cache.set("third", "3")
+    
+    assert cache.get("first") == "1"
+    assert cache.get("second") is None
+    assert cache.get("third") == "3"
+
+def test_cache_expires_entries():
+    """Test that entries are dropped after TTL"""
+    cache = UserIdCache(ttl=-1, redis_getter=lambda: None)
+    cache.set("nasa", "528817151")
+    
+    assert cache.get("nasa") is None
+
+def test_get_user_id_uses_cache(cache):
+    """Test that a cached user ID is returned without any request"""
+    session = MagicMock()
+    scraper = InstagramScraper(session=session, user_id_cache=cache)
+    cache.set("NASA", "528817151")
+    
+    assert scraper._get_user_id("nasa") == "528817151"
+    session.get.assert_not_called()
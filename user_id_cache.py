@@ -0,0 +1,130 @@
+from collections import OrderedDict
+import logging
+import os
+import threading
+import time
+
+from redis_client import get_redis
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Cache settings (user IDs basically never change, so entries live long)
+USER_ID_CACHE_SIZE = int(os.getenv("USER_ID_CACHE_SIZE", "10000"))
+USER_ID_CACHE_TTL = int(os.getenv("USER_ID_CACHE_TTL", str(30 * 24 * 3600)))  # 30 days
+
+class UserIdCache:
+    """Cache for username -> Instagram user ID resolution"""
+    
+    def __init__(self, max_size=USER_ID_CACHE_SIZE, ttl=USER_ID_CACHE_TTL, redis_getter=get_redis):
+        """
+        Initialize cache
+        
+        Args:
+            max_size (int): Maximum number of entries kept in memory (LRU)
+            ttl (int): Lifetime of an entry in seconds
+            redis_getter (callable): Returns Redis client used as persistent
+                storage shared by all processes, or None
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.redis_getter = redis_getter
+        
+        # username -> (user_id, expires_at), least recently used first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, username):
+        """
+        Get cached user ID
+        
+        Args:
+            username (str): Instagram username
+        
+        Returns:
+            str: User ID or None if not cached
+        """
+        username = username.lower()
+        
+        # In-memory LRU
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry:
+                if entry[1] > time.time():
+                    self._entries.move_to_end(username)
+                    return entry[0]
+                del self._entries[username]
+        
+        # Persistent storage
+        client = self.redis_getter()
+        if client is None:
+            return None
+        
+        try:
+            user_id = client.get(self._key(username))
+        except Exception as e:
+            logger.warning(f"Error reading user ID from Redis: {str(e)}")
+            return None
+        
+        if user_id:
+            self._set_local(username, user_id)
+        
+        return user_id
+    
+    def set(self, username, user_id):
+        """
+        Save user ID to cache
+        
+        Args:
+            username (str): Instagram username
+            user_id (str): Instagram user ID
+        """
+        if not username or not user_id:
+            return
+        
+        username = username.lower()
+        user_id = str(user_id)
+        
+        self._set_local(username, user_id)
+        
+        client = self.redis_getter()
+        if client is None:
+            return
+        
+        try:
+            client.set(self._key(username), user_id, ex=self.ttl)
+        except Exception as e:
+            logger.warning(f"Error saving user ID to Redis: {str(e)}")
+    
+    def delete(self, username):
+        """Remove user ID from cache (e.g. when Instagram doesn't know it anymore)"""
+        username = username.lower()
+        
+        with self._lock:
+            self._entries.pop(username, None)
+        
+        client = self.redis_getter()
+        if client is None:
+            return
+        
+        try:
+            client.delete(self._key(username))
+        except Exception as e:
+            logger.warning(f"Error deleting user ID from Redis: {str(e)}")
+    
+    def _set_local(self, username, user_id):
+        """Save entry to in-memory LRU"""
+        with self._lock:
+            self._entries[username] = (user_id, time.time() + self.ttl)
+            self._entries.move_to_end(username)
+            
+            # Drop least recently used entries
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def _key(self, username):
+        """Redis key for username"""
+        return f"instagram:user_id:{username}"
+
+# Cache shared by all scrapers in the process
+user_id_cache = UserIdCache()